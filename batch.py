@@ -0,0 +1,90 @@
+import os
+import time
+from multiprocessing import Pool
+
+from tm import ByteTape, RunResult, NON_HALTING, ERROR, NonHaltingException
+
+
+# the CompiledTM each worker process runs jobs on (set once per worker by init_worker)
+worker_compiled = None
+
+def init_worker(compiled):
+    global worker_compiled
+    worker_compiled = compiled
+
+def run_job(job):
+    """
+    Run the worker's machine on one tape.
+    job: (index, tape, head_idx, state, max_steps, timeout, detect_loops)
+    Returns (index, RunResult, final tape contents as a string)
+    """
+    index, contents, head_idx, state, max_steps, timeout, detect_loops = job
+    compiled = worker_compiled
+    tape = ByteTape(list(contents), head_idx, compiled.empty_symbol)
+    begin = time.perf_counter()
+    error = loop = None
+    try:
+        if detect_loops:
+            state, steps, reason = compiled.run_detecting_loops(tape, state, max_steps, timeout)
+        else:
+            state, steps = compiled.run(tape, state, max_steps=max_steps, timeout=timeout)
+            reason = compiled.stop_reason(tape, state)
+    except NonHaltingException as e:
+        reason, state, steps, error, loop = NON_HALTING, e.loop.state, e.loop.steps, str(e), e.loop
+    except Exception as e:
+        reason, steps, error = ERROR, 0, str(e)
+    result = RunResult(reason, steps, time.perf_counter() - begin, state, tape.head_idx, error, loop)
+    return index, result, tape.text()
+
+
+def run_batch(tm, tapes, head_idx=0, max_steps=None, timeout=None, detect_loops=False, ordered=True, processes=None, chunksize=1):
+    """
+    Run one machine on many tapes in a pool of worker processes.
+    The machine is compiled once, and the CompiledTM is sent to each worker when it starts, so workers never load the machine themselves.
+    tm: the TM to run (each run starts in tm.state)
+    tapes: iterable of initial tapes (strings or lists of symbols)
+    head_idx: index of the head in each initial tape
+    max_steps, timeout: budget of each run (see TM.run)
+    detect_loops: if True, runs stop as soon as they are proven to never halt (see engine.CompiledTM.run_detecting_loops)
+    ordered: if True, results are yielded in the order of tapes; otherwise in the order the runs finish
+    processes: number of worker processes (all cores by default)
+    chunksize: number of tapes sent to a worker at a time (larger is faster for many short runs)
+    Yields (index of the tape in tapes, RunResult, final tape contents as a string)
+    """
+    compiled = tm.compile()
+    jobs = ((index, tape, head_idx, tm.state, max_steps, timeout, detect_loops) for index, tape in enumerate(tapes))
+    with Pool(processes or os.cpu_count(), initializer=init_worker, initargs=(compiled,)) as pool:
+        results = pool.imap(run_job, jobs, chunksize) if ordered else pool.imap_unordered(run_job, jobs, chunksize)
+        for result in results:
+            yield result
+
+
+if __name__ == "__main__":
+    """
+    Run a saved TM (from XML file) on each tape of a file, printing one line per tape
+    Usage: python batch.py <machine xml filepath> <tapes filepath (one tape per line, - for stdin)> [options]
+    """
+    import argparse
+    import sys
+    from parser import load_from_xml
+
+    arg_parser = argparse.ArgumentParser(description="Run a saved TM on many tapes in parallel")
+    arg_parser.add_argument("machine", help="machine xml filepath")
+    arg_parser.add_argument("tapes", help="file with one initial tape per line (- for stdin)")
+    arg_parser.add_argument("--max-steps", type=int, default=None, help="maximum transitions per tape")
+    arg_parser.add_argument("--timeout", type=float, default=None, help="maximum seconds per tape")
+    arg_parser.add_argument("--detect-loops", action="store_true", help="stop runs that are proven to never halt")
+    arg_parser.add_argument("--unordered", action="store_true", help="print results as they finish instead of in input order")
+    arg_parser.add_argument("--processes", type=int, default=None, help="number of worker processes (all cores by default)")
+    arg_parser.add_argument("--chunksize", type=int, default=1, help="tapes sent to a worker at a time")
+    args = arg_parser.parse_args()
+
+    tm = load_from_xml(args.machine)
+    tapes_file = sys.stdin if args.tapes == '-' else open(args.tapes)
+    with tapes_file:
+        tapes = [line.strip() for line in tapes_file if line.strip()]
+
+    results = run_batch(tm, tapes, max_steps=args.max_steps, timeout=args.timeout, detect_loops=args.detect_loops,
+                        ordered=not args.unordered, processes=args.processes, chunksize=args.chunksize)
+    for index, result, tape in results:
+        print(f"{index}\t{result.reason}\t{result.steps}\t{result.head_idx}\t{tape}")
@@ -0,0 +1,135 @@
+import hashlib
+import importlib.util
+import os
+import pickle
+from functools import lru_cache
+
+
+# bump when the format of the entries changes; changes to the code the cached objects are built by are covered by sources_hash
+CACHE_VERSION = 2
+# directory the source files of sources_hash are relative to
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# directory of the cache, shared with the generated modules of codegen (None disables caching).
+# it is next to the sources unless the environment variable TM_CACHE_DIR is set, e.g. when they are installed read-only;
+# an empty TM_CACHE_DIR disables caching
+CACHE_DIR = os.environ.get('TM_CACHE_DIR', os.path.join(SOURCE_DIR, '__tmcache__')) or None
+# once the entries take more than this many bytes, the least recently used ones are evicted
+CACHE_MAX_BYTES = 256 * 2 ** 20
+CACHE_SUFFIX = '.pickle'
+# name prefix of the modules codegen generates into the cache, which are entries as well
+MODULE_PREFIX = 'tm_'
+
+
+def content_hash(*parts):
+    """
+    Key of a cache entry: hash of everything the cached value depends on.
+    parts: strings, bytes, or other values with a stable repr (e.g. options)
+    """
+    h = hashlib.sha256(f"cache {CACHE_VERSION}\n".encode())
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = repr(part).encode('utf-8')
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()[:32]
+
+
+def file_contents(*filepaths):
+    # contents of each file, to hash into a key
+    contents = []
+    for filepath in filepaths:
+        with open(filepath, 'rb') as f:
+            contents.append(f.read())
+    return contents
+
+
+@lru_cache(maxsize=None)
+def sources_hash(*sources):
+    """
+    Hash of the source files that build a cached value (paths relative to SOURCE_DIR), to put into its key,
+    so that entries built by older code are not reused.
+    The files are only read once per process, since changes to them don't take effect before the modules are imported again.
+    """
+    return content_hash(*file_contents(*(os.path.join(SOURCE_DIR, source) for source in sources)))
+
+
+def cached(key, build):
+    """
+    The value stored in the cache under key, or build() if there is none (which is then stored under key).
+    Every hit loads a new copy of the value, so callers can change what they get.
+    An entry that can't be read is rebuilt, and a cache that can't be written to is skipped.
+    key: hash of everything the value depends on (see content_hash)
+    build: function returning the (picklable) value
+    """
+    if CACHE_DIR is None:
+        return build()
+    filepath = os.path.join(CACHE_DIR, key + CACHE_SUFFIX)
+    try:
+        with open(filepath, 'rb') as f:
+            value = pickle.load(f)
+        os.utime(filepath)  # the modification time of an entry is its last use, for evict
+        return value
+    except OSError:
+        # no entry (or one that can't be read)
+        pass
+    except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # a corrupted entry, or one of classes that were moved since it was stored
+        pass
+
+    value = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write to a temporary file first, so that other processes never load a partly written entry
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_filepath, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+        evict()
+    except OSError:
+        pass
+    return value
+
+
+def is_entry(name):
+    # whether a file in the cache directory is an entry: a pickled value, or a module generated by codegen
+    return name.endswith(CACHE_SUFFIX) or (name.startswith(MODULE_PREFIX) and name.endswith('.py'))
+
+
+def evict(max_bytes=None, cache_dir=None):
+    """
+    Delete the least recently used entries until the entries take at most max_bytes (CACHE_MAX_BYTES by default).
+    Generated modules count with their bytecode, which is deleted along with them.
+    cache_dir: directory of the entries (CACHE_DIR by default)
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if is_entry(entry.name):
+            paths = [entry.path]
+            if entry.name.endswith('.py'):
+                paths.append(importlib.util.cache_from_source(entry.path))
+            size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            entries.append((entry.stat().st_mtime, size, paths))
+    total = sum(size for mtime, size, paths in entries)
+    for mtime, size, paths in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def clear():
+    # delete every entry of the cache (and the bytecode directory of the generated modules, once it is empty)
+    if CACHE_DIR is not None and os.path.isdir(CACHE_DIR):
+        evict(0)
+        try:
+            os.rmdir(os.path.join(CACHE_DIR, '__pycache__'))
+        except OSError:
+            pass
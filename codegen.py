@@ -0,0 +1,234 @@
+import hashlib
+import importlib.util
+import os
+import types
+
+import cache
+from engine import CompiledTM
+
+
+# bump when the generated code changes, so that cached modules of older versions are not reused
+CODEGEN_VERSION = 1
+# how many states deep a chain of states is inlined into the state that leads to it
+INLINE_DEPTH = 8
+# number of states in each generated function (transitions mostly go to nearby states, so small functions are entered rarely)
+PART_SIZE = 256
+
+
+def machine_hash(compiled):
+    # hash of everything the generated code depends on
+    h = hashlib.sha256(f"codegen {CODEGEN_VERSION}\n".encode())
+    h.update(repr((compiled.states, compiled.symbols, compiled.next_state, compiled.write, compiled.move)).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def generate_source(compiled):
+    """
+    Python source of a module with a run function specialized to the machine.
+    The function runs on a bytearray of symbol ids with the head, tape extent, and state in local variables.
+    The states are split into functions of PART_SIZE states, each looping for as long as the state is one of its own.
+    The state is dispatched with a binary tree of if statements on its id, and each state is a block of straight-line code
+    dispatching on the symbol with if/elif, with its moves and writes inlined as constants:
+        a state with transitions back to itself loops within its block, so a scan does not go back through the dispatch tree
+        a state without such transitions that only one transition leads to is also inlined where that transition is taken
+            (up to INLINE_DEPTH deep), so chains of states run without dispatching
+    """
+    n = compiled.num_symbols
+    num_states = len(compiled.states)
+
+    def row(state_id):
+        # [(symbol id, next state id, symbol id to write, move)] of the transitions of a state
+        base = state_id * n
+        return [(a, compiled.next_state[base + a], compiled.write[base + a], compiled.move[base + a]) for a in range(n) if compiled.next_state[base + a] >= 0]
+
+    rows = [row(state_id) for state_id in range(num_states)]
+    incoming = [0] * num_states
+    for state_row in rows:
+        for symbol_id, state_to, write, move in state_row:
+            incoming[state_to] += 1
+    loops = [any(state_to == state_id for symbol_id, state_to, write, move in rows[state_id]) for state_id in range(num_states)]
+
+    def move_lines(move, pad):
+        if move == 1:
+            return [
+                f"{pad}head += 1",
+                f"{pad}if head > hi:",
+                f"{pad}    hi = head",
+                f"{pad}    hi_step = steps",
+                f"{pad}    if head == size:",
+                f"{pad}        buf.extend(bytearray(size))",
+                f"{pad}        size *= 2",
+            ]
+        if move == -1:
+            return [
+                f"{pad}head -= 1",
+                f"{pad}if head < lo:",
+                f"{pad}    lo = head",
+                f"{pad}    if head < 0:",
+                f"{pad}        buf[0:0] = bytearray(size)",
+                f"{pad}        head += size",
+                f"{pad}        lo += size",
+                f"{pad}        end += size",
+                f"{pad}        hi += size",
+                f"{pad}        size *= 2",
+            ]
+        return []
+
+    def goto_lines(state_id, pad, depth):
+        # go to a state after taking a transition: inline its block, or set s for the dispatch tree
+        if depth >= INLINE_DEPTH or loops[state_id] or incoming[state_id] != 1:
+            return [f"{pad}s = {state_id}"]
+        return [
+            f"{pad}if steps >= checkpoint:",
+            f"{pad}    s = {state_id}",
+            f"{pad}else:",
+        ] + block_lines(state_id, pad + '    ', depth + 1)
+
+    def block_lines(state_id, pad, depth):
+        # code of a state without transitions back to itself
+        out = [f"{pad}# state {compiled.states[state_id]!r}"]
+        if not rows[state_id]:
+            return out + [f"{pad}s = {state_id}", f"{pad}halted = True"]
+        out.append(f"{pad}c = buf[head]")
+        for k, (symbol_id, state_to, write, move) in enumerate(rows[state_id]):
+            out.append(f"{pad}{'if' if k == 0 else 'elif'} c == {symbol_id}:")
+            if write != symbol_id:
+                out.append(f"{pad}    buf[head] = {write}")
+            out += move_lines(move, pad + '    ')
+            out.append(f"{pad}    steps += 1")
+            out += goto_lines(state_to, pad + '    ', depth)
+        out.append(f"{pad}else:")
+        out.append(f"{pad}    s = {state_id}")
+        out.append(f"{pad}    halted = True")
+        return out
+
+    def loop_lines(state_id, pad):
+        # code of a state with transitions back to itself, which it takes without leaving its block
+        out = [f"{pad}# state {compiled.states[state_id]!r}", f"{pad}while True:", f"{pad}    c = buf[head]"]
+        for k, (symbol_id, state_to, write, move) in enumerate(rows[state_id]):
+            out.append(f"{pad}    {'if' if k == 0 else 'elif'} c == {symbol_id}:")
+            if write != symbol_id:
+                out.append(f"{pad}        buf[head] = {write}")
+            out += move_lines(move, pad + '        ')
+            out.append(f"{pad}        steps += 1")
+            if state_to == state_id:
+                out.append(f"{pad}        if steps >= checkpoint:")
+                out.append(f"{pad}            break")
+            else:
+                out += goto_lines(state_to, pad + '        ', 0)
+                out.append(f"{pad}        break")
+        out.append(f"{pad}    else:")
+        out.append(f"{pad}        halted = True")
+        out.append(f"{pad}        break")
+        return out
+
+    def dispatch_lines(first, last, pad):
+        # states first to last (inclusive)
+        if first == last:
+            return loop_lines(first, pad) if loops[first] else block_lines(first, pad, 0)
+        mid = (first + last + 1) // 2
+        return [f"{pad}if s < {mid}:"] + dispatch_lines(first, mid - 1, pad + '    ') + [f"{pad}else:"] + dispatch_lines(mid, last, pad + '    ')
+
+    lines = []
+    parts = range(0, num_states, PART_SIZE)
+    for first in parts:
+        last = min(first + PART_SIZE, num_states) - 1
+        lines += [
+            f"def part_{first // PART_SIZE}(buf, head, lo, end, hi, hi_step, steps, size, s, checkpoint):",
+            "    halted = False",
+            f"    while not halted and {first} <= s <= {last} and steps < checkpoint:",
+        ]
+        lines += dispatch_lines(first, last, ' ' * 8)
+        lines.append("    return head, lo, end, hi, hi_step, steps, size, s, halted")
+        lines.append("")
+
+    lines += [
+        f"PARTS = [{', '.join(f'part_{first // PART_SIZE}' for first in parts)}]",
+        "",
+        "def run(buf, head, lo, end, s, checkpoint, check_budget):",
+        "    size = len(buf)",
+        "    hi = head",
+        "    hi_step = -1",
+        "    steps = 0",
+        "    while True:",
+        "        if steps >= checkpoint:",
+        "            checkpoint = check_budget(steps)",
+        "            if checkpoint is None:",
+        "                break",
+        f"        head, lo, end, hi, hi_step, steps, size, s, halted = PARTS[s // {PART_SIZE}](buf, head, lo, end, hi, hi_step, steps, size, s, checkpoint)",
+        "        if halted:",
+        "            break",
+        "    return head, lo, end, hi, hi_step, s, steps",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class GeneratedTM:
+    """
+    A machine compiled to a specialized Python function (see compile_to_python).
+    It runs with the same contract as CompiledTM.run, so it can be passed to TM.run_compiled.
+    """
+    def __init__(self, compiled, module):
+        self.compiled = compiled
+        self.module = module
+
+    def run(self, tape, state, max_steps=None, timeout=None):
+        """
+        Run the machine on a ByteTape until it halts or a budget runs out, updating the tape in place.
+        Returns (name of the final state, transitions taken)
+        """
+        compiled = self.compiled
+        limit, deadline, checkpoint = compiled.budget(max_steps, timeout)
+        buf, to_codes = compiled.encode_tape(tape)
+        head, lo, end, hi, hi_step, s, steps = self.module.run(
+            buf, tape.head, tape.start, tape.end, compiled.state_ids[state], checkpoint,
+            lambda steps: compiled.check_budget(steps, limit, deadline))
+        compiled.store_tape(tape, buf, to_codes, lo, end, hi, hi_step, steps, head)
+        return compiled.states[s], steps
+
+    def stop_reason(self, tape, state):
+        return self.compiled.stop_reason(tape, state)
+
+
+def compile_to_python(tm, cache_dir=None):
+    """
+    Generate a Python module specialized to the machine, and load it.
+    The module is cached in cache_dir, keyed by a hash of the machine, so each machine is only generated once
+    (and Python caches its bytecode as for any other module). If cache_dir can't be written to, the module is only loaded.
+    tm: the TM (or its CompiledTM) to compile
+    cache_dir: directory for the generated modules (cache.CACHE_DIR by default, which is None if caching is disabled)
+    Returns a GeneratedTM
+    """
+    compiled = tm if isinstance(tm, CompiledTM) else tm.compile()
+    name = f"{cache.MODULE_PREFIX}{machine_hash(compiled)}"
+    cache_dir = cache.CACHE_DIR if cache_dir is None else cache_dir
+    filepath = None if cache_dir is None else os.path.join(cache_dir, name + '.py')
+    source = None
+    if filepath is not None and os.path.exists(filepath):
+        try:
+            # the modification time of a module is its last use, for cache.evict
+            os.utime(filepath)
+        except OSError:
+            pass
+    elif filepath is not None:
+        source = generate_source(compiled)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first, so that other processes never load a partly written module
+            tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_filepath, 'w') as f:
+                f.write(source)
+            os.replace(tmp_filepath, filepath)
+            cache.evict(cache_dir=cache_dir)
+        except OSError:
+            # e.g. a read-only install; set TM_CACHE_DIR to cache the modules elsewhere
+            filepath = None
+    if filepath is None:
+        module = types.ModuleType(name)
+        exec(compile(source or generate_source(compiled), name, 'exec'), module.__dict__)
+        return GeneratedTM(compiled, module)
+
+    spec = importlib.util.spec_from_file_location(name, filepath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return GeneratedTM(compiled, module)
@@ -1,21 +1,30 @@
+import re
+
 from tm import TM, Transition, RIGHT, LEFT
 from subroutine import SuperTransition
+from frozen import share_row
 from utils import get_state_id_map
 
 # TODO: could use a better suffix convention (or check) to ensure compiled state names are unique
 # right now, the compilation passes due generate unique state names, but this could be broken with the introduction of additional compilation passes
+# suffix that the passes below add to the name of the state a new state is derived from
+# (four_to_two_symbols and n_to_2_symbols read, write, and move states, n_to_2_symbols halt states, and quintuple_to_quadruple write states)
+DERIVED_STATE_SUFFIX = re.compile(r'(?:_r[01]+(?:w\d+(?:_L)?)?|_m[LR]\d+|_halt|_w)$')
+# code of each symbol of four_to_two_symbols (and of TwoToFourSymbolExpansion and FourToTwoSymbolDecode)
+FOUR_SYMBOL_CODE = {
+    '0': '01',
+    '1': '11',
+    '#': '00',
+    '@': '10'
+}
+
 def four_to_two_symbols(tm):
     """
     Hardcoded version of n_to_2_symbols for a Turing Machine that uses 4 symbols ('0', '1', '#', '@').
     This allows for certain optimizations.
     Convert a Turing Machine that uses 4 symbols ('0', '1', '#', '@') to one that uses only '0' and '1'.
     """
-    symbol_map = {
-        '0': '01',
-        '1': '11',
-        '#': '00',
-        '@': '10'
-    }
+    symbol_map = FOUR_SYMBOL_CODE
     new_transitions = {}
     for state_from, transitions in tm.transitions.items():
 
@@ -74,7 +83,7 @@ def four_to_two_symbols(tm):
                 new_transitions[state_from + '_r' + symbol_en + 'w0'] = {
                     symbol_en[1]: Transition(transition.state_to, write_en[1], 'L'),
                 }
-    return TM(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
 
 def quintuple_to_quadruple(tm):
     """
@@ -95,12 +104,13 @@ def quintuple_to_quadruple(tm):
                 continue
 
             # otherwise, we need to create two transitions
-            if state_from + '_w' not in new_transitions:
-                new_transitions[state_from + '_w'] = {}
+            if not isinstance(new_transitions.get(state_from + '_w'), dict):
+                new_transitions[state_from + '_w'] = dict(new_transitions.get(state_from + '_w', {}))
             new_transitions[state_from][symbol] = Transition(state_from + '_w', transition.symbol_to_write, None)
             new_transitions[state_from + '_w'][transition.symbol_to_write] = Transition(transition.state_to, None, transition.direction)
+        new_transitions[state_from] = share_row(transitions, new_transitions[state_from])
 
-    return TM(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
               
 
 def standardize_simulation_target(tm):
@@ -132,7 +142,8 @@ def standardize_simulation_target(tm):
             if transition is None:
                 transition = Transition('0', symbol, None)
             else:
-                transition.state_to = state_id_map[transition.state_to]
+                # a new transition, since the transitions of the passes above may be shared with the original TM (or frozen)
+                transition = Transition(state_id_map[transition.state_to], transition.symbol_to_write, transition.direction)
 
             new_transitions[state_id][symbol] = transition
 
@@ -144,29 +155,64 @@ def compose_transitions(t1, t2):
     Merges two transition dictionaries into one, updating the first with the second, but not removing any nested keys of the first.
     """
     for state_from, transitions in t2.items():
-        if state_from not in t1:
-            t1[state_from] = {}
+        if not isinstance(t1.get(state_from), dict):
+            # a new state, or a row shared with a frozen TM (see frozen.share_row), which is copied before it is changed
+            t1[state_from] = dict(t1.get(state_from, {}))
         for symbol, transition in transitions.items():
             t1[state_from][symbol] = transition
     return t1
 
-def compile_super_transitions(tm):
+def link_key(transition):
+    # SuperTransitions with equal keys assemble to the same states up to their prefix (None if that is not known for this one)
+    try:
+        return (type(transition), transition.template_parameters(), transition.state_to)
+    except NotImplementedError:
+        return None
+
+def compile_super_transitions(tm, link=True, verbose=False):
     """
     Convert a Turing Machine that uses super transitions to one that uses normal transitions.
+    link: if True, SuperTransitions with the same subroutine and return state (e.g. the same MoveUntil taken on several symbols)
+        share the states of the first of them, instead of each assembling a copy with its own prefix
+    verbose: if True, print how many states and transitions linking saved
     """
     new_transitions = {}
+    # {link key: (first state of the copy that SuperTransitions with that key share, its number of states, its number of transitions)}
+    linked = {}
+    saved_states = saved_transitions = 0
     for state_from, transitions in tm.transitions.items():
         new_transitions[state_from] = {}
         for symbol, transition in transitions.items():
             if isinstance(transition, SuperTransition):
                 # if the transition is a super transition, we need to assemble it
+                key = link_key(transition) if link else None
+                if key in linked:
+                    # equal keys assemble to the same number of states and transitions, so the copy isn't assembled
+                    first_state, num_states, num_transitions = linked[key]
+                    saved_states += num_states
+                    saved_transitions += num_transitions
+                    new_transitions[state_from][symbol] = Transition(first_state, None, None)
+                    continue
                 sub_transitions, first_state = transition.assemble()
                 new_transitions = compose_transitions(new_transitions, sub_transitions)
                 new_transitions[state_from][symbol] = Transition(first_state, None, None)
+                if key is not None:
+                    linked[key] = (first_state,
+                                   sum(1 for state in sub_transitions if state != transition.state_to),
+                                   sum(len(row) for row in sub_transitions.values()))
             else:
                 new_transitions[state_from][symbol] = transition
+        new_transitions[state_from] = share_row(transitions, new_transitions[state_from])
 
-    return TM(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+    if verbose:
+        print(f"Linked SuperTransitions saved {saved_states} states and {saved_transitions} transitions")
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+
+def is_null_transition(symbol, transition):
+    # whether taking the transition on symbol only changes the state (it does not move, and writes nothing or the symbol already there)
+    if isinstance(transition, SuperTransition):
+        return False
+    return transition.direction is None and (transition.symbol_to_write is None or transition.symbol_to_write == symbol)
 
 def remove_null_transitions(tm):
     """
@@ -176,62 +222,408 @@ def remove_null_transitions(tm):
     for state_from, transitions in tm.transitions.items():
         new_transitions[state_from] = {}
         for symbol, transition in transitions.items():
-            if transition.symbol_to_write is None and transition.direction is None:  # TODO: can improve by using (transition.symbol_to_write is None or transition.symbol_to_write == symbol)
+            if is_null_transition(symbol, transition):
                 # if the transition does not write or move, we can skip it
                 #print(f"Removing null transition: {state_from} -> {symbol} -> {transition.state_to}")
-                next_transition = tm.transitions[transition.state_to].get(symbol)
-                while next_transition is not None and next_transition.symbol_to_write is None and next_transition.direction is None:
-                    next_transition = tm.transitions[next_transition.state_to].get(symbol)
+                next_transition = tm.transitions.get(transition.state_to, {}).get(symbol)
+                while next_transition is not None and is_null_transition(symbol, next_transition):
+                    next_transition = tm.transitions.get(next_transition.state_to, {}).get(symbol)
                 if next_transition is None:
                     # remove this transition entirely if it leads to halt without doing anything
                     continue
                 new_transitions[state_from][symbol] = next_transition
             else:
                 new_transitions[state_from][symbol] = transition
+        new_transitions[state_from] = share_row(transitions, new_transitions[state_from])
 
-    return TM(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
 
 
-def n_to_2_symbols(tm):
+def fused_transition(transitions, symbol, transition):
     """
-    Convert a Turing Machine that uses n symbols to one that uses only '0' and '1'.
-    Note that this works by by expressing each symbol as a unique fixed-length binary string,
-    so input tape symbols may need to be converted to the multiple-bit representation as well.
+    Single transition with the same effect as taking transition on symbol, followed by the transitions forced after it:
+    while the head does not move, the next symbol read is the one just written, so the next transition is known.
+    The chain stops at a move, a halt, a SuperTransition, or a transition already in the chain (a loop that never moves).
     """
-    raise NotImplementedError
-    # get the symbols used
-    symbols = set()
-    for state, transitions in tm.transitions.items():
-        for symbol in transitions.keys():
-            symbols.add(symbol)
+    fused = transition
+    written = transition.symbol_to_write or symbol
+    chain = set()
+    while fused.direction is None:
+        next_transition = transitions.get(fused.state_to, {}).get(written)
+        if next_transition is None or isinstance(next_transition, SuperTransition) or (fused.state_to, written) in chain:
+            break
+        chain.add((fused.state_to, written))
+        fused = next_transition
+        written = fused.symbol_to_write or written
 
-    # TODO: consider using a variable-length encoding scheme to handle skewed symbol distributions more efficiently
-    symbol_map = {}
-    # create a mapping of symbols to binary strings
-    fixed_length = len(bin(len(symbols)-1)[2:])  # length of binary string needed
-    for i, symbol in enumerate(symbols):
-        binary_str = bin(i)[2:].zfill(fixed_length)
-        symbol_map[symbol] = binary_str
+    # writing the symbol that was read is the same as not writing
+    symbol_to_write = None if written == symbol else written
+    if fused is transition and symbol_to_write == transition.symbol_to_write:
+        return transition
+    return Transition(fused.state_to, symbol_to_write, fused.direction)
 
+def fuse_transitions(tm):
+    """
+    Peephole pass for machines run by the simulator (rather than encoded for the UTM), the reverse of quintuple_to_quadruple:
+    each transition that does not move is fused with the transitions forced after it (see fused_transition),
+    so write-only and null transitions followed by a move become one quintuple transition,
+    and writes of the symbol already under the head are dropped.
+    The machine halts in the same state with the same tape and head, in fewer steps.
+    States that were only reached through the fused chains are kept; remove_unreachable_states drops them.
+    SuperTransitions are kept as they are.
+    """
     new_transitions = {}
-
-    # convert each transition into a sequence of transitions
     for state_from, transitions in tm.transitions.items():
         new_transitions[state_from] = {}
-        # read the full symbol that we are looking at by reading fixed_length bits starting with the current one
-        for i in range(fixed_length):
-            # create a new state for each bit in the binary string
-            state_to = f"{state_from}_{i}"
+        for symbol, transition in transitions.items():
+            if not isinstance(transition, SuperTransition):
+                transition = fused_transition(tm.transitions, symbol, transition)
+            new_transitions[state_from][symbol] = transition
+        new_transitions[state_from] = share_row(transitions, new_transitions[state_from])
+
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+
+def remove_unreachable_states(tm):
+    """
+    Removes the states that can't be reached from the start state.
+    """
+    reachable = {tm.state}
+    stack = [tm.state]
+    while stack:
+        for transition in tm.transitions.get(stack.pop(), {}).values():
+            if transition.state_to not in reachable:
+                reachable.add(transition.state_to)
+                stack.append(transition.state_to)
+
+    new_transitions = {}
+    for state_from, transitions in tm.transitions.items():
+        if state_from in reachable:
+            new_transitions[state_from] = share_row(transitions, dict(transitions))
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
 
+def minimize_states(tm):
+    """
+    Merges states that behave identically, with Hopcroft's partition refinement (the TM must not have SuperTransitions).
+    Each transition is labeled by what it writes and how it moves, so two states are merged if they have transitions for the same symbols,
+    with the same labels, to states that are merged themselves.
+    Halt states (states without transitions, or that only appear as the target of a transition) are never merged, so the state a machine halts in keeps its name.
+    Each merged state is named after the first of its states (the start state if it is one of them).
+    Runs in O(n k log n) time for n states and k symbols.
+    """
+    names = list(tm.transitions)
+    ids = {name: i for i, name in enumerate(names)}
+    for transitions in tm.transitions.values():
+        for transition in transitions.values():
+            if transition.state_to not in ids:
+                ids[transition.state_to] = len(names)
+                names.append(transition.state_to)
+    symbols = sorted({symbol for transitions in tm.transitions.values() for symbol in transitions})
+
+    # initial blocks: states with the same labels on the same symbols (and each halt state on its own)
+    blocks = []
+    block_of = [0] * len(names)
+    blocks_by_signature = {}
+    predecessors = {symbol: [[] for _ in names] for symbol in symbols}  # {symbol: [[states with a transition on symbol to each state]]}
+    for state_id, name in enumerate(names):
+        transitions = tm.transitions.get(name, {})
+        if transitions:
+            signature = tuple((symbol, transitions[symbol].symbol_to_write or symbol, transitions[symbol].direction) if symbol in transitions else None for symbol in symbols)
+        else:
+            signature = name
+        if signature not in blocks_by_signature:
+            blocks_by_signature[signature] = len(blocks)
+            blocks.append(set())
+        block_of[state_id] = blocks_by_signature[signature]
+        blocks[block_of[state_id]].add(state_id)
         for symbol, transition in transitions.items():
-            symbol_encoded = symbol_map[symbol]
-            # create a sequence of transitions to write the binary string
-            for i, bit in enumerate(binary_str):
-                if i == 0:
-                    new_transitions[state_from][bit] = Transition(transition.state_to, bit, transition.direction)
+            predecessors[symbol][ids[transition.state_to]].append(state_id)
+
+    # refine the blocks until the transitions on each symbol from each block go to a single block
+    pending = [(block, symbol) for block in range(len(blocks)) for symbol in symbols]
+    waiting = set(pending)
+    while pending:
+        splitter = pending.pop()
+        waiting.discard(splitter)
+        block, symbol = splitter
+        touched = {}  # {block: states of it with a transition on symbol into the splitter block}
+        for state_id in blocks[block]:
+            for predecessor in predecessors[symbol][state_id]:
+                touched.setdefault(block_of[predecessor], set()).add(predecessor)
+        for split_block, inside in touched.items():
+            if len(inside) == len(blocks[split_block]):
+                continue
+            # the states with the transitions move to a new block (in time proportional to their number, not to the size of the block)
+            blocks[split_block] -= inside
+            new_block = len(blocks)
+            blocks.append(inside)
+            for state_id in inside:
+                block_of[state_id] = new_block
+            # if the split block was waiting to be a splitter, both halves are, and otherwise the smaller half is enough
+            for split_symbol in symbols:
+                if (split_block, split_symbol) in waiting or len(inside) <= len(blocks[split_block]):
+                    splitter = (new_block, split_symbol)
                 else:
-                    new_transitions[state_from][bit] = Transition(transition.state_to, bit, 'R')
-    
-    # TODO: finish
-    
-    return TM
\ No newline at end of file
+                    splitter = (split_block, split_symbol)
+                pending.append(splitter)
+                waiting.add(splitter)
+
+    # name each block after its first state (or the start state)
+    representative = {}
+    for state_id, name in enumerate(names):
+        representative.setdefault(block_of[state_id], name)
+    if tm.state in ids:
+        representative[block_of[ids[tm.state]]] = tm.state
+
+    new_transitions = {}
+    for state_from, transitions in tm.transitions.items():
+        if representative[block_of[ids[state_from]]] != state_from:
+            continue
+        new_row = {}
+        for symbol, transition in transitions.items():
+            state_to = representative[block_of[ids[transition.state_to]]]
+            new_row[symbol] = transition if state_to == transition.state_to else Transition(state_to, transition.symbol_to_write, transition.direction)
+        new_transitions[state_from] = share_row(transitions, new_row)
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tm.tape, head_idx=tm.head_idx, empty_symbol=tm.empty_symbol)
+
+
+def symbol_alphabet(tm):
+    # every symbol the TM reads or writes, its empty symbol, and the symbols on its tape
+    symbols = {tm.empty_symbol, *tm.tape}
+    for transitions in tm.transitions.values():
+        for symbol, transition in transitions.items():
+            symbols.add(symbol)
+            if transition.symbol_to_write is not None:
+                symbols.add(transition.symbol_to_write)
+    return symbols
+
+def resolved_action(transitions, candidates):
+    """
+    (state_to, direction) of the transition taken on every one of the candidate symbols, if it is known without reading more bits:
+    there is one candidate with a transition, or every candidate has a transition to the same state, in the same direction, that keeps the symbol.
+    Returns None if more bits have to be read (or the only candidate has no transition, so the machine halts).
+    """
+    if any(symbol not in transitions for symbol in candidates):
+        return None
+    actions = {(transitions[symbol].state_to, transitions[symbol].direction) for symbol in candidates}
+    if len(actions) != 1:
+        return None
+    if len(candidates) > 1 and any(transitions[symbol].symbol_to_write not in (None, symbol) for symbol in candidates):
+        return None
+    return actions.pop()
+
+def write_walk(offset, code, new_code, target):
+    """
+    Steps (cell, bit to write or None, direction) that write new_code over code and then move the head to target,
+    starting at offset (cells are offsets from the first bit of the symbol, the current one is 0 to len(code) - 1).
+    code: the bits of the symbol (None for bits that are not known, which are never written)
+    The head first goes to whichever end of the changed bits is cheaper.
+    """
+    width = len(new_code)
+    changed = {cell for cell in range(width) if code[cell] is not None and code[cell] != new_code[cell]}
+    if changed - {offset}:
+        low, high = min(changed | {offset}), max(changed | {offset})
+        paths = [[offset, low, high, target], [offset, high, low, target]]
+    else:
+        paths = [[offset, target]]
+
+    best = None
+    for waypoints in paths:
+        cells = [offset]
+        for waypoint in waypoints[1:]:
+            step = 1 if waypoint > cells[-1] else -1
+            cells.extend(range(cells[-1] + step, waypoint + step, step))
+        current = list(code)
+        steps = []
+        for cell, next_cell in zip(cells, cells[1:]):
+            direction = RIGHT if next_cell > cell else LEFT
+            write = None
+            if 0 <= cell < width and current[cell] != new_code[cell] and current[cell] is not None:
+                write = current[cell] = new_code[cell]
+            steps.append((cell, write, direction))
+        if 0 <= target < width and current[target] is not None and current[target] != new_code[target]:
+            steps.append((target, new_code[target], None))
+        elif not steps:
+            steps.append((target, None, None))
+        if best is None or len(steps) < len(best):
+            best = steps
+    return best
+
+def move_chain(new_transitions, state_to, direction, distance):
+    # state that moves distance cells in direction, whatever it reads, and then enters state_to (shared by every walk that ends this way)
+    if distance == 0:
+        return state_to
+    state = f"{state_to}_m{direction}{distance}"
+    if state not in new_transitions:
+        next_state = move_chain(new_transitions, state_to, direction, distance - 1)
+        new_transitions[state] = {bit: Transition(next_state, None, direction) for bit in ('0', '1')}
+    return state
+
+def encode_transitions(tm, symbol_map):
+    """
+    Binary transition function of a TM for a symbol code (see n_to_2_symbols).
+    Returns (transitions, {(state, symbol): number of binary steps that simulate the transition})
+    """
+    width = len(next(iter(symbol_map.values())))
+    codes = {code: symbol for symbol, code in symbol_map.items()}
+    new_transitions = {}
+    steps = {}
+    for state_from, transitions in tm.transitions.items():
+        new_transitions[state_from] = {}
+        # read the bits of the symbol left to right (state_from reads the first), until the transition is known
+        nodes = [(state_from, '')]
+        while nodes:
+            node, prefix = nodes.pop()
+            offset = len(prefix)
+            for bit in ('0', '1'):
+                candidates = [symbol for code, symbol in codes.items() if code.startswith(prefix + bit)]
+                if not candidates:
+                    continue
+                action = resolved_action(transitions, candidates)
+                if action is None:
+                    if len(candidates) > 1 and any(symbol in transitions for symbol in candidates):
+                        child = f"{state_from}_r{prefix + bit}"
+                        new_transitions[child] = {}
+                        new_transitions[node][bit] = Transition(child, None, RIGHT)
+                        nodes.append((child, prefix + bit))
+                    elif offset > 0:
+                        # otherwise the machine halts as it halts in state_from, but having read part of the symbol,
+                        # so the head first moves back to its first bit
+                        halt_state = f"{state_from}_halt"
+                        new_transitions.setdefault(halt_state, {})
+                        new_transitions[node][bit] = Transition(move_chain(new_transitions, halt_state, LEFT, offset - 1), None, LEFT)
+                    continue
+
+                state_to, direction = action
+                target = {RIGHT: width, LEFT: -width, None: 0}[direction]
+                if len(candidates) == 1:
+                    symbol = candidates[0]
+                    code = symbol_map[symbol]
+                    new_code = symbol_map[transitions[symbol].symbol_to_write or symbol]
+                else:
+                    # the symbol is kept, so only the bits that were read are known
+                    code = new_code = list(prefix + bit) + [None] * (width - offset - 1)
+                walk = write_walk(offset, list(code), list(new_code), target)
+
+                # the walk ends with moves that do not write (shared with move_chain), after the first step, which is taken by node
+                tail = len(walk)
+                while tail > 1 and walk[tail - 1][1] is None and walk[tail - 1][2] is not None and walk[tail - 1][2] == walk[-1][2]:
+                    tail -= 1
+                states = [node] + [f"{state_from}_r{prefix + bit}w{i}" for i in range(1, tail)]
+                states.append(move_chain(new_transitions, state_to, walk[-1][2], len(walk) - tail) if tail < len(walk) else state_to)
+                known = list(code)
+                for i in range(tail):
+                    cell, write, move = walk[i]
+                    transition = Transition(states[i + 1], write, move)
+                    if i == 0:
+                        new_transitions[node][bit] = transition
+                    elif 0 <= cell < width and known[cell] is not None:
+                        new_transitions[states[i]] = {known[cell]: transition}
+                    else:
+                        new_transitions[states[i]] = {'0': transition, '1': transition}
+                    if write is not None:
+                        known[cell] = write
+                for symbol in candidates:
+                    steps[(state_from, symbol)] = offset + len(walk)
+    return new_transitions, steps
+
+def choose_symbol_code(tm, frequencies=None):
+    """
+    Fixed-length binary code of each symbol of a TM for n_to_2_symbols, chosen to minimize the steps the binary TM takes (then its number of states).
+    The code is as short as possible, since every bit adds steps to every transition, and the empty symbol is all '0's, so that blank cells decode to it.
+    The other symbols are given the remaining codes in order of frequency, which are then improved by swapping codes while that lowers the cost:
+    codes of symbols that are treated the same way can share a prefix, so fewer bits are read, and codes of symbols
+    that overwrite each other can differ in the last bits only, so the head goes back less to write them.
+    frequencies: {(state, symbol): hits} (e.g. Profile.counts from a profiling run of the TM) weighting the cost of each transition;
+        if None, every transition counts the same
+    Returns {symbol: code}
+    """
+    symbols = symbol_alphabet(tm)
+    width = max(1, (len(symbols) - 1).bit_length())
+    weights = {}
+    for state_from, transitions in tm.transitions.items():
+        for symbol in transitions:
+            weights[(state_from, symbol)] = 1 if frequencies is None else frequencies.get((state_from, symbol), 0)
+    symbol_weights = {symbol: 0 for symbol in symbols}
+    for (state_from, symbol), weight in weights.items():
+        symbol_weights[symbol] += weight
+
+    codes = [format(i, f"0{width}b") for i in range(1, 2 ** width)]
+    others = sorted(symbols - {tm.empty_symbol}, key=lambda symbol: (-symbol_weights[symbol], symbol))
+    assignment = others + [None] * (len(codes) - len(others))  # symbol with each of the codes (None if the code is not used)
+
+    def cost():
+        symbol_map = {symbol: code for symbol, code in zip(assignment, codes) if symbol is not None}
+        symbol_map[tm.empty_symbol] = '0' * width
+        new_transitions, steps = encode_transitions(tm, symbol_map)
+        return sum(weight * steps.get(key, 0) for key, weight in weights.items()), len(new_transitions)
+
+    best = cost()
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(codes)):
+            for j in range(i + 1, len(codes)):
+                if assignment[i] is None and assignment[j] is None:
+                    continue
+                assignment[i], assignment[j] = assignment[j], assignment[i]
+                swapped = cost()
+                if swapped < best:
+                    best = swapped
+                    improved = True
+                else:
+                    assignment[i], assignment[j] = assignment[j], assignment[i]
+
+    symbol_map = {symbol: code for symbol, code in zip(assignment, codes) if symbol is not None}
+    symbol_map[tm.empty_symbol] = '0' * width
+    return symbol_map
+
+def encode_tape(tape, head_idx, symbol_map):
+    """
+    Tape of the binary TM from the tape of the TM it was compiled from (see n_to_2_symbols), with each symbol replaced by its code.
+    Returns (tape, head_idx)
+    """
+    width = len(next(iter(symbol_map.values())))
+    encoded = []
+    for symbol in tape:
+        if symbol not in symbol_map:
+            raise ValueError(f"Symbol {symbol} has no code")
+        encoded.extend(symbol_map[symbol])
+    return encoded, head_idx * width
+
+def decode_tape(tape, head_idx, symbol_map):
+    """
+    Tape of the TM a binary TM was compiled from (see n_to_2_symbols), from the tape of the binary TM after it ran.
+    The codes are aligned with the head, which is on the first bit of a code whenever the binary TM is between simulated transitions,
+    and cells past the ends of the tape are blank ('0').
+    Returns (tape, head_idx)
+    """
+    width = len(next(iter(symbol_map.values())))
+    symbols = {code: symbol for symbol, code in symbol_map.items()}
+    padding = (width - head_idx % width) % width
+    bits = ['0'] * padding + list(tape)
+    bits += ['0'] * (-len(bits) % width)
+    decoded = []
+    for i in range(0, len(bits), width):
+        code = ''.join(bits[i:i + width])
+        if code not in symbols:
+            raise ValueError(f"{code} at cell {i - padding} is not the code of a symbol")
+        decoded.append(symbols[code])
+    return decoded, (head_idx + padding) // width
+
+def n_to_2_symbols(tm, symbol_map=None, frequencies=None):
+    """
+    Convert a Turing Machine that uses n symbols to one that uses only '0' and '1' (with '0' as the empty symbol).
+    Note that this works by expressing each symbol as a unique fixed-length binary string,
+    so input tape symbols need to be converted to the multiple-bit representation as well (see encode_tape and decode_tape;
+    the tape of the given TM is converted here).
+    Each state reads the bits of the symbol under the head from left to right, but only until the transition is known,
+    then writes the bits that change and moves the head to the first bit of the next symbol. The TM must not have SuperTransitions.
+    Where the TM halts on a symbol it has no transition for, the binary TM halts on the first bit of the symbol, in state_from
+    if it has not read more than that bit, and in state_from + '_halt' (which has no transitions) otherwise.
+    symbol_map: {symbol: code} to use (chosen by choose_symbol_code if not given)
+    frequencies: {(state, symbol): hits} to choose the code with (see choose_symbol_code)
+    """
+    symbol_map = symbol_map or choose_symbol_code(tm, frequencies)
+    new_transitions, steps = encode_transitions(tm, symbol_map)
+    tape, head_idx = encode_tape(tm.tape, tm.head_idx, symbol_map)
+    return type(tm)(transitions=new_transitions, start_state=tm.state, tape=tape, head_idx=head_idx, empty_symbol='0')
@@ -0,0 +1,234 @@
+import os
+import random
+
+from tm import TM, Transition, LEFT, RIGHT, HALTED, MISSING_TRANSITION
+
+
+# actions of construct_utm_input, by their number of '1's
+ACTIONS = {
+    1: ('0', None),
+    2: ('1', None),
+    3: (None, LEFT),
+    4: (None, RIGHT),
+}
+# symbol the user tape is preceded by while the target runs; no state has a transition for it,
+# so the run stops as soon as the target moves left of its first cell (where the UTM halts the simulation)
+LEFT_END = '$'
+# state the UTM halts in
+UTM_HALT_STATE = '0'
+# cells the UTM moves left of its input before encoding it (two encoded symbols)
+UTM_LEFT_MARGIN = 4
+
+# the saved UTM, loaded by real_utm when first needed
+saved_utm = None
+
+
+class EmulationMismatch(Exception):
+    # raised in strict mode when the emulated result differs from running the real UTM
+    pass
+
+
+class UTMRun:
+    """
+    Outcome of running the UTM on an input (see run_utm).
+    reason: why the UTM stopped (see tm.RunResult)
+    tape: final tape of the UTM as a list of symbols (None if the UTM did not halt), which ends at the decoded tape if emulated
+        (see utm_output)
+    head_idx: index of the head in tape
+    state: state the UTM stopped in
+    steps: transitions the UTM took, or None if they are unknown (emulated runs that were not cross-checked)
+    emulated: True if the target was run directly instead of running the UTM
+    target: RunResult of the target's run if emulated
+    checked: True if the emulated run was cross-checked against a run of the real UTM
+    """
+    def __init__(self, reason, tape, head_idx, state, steps, emulated, target=None, checked=False):
+        self.reason = reason
+        self.tape = tape
+        self.head_idx = head_idx
+        self.state = state
+        self.steps = steps
+        self.emulated = emulated
+        self.target = target
+        self.checked = checked
+
+    @property
+    def halted(self):
+        return self.reason in (HALTED, MISSING_TRANSITION)
+
+    def __str__(self):
+        steps = "unknown" if self.steps is None else self.steps
+        how = "emulated" if self.emulated else "real"
+        return f"{self.reason} in state {self.state} after {steps} transitions ({how} UTM run)"
+
+
+def read_unary(utm_input, i):
+    # number of '1's starting at i, and the index just past the '0' after them (None if there is no '0' after them)
+    j = i
+    while j < len(utm_input) and utm_input[j] == '1':
+        j += 1
+    if j == len(utm_input) or utm_input[j] != '0':
+        return j - i, None
+    return j - i, j + 1
+
+
+def decode_utm_input(utm_input):
+    """
+    Inverse of construct_utm_input: the standardized target TM (with its initial tape) that a UTM input encodes.
+    Raises ValueError if the UTM would not simulate the input as intended: the target needs a non-halting state,
+    actions and next states must be in range, and the initial tape must be empty or start with '1' and not contain '00'
+    (the UTM takes '00' as the end of its input).
+    Returns (target TM, length of the input before the initial tape)
+    """
+    utm_input = ''.join(utm_input)
+    num_states, i = read_unary(utm_input, 0)
+    if i is None or num_states < 2:
+        raise ValueError("UTM input must start with the number of states (at least 2) followed by '0'")
+
+    transitions = {'0': {}}  # halt state
+    for state in range(1, num_states):
+        transitions[str(state)] = {}
+        for symbol in ('0', '1'):
+            action, i = read_unary(utm_input, i)
+            if i is None or action not in ACTIONS:
+                raise ValueError(f"Invalid action of state {state} for symbol {symbol}")
+            state_to, i = read_unary(utm_input, i)
+            if i is None or not 1 <= state_to <= num_states:
+                raise ValueError(f"Invalid next state of state {state} for symbol {symbol}")
+            symbol_to_write, direction = ACTIONS[action]
+            transitions[str(state)][symbol] = Transition(str(state_to - 1), symbol_to_write, direction)
+
+    tape = utm_input[i:]
+    if tape and (tape[0] != '1' or '00' in tape or not set(tape) <= {'0', '1'}):
+        raise ValueError("Initial tape of a UTM input must start with '1' and not contain '00'")
+    return TM(transitions=transitions, start_state='1', tape=list(tape) or None), i
+
+
+def utm_output(description_length, tape, head_idx):
+    """
+    Final tape of the UTM after simulating a target to the given tape, and the index of the UTM's head,
+    or None if the UTM can't decode that tape (it halts in a state that is not its halt state instead).
+    To clean up, the UTM blanks the '0's left of the simulated head up to the first '1', and it decodes the tape from
+    that '1' (or from the cell under the simulated head if there is none, which has to be '1'), writing each symbol where
+    the first cell of its encoding was. Its head then moves left to just past the last '00' of the decoded tape
+    (or to its first '1' if there is none).
+    The result is the same tape as the UTM's, but without the blank cells it visits right of the decoded tape.
+    description_length: length of the UTM input before the initial tape of the target
+    tape: final tape of the target as a list of symbols (from the first cell of its initial tape on)
+    head_idx: index of the target's head in tape
+    """
+    tape = tape + ['0'] * (head_idx + 1 - len(tape))
+    if '1' not in tape[:head_idx + 1]:
+        return None
+    first = tape.index('1')
+    decoded = ''.join(tape[first:]).rstrip('0')
+    last_blanks = decoded.rfind('00')
+    start = UTM_LEFT_MARGIN + 2 * (description_length + first)
+    return ['0'] * start + list(decoded), start + (last_blanks + 2 if last_blanks >= 0 else 0)
+
+
+def trimmed(tape, head_idx):
+    # tape without the blank cells right of both its last '1' and the head, to compare tapes the UTM left
+    end = max(len(''.join(tape).rstrip('0')), head_idx + 1)
+    return tape[:end]
+
+
+def emulate_utm(utm_input, max_steps=None, timeout=None):
+    """
+    The outcome of running the UTM on an input, found by running the target it encodes directly on the fast engine.
+    The steps of the UTM are unknown, but the target's run is kept in the result.
+    utm_input: string or list of symbols
+    max_steps, timeout: budget of the target's run (see TM.run_compiled)
+    Returns a UTMRun, or None if the input is not well-formed (see decode_utm_input)
+    or the target halts with a tape the UTM can't decode (one without a '1')
+    """
+    try:
+        tm, description_length = decode_utm_input(utm_input)
+    except ValueError:
+        return None
+
+    # the UTM's user tape is right-sided infinite, so the target also stops when it moves onto LEFT_END
+    tm.set_tape([LEFT_END] + tm.tape, 1)
+    target = tm.run_compiled(max_steps=max_steps, timeout=timeout)
+    if not target.halted:
+        return UTMRun(target.reason, None, None, None, None, True, target)
+    # after moving left of the user tape, the UTM cleans up as if the head were on its first cell
+    output = utm_output(description_length, tm.tape[1:], max(target.head_idx - 1, 0))
+    if output is None:
+        return None
+    return UTMRun(HALTED, output[0], output[1], UTM_HALT_STATE, None, True, target)
+
+
+def real_utm():
+    # the saved UTM (utm.xml), its start state, and its CompiledTM
+    global saved_utm
+    if saved_utm is None:
+        from parser import load_from_xml
+        utm = load_from_xml(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utm.xml'))
+        saved_utm = utm, utm.state, utm.compile()
+    return saved_utm
+
+
+def run_real_utm(utm_input, max_steps=None, timeout=None):
+    """
+    Run the saved UTM (utm.xml) on an input cell by cell.
+    max_steps, timeout: budget of the UTM's run (see TM.run_compiled)
+    Returns a UTMRun
+    """
+    utm, start_state, compiled = real_utm()
+    utm.set_tape(list(utm_input) or None)
+    utm.state = start_state
+    result = utm.run_compiled(compiled, max_steps=max_steps, timeout=timeout)
+    tape = utm.tape if result.halted else None
+    return UTMRun(result.reason, tape, result.head_idx, result.state, result.steps, False)
+
+
+def run_utm(utm_input, strict=False, max_steps=None, timeout=None):
+    """
+    The outcome of running the UTM (utm.xml) on an input.
+    Inputs of construct_utm_input are emulated (see emulate_utm), so their UTMRun has unknown steps;
+    any other input, and any whose target halts with a tape the UTM can't decode, is run on the real UTM.
+    strict: if True, emulated runs that halt are also run on the real UTM (without a budget), raising EmulationMismatch
+        if it ends with a different tape, head or state (otherwise the UTMRun gets the steps of the real run)
+    max_steps, timeout: budget of the target's run when emulating, and of the UTM's when running it
+    Returns a UTMRun
+    """
+    run = emulate_utm(utm_input, max_steps, timeout)
+    if run is None:
+        return run_real_utm(utm_input, max_steps, timeout)
+    if strict and run.halted:
+        real = run_real_utm(utm_input)
+        if real.tape is None or (real.state, real.head_idx, trimmed(real.tape, real.head_idx)) != (run.state, run.head_idx, run.tape):
+            raise EmulationMismatch(f"Emulated UTM run ({run}, head at {run.head_idx}) differs from the real one ({real}, head at {real.head_idx})")
+        run.steps = real.steps
+        run.checked = True
+    return run
+
+
+def run_utm_jobs(utm_inputs, strict=False, sample=0.1, seed=None, max_steps=None, timeout=None):
+    """
+    run_utm on each of many inputs.
+    strict: if True, a random sample of the emulated runs is cross-checked against the real UTM (see run_utm)
+    sample: fraction of the runs to cross-check in strict mode
+    seed: seed of the sample
+    Yields a UTMRun per input, in order
+    """
+    rng = random.Random(seed)
+    for utm_input in utm_inputs:
+        yield run_utm(utm_input, strict and rng.random() < sample, max_steps, timeout)
+
+
+if __name__ == "__main__":
+    """
+    Run the UTM on an input, emulating it if the input is well-formed
+    Usage: python emulate.py <input> [--strict]
+    """
+    import sys
+
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ["--strict"]):
+        print("Usage: python emulate.py <input> [--strict]")
+        sys.exit(1)
+
+    run = run_utm(sys.argv[1].strip(), strict=len(sys.argv) == 3)
+    print(run)
+    if run.tape is not None:
+        print(''.join(run.tape[run.head_idx:]))
@@ -0,0 +1,566 @@
+import re
+import sys
+import time
+from itertools import product
+
+from tm import RIGHT, LEFT, TIME_CHECK_INTERVAL, HALTED, MISSING_TRANSITION, BUDGET_EXHAUSTED, NonHaltingException, encode_symbols
+
+
+# widths (in cells) of the blocks that sweep detection looks for loops over
+# width 1 finds states that loop to themselves; width 2 finds the read/write cycles that four_to_two_symbols compiles a self-loop into
+SWEEP_WIDTHS = (1, 2)
+SWEEP_MAX_CYCLE = 16
+
+# polynomial hash of the tape used by loop detection: the sum of symbol_id * LOOP_HASH_BASE ** position (mod LOOP_HASH_MODULUS)
+LOOP_HASH_BASE = 1000003
+LOOP_HASH_MODULUS = 2 ** 61 - 1
+
+class Sweep:
+    """
+    A group of blocks that a state loops over: starting in the state at the first cell of any of the blocks,
+    the machine ends up back in the state at the first cell of the next block in the direction of the sweep.
+    width: number of cells in a block
+    direction: 1 (RIGHT) or -1 (LEFT)
+    cost: transitions taken to cross one block
+    outcome: the block left behind (None if each block is left unchanged)
+    min_offset, max_offset: leftmost and rightmost head offset (relative to the start of the block) while crossing a block
+    """
+    def __init__(self, width, direction, cost, outcome, min_offset, max_offset):
+        self.width = width
+        self.direction = direction
+        self.cost = cost
+        self.outcome = outcome
+        self.min_offset = min_offset
+        self.max_offset = max_offset
+        self.blocks = []
+        self.pattern = None
+
+    def compile(self):
+        # regex matching a run of blocks (in reverse for left sweeps, which are matched on a reversed copy of the tape)
+        blocks = self.blocks if self.direction == 1 else [block[::-1] for block in self.blocks]
+        self.pattern = re.compile(b'(?:' + b'|'.join(re.escape(block) for block in blocks) + b')*')
+
+    def count(self, buf, head, size):
+        # number of consecutive blocks the sweep can cross starting at head without leaving the buffer
+        p = self.width
+        if self.direction == 1:
+            k = (self.pattern.match(buf, head).end() - head) // p
+            return min(k, (size - 1 - self.max_offset - head) // p + 1)
+        limit = (head + self.min_offset) // p + 1
+        chunk = 64
+        while True:
+            lo = max(head + p - chunk * p, 0)
+            segment = buf[lo:head + p][::-1]
+            k = self.pattern.match(segment).end() // p
+            if k * p < len(segment) or lo == 0 or k >= limit:
+                return min(k, limit)
+            chunk *= 4
+
+
+class Loop:
+    """
+    Proof that a run never halts, found by CompiledTM.run_detecting_loops.
+    kind: 'cycle' if a configuration repeated exactly, or 'translated' if it repeated shifted over blank tape
+    state: name of the state the run was in when the loop was found
+    steps: transitions taken when the loop was found
+    period: transitions taken by each repetition of the loop
+    shift: cells the configuration moves by each repetition (0 for a cycle)
+    """
+    def __init__(self, kind, state, steps, period, shift=0):
+        self.kind = kind
+        self.state = state
+        self.steps = steps
+        self.period = period
+        self.shift = shift
+
+    def __str__(self):
+        if self.kind == 'cycle':
+            return f"configuration repeats every {self.period} transitions (found after {self.steps})"
+        return f"configuration repeats shifted {self.shift} cells every {self.period} transitions (found after {self.steps})"
+
+
+class RunHook:
+    """
+    Hook of CompiledTM.run, called after every transition of the run (see TransitionCounter and LoopDetector).
+    """
+    def start(self, compiled, buf):
+        # called once before the run, with the CompiledTM and the buffer of symbol ids it runs on
+        pass
+
+    def __call__(self, buf, i, s, steps, head, lo, hi, origin):
+        """
+        Called after every transition, with the buffer of symbol ids, the index of the transition in the tables
+        (state_id * num_symbols + symbol_id), the id of the state it went to, and the transitions taken so far.
+        head, lo, hi: buffer offsets of the head, and of the leftmost and rightmost cells the head has been at
+        origin: buffer offset of the first cell of the buffer the run started with (it moves when the buffer grows left)
+        Returns True to stop the run
+        """
+        return False
+
+
+class TransitionCounter(RunHook):
+    # counts the number of times each transition is taken, indexed like the transition table
+    def start(self, compiled, buf):
+        self.counts = [0] * len(compiled.next_state)
+
+    def __call__(self, buf, i, s, steps, head, lo, hi, origin):
+        self.counts[i] += 1
+
+
+class LoopDetector(RunHook):
+    """
+    Stops a run once it is proven to never halt, keeping the proof in loop.
+    Detection uses bounded memory, keeping one checkpoint configuration for each kind of loop, and checkpointing again
+    at doubling step counts (Brent's cycle detection):
+        cycle: the configuration (state, head position, and tape contents, compared by an incrementally updated hash
+            before comparing the cells) is the same as at the checkpoint
+        translated: the head is at the edge of the tape in the same state and on the same side as at the checkpoint, and
+            the cells the head has visited since then match the cells it is now in front of, shifted
+            (the run then repeats, shifted, over the blank tape forever)
+    Both are only reported once the cells have been compared, so a reported loop is a proof.
+    Positions are buffer offsets of the buffer the run started with, so that they stay the same when the buffer grows left.
+    tape: the ByteTape the run starts on
+    """
+    def __init__(self, tape):
+        self.start_position = tape.start
+        self.end_position = tape.end
+        self.loop = None
+
+    def start(self, compiled, buf):
+        self.states = compiled.states
+        self.write = compiled.write
+        self.move = compiled.move
+        self.n = compiled.num_symbols
+        # hash of the tape (blank cells are symbol 0, so they do not count)
+        self.h = 0
+        for offset in range(self.start_position, self.end_position):
+            if buf[offset]:
+                self.h = (self.h + buf[offset] * pow(LOOP_HASH_BASE, offset, LOOP_HASH_MODULUS)) % LOOP_HASH_MODULUS
+        self.cycle_at = 1  # step count to take the next cycle checkpoint at
+        self.cycle = None  # (state, head position, hash, snapshot, steps) at the cycle checkpoint
+        self.edge_at = 1  # step count to take the next edge checkpoint from
+        self.edge = None  # (state, head position, side, snapshot, steps) at the edge checkpoint
+        self.reach_lo = self.reach_hi = 0  # leftmost and rightmost head position since the edge checkpoint
+
+    @staticmethod
+    def cells(snapshot, snapshot_lo, a, b):
+        # cells from position a to b (inclusive) of a snapshot of the tape that starts at position snapshot_lo
+        result = bytearray(b - a + 1)
+        first, last = max(a, snapshot_lo), min(b, snapshot_lo + len(snapshot) - 1)
+        if first <= last:
+            result[first - a:last - a + 1] = snapshot[first - snapshot_lo:last - snapshot_lo + 1]
+        return result
+
+    def __call__(self, buf, i, s, steps, head, lo, hi, origin):
+        position = head - origin
+        # the transition wrote over the symbol it read, in the cell the head moved off of
+        written, read = self.write[i], i % self.n
+        if written != read:
+            self.h = (self.h + (written - read) * pow(LOOP_HASH_BASE, position - self.move[i], LOOP_HASH_MODULUS)) % LOOP_HASH_MODULUS
+        if position < self.reach_lo:
+            self.reach_lo = position
+        elif position > self.reach_hi:
+            self.reach_hi = position
+
+        # the tape from the leftmost to the rightmost cell that is not necessarily blank
+        end = self.end_position + origin
+        cycle = self.cycle
+        if cycle is not None and s == cycle[0] and position == cycle[1] and self.h == cycle[2]:
+            contents = bytes(buf[lo:max(end, hi + 1)])
+            if contents == self.cells(cycle[3][0], cycle[3][1], lo - origin, lo - origin + len(contents) - 1):
+                self.loop = Loop('cycle', self.states[s], steps, steps - cycle[4])
+                return True
+        if steps == self.cycle_at:
+            self.cycle = (s, position, self.h, (bytes(buf[lo:max(end, hi + 1)]), lo - origin), steps)
+            self.cycle_at *= 2
+
+        # at an edge of the tape, every cell beyond the head is blank (it was never visited and is outside of the initial tape)
+        side = 1 if head == hi and head >= end - 1 else -1 if head == lo and head <= self.start_position + origin else 0
+        if side == 0:
+            return False
+        edge = self.edge
+        if edge is not None and s == edge[0] and side == edge[2] and (position - edge[1]) * side > 0:
+            shift = position - edge[1]
+            # the visited cells behind the head (including the head cell), which is all the run since the checkpoint depends on
+            a, b = (self.reach_lo, edge[1]) if side == 1 else (edge[1], self.reach_hi)
+            # the window is between cells the head has been at, so it is within the buffer
+            if self.cells(edge[3][0], edge[3][1], a, b) == buf[a + shift + origin:b + shift + origin + 1]:
+                self.loop = Loop('translated', self.states[s], steps, steps - edge[4], shift)
+                return True
+        if steps >= self.edge_at:
+            self.edge = (s, position, side, (bytes(buf[lo:max(end, hi + 1)]), lo - origin), steps)
+            self.edge_at = 2 * steps
+            self.reach_lo = self.reach_hi = position
+        return False
+
+
+class CompiledTM:
+    """
+    Integer-indexed form of a TM's transition table for fast execution.
+
+    States and symbols are interned to small integers once, and the transition table is stored in flat lists
+    indexed by state_id * num_symbols + symbol_id:
+        next_state: id of the state to go to (-1 if there is no transition, which halts the machine)
+        write: id of the symbol to write (the read symbol if the transition does not write)
+        move: -1 (LEFT), 0 (no movement), or 1 (RIGHT)
+
+    The empty symbol is always interned as symbol 0, so a zero-filled buffer is a blank tape.
+    States that are only referenced as transition targets (or the state the TM is in) get an id with no transitions (they halt the machine).
+    The machine runs directly on the bytearray of a ByteTape, which is translated from symbol codes to symbol ids and back around each run.
+    """
+    def __init__(self, tm):
+        from subroutine import SuperTransition
+
+        self.empty_symbol = tm.empty_symbol
+        self.states = []
+        self.state_ids = {}
+        self.symbols = []
+        self.symbol_ids = {}
+
+        self.intern_symbol(tm.empty_symbol)
+        for state_from, transitions in tm.transitions.items():
+            self.intern_state(state_from)
+            for symbol, transition in transitions.items():
+                if isinstance(transition, SuperTransition):
+                    raise ValueError("Compile the TM to transform SuperTransitions before compiling it for the fast engine")
+                self.intern_symbol(symbol)
+                self.intern_state(transition.state_to)
+                if transition.symbol_to_write is not None:
+                    self.intern_symbol(transition.symbol_to_write)
+        self.intern_state(tm.state)  # the machine can be in a state with no row (which halts it)
+
+        n = len(self.symbols)
+        self.sweeps = None
+        self.next_state = [-1] * (len(self.states) * n)
+        self.write = [0] * (len(self.states) * n)
+        self.move = [0] * (len(self.states) * n)
+        for state_from, transitions in tm.transitions.items():
+            base = self.state_ids[state_from] * n
+            for symbol, transition in transitions.items():
+                i = base + self.symbol_ids[symbol]
+                self.next_state[i] = self.state_ids[transition.state_to]
+                self.write[i] = self.symbol_ids[transition.symbol_to_write or symbol]
+                if transition.direction == RIGHT:
+                    self.move[i] = 1
+                elif transition.direction == LEFT:
+                    self.move[i] = -1
+
+    @classmethod
+    def from_tables(cls, states, symbols, next_state, write, move):
+        """
+        Create a CompiledTM directly from its tables (symbols[0] is the empty symbol), e.g. as loaded from a binary machine file.
+        """
+        compiled = cls.__new__(cls)
+        compiled.empty_symbol = symbols[0]
+        compiled.states = list(states)
+        compiled.state_ids = {state: state_id for state_id, state in enumerate(compiled.states)}
+        compiled.symbols = list(symbols)
+        compiled.symbol_ids = {symbol: symbol_id for symbol_id, symbol in enumerate(compiled.symbols)}
+        compiled.next_state = next_state
+        compiled.write = write
+        compiled.move = move
+        compiled.sweeps = None
+        return compiled
+
+    def intern_state(self, state):
+        if state not in self.state_ids:
+            self.state_ids[state] = len(self.states)
+            self.states.append(state)
+        return self.state_ids[state]
+
+    def intern_symbol(self, symbol):
+        if symbol not in self.symbol_ids:
+            self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.symbol_ids[symbol]
+
+    @property
+    def num_symbols(self):
+        return len(self.symbols)
+
+    def add_symbols(self, symbols):
+        """
+        Add symbols (with no transitions) to the alphabet, widening the rows of the transition table.
+        This is needed when the tape contains symbols that the machine never reads or writes.
+        """
+        n = self.num_symbols
+        for symbol in symbols:
+            self.intern_symbol(symbol)
+        m = self.num_symbols
+        for table, fill in (('next_state', -1), ('write', 0), ('move', 0)):
+            old = getattr(self, table)
+            new = [fill] * (len(self.states) * m)
+            for state_id in range(len(self.states)):
+                new[state_id * m:state_id * m + n] = old[state_id * n:(state_id + 1) * n]
+            setattr(self, table, new)
+        self.sweeps = None
+
+    def trace_block(self, state_id, block):
+        """
+        Simulate the machine from state_id at the first cell of block, with every cell outside of the block unknown.
+        Returns a Sweep (with no blocks yet) if the machine comes back to state_id at the first cell of the next or
+        previous block, having only taken transitions that do not depend on unknown cells or change them.
+        Returns None otherwise (including when state_id is reached again anywhere else first).
+        """
+        ns, wr, mv, n = self.next_state, self.write, self.move, self.num_symbols
+        p = len(block)
+        cells = list(block)
+        s = state_id
+        pos = min_offset = max_offset = 0
+        for cost in range(1, SWEEP_MAX_CYCLE + 1):
+            if 0 <= pos < p:
+                i = s * n + cells[pos]
+                if ns[i] < 0:
+                    return None
+                cells[pos] = wr[i]
+            else:
+                # an unknown cell: the transition must be the same (and rewrite the same symbol) for every symbol
+                i = s * n
+                if any(ns[i + a] != ns[i] or mv[i + a] != mv[i] or wr[i + a] != a for a in range(n)) or ns[i] < 0:
+                    return None
+            pos += mv[i]
+            s = ns[i]
+            min_offset = min(min_offset, pos)
+            max_offset = max(max_offset, pos)
+            if s == state_id:
+                if abs(pos) != p:
+                    return None
+                outcome = bytes(cells) if cells != list(block) else None
+                return Sweep(p, pos // p, cost, outcome, min_offset, max_offset)
+        return None
+
+    def find_sweeps(self, widths=SWEEP_WIDTHS):
+        """
+        Detect the blocks each state loops over, so that runs of them can be crossed in one operation.
+        Returns a list with an entry for each state id: None, or a list of (width, {block: Sweep}) to try in order.
+        """
+        n = self.num_symbols
+        sweeps = [None] * len(self.states)
+        for state_id in range(len(self.states)):
+            if all(self.next_state[state_id * n + a] < 0 for a in range(n)):
+                continue
+            for p in widths:
+                if n ** p > 256:
+                    continue
+                groups = {}
+                for block in product(range(n), repeat=p):
+                    sweep = self.trace_block(state_id, block)
+                    if sweep is None:
+                        continue
+                    key = (sweep.direction, sweep.cost, sweep.outcome, sweep.min_offset, sweep.max_offset)
+                    sweep = groups.setdefault(key, sweep)
+                    sweep.blocks.append(bytes(block))
+                if groups:
+                    by_block = {}
+                    for sweep in groups.values():
+                        sweep.compile()
+                        for block in sweep.blocks:
+                            by_block[block] = sweep
+                    sweeps[state_id] = (sweeps[state_id] or []) + [(p, by_block)]
+        return sweeps
+
+    def prepare_sweeps(self):
+        # detect sweeps and mark the transitions they can start on with -2 in a copy of the next state table
+        self.sweeps = self.find_sweeps()
+        self.sweep_next_state = list(self.next_state)
+        n = self.num_symbols
+        for state_id, entries in enumerate(self.sweeps):
+            for p, by_block in entries or ():
+                for block in by_block:
+                    self.sweep_next_state[state_id * n + block[0]] = -2
+
+    def translation_tables(self):
+        # tables for bytes.translate between tape symbol codes and symbol ids
+        if self.num_symbols > 256:
+            raise ValueError("The fast engine supports at most 256 symbols")
+        codes = encode_symbols(self.symbols)
+        to_ids = bytearray(256)
+        for symbol_id, code in enumerate(codes):
+            to_ids[code] = symbol_id
+        return bytes(to_ids), codes.ljust(256, b'\x00')
+
+    def encode_tape(self, tape):
+        """
+        Copy of a ByteTape's buffer with symbol ids in place of symbol codes, adding any symbols on the tape to the alphabet.
+        A tape of symbols that don't fit in a byte (or one the machine would write such symbols on) is encoded from its list of symbols.
+        Returns (buffer, table for bytes.translate back to symbol codes, or None for a tape of symbols (see decode_buffer))
+        """
+        if tape.is_bytes:
+            try:
+                codes = encode_symbols(self.symbols)
+            except (ValueError, UnicodeEncodeError):
+                tape.to_symbols()
+        if not tape.is_bytes:
+            unknown = set(tape.symbols()) - self.symbol_ids.keys()
+            if unknown:
+                self.add_symbols(sorted(unknown))
+            if self.num_symbols > 256:
+                raise ValueError("The fast engine supports at most 256 symbols")
+            symbol_ids = self.symbol_ids
+            return bytearray(symbol_ids[symbol] for symbol in tape.buffer), None
+
+        with tape.window() as contents:
+            unknown = contents.tobytes().translate(None, codes)
+        if unknown:
+            self.add_symbols(sorted(set(unknown.decode('latin-1'))))
+        to_ids, to_codes = self.translation_tables()
+        return tape.buffer.translate(to_ids), to_codes
+
+    def decode_buffer(self, buf, to_codes):
+        # buffer of a ByteTape holding the symbols of the symbol ids in buf (see encode_tape)
+        if to_codes is None:
+            symbols = self.symbols
+            return [symbols[symbol_id] for symbol_id in buf]
+        return buf.translate(to_codes)
+
+    def run(self, tape, state, sweeps=True, max_steps=None, timeout=None, hook=None):
+        """
+        Run the machine on a ByteTape until it halts (no transition for the current state and symbol) or a budget runs out.
+        The tape is updated in place, with the same contents the TM class would leave.
+        state: name of the state to start in
+        sweeps: if True, runs of blocks that a state loops over are crossed in one operation (see find_sweeps),
+            while still counting every transition
+        max_steps: maximum number of transitions to take
+        timeout: maximum number of seconds to run for
+        hook: RunHook to call after every transition (sweeps are not taken then), which can stop the run
+        Returns (name of the final state, transitions taken)
+        """
+        limit, deadline, budget_at = self.budget(max_steps, timeout)
+        buf, to_codes = self.encode_tape(tape)
+        if hook is not None:
+            sweeps = False
+            hook.start(self, buf)
+        if sweeps and self.sweeps is None:
+            self.prepare_sweeps()
+
+        ns = self.sweep_next_state if sweeps else self.next_state
+        next_state = self.next_state
+        state_sweeps = self.sweeps
+        wr = self.write
+        mv = self.move
+        n = self.num_symbols
+
+        size = len(buf)
+        lo = tape.start
+        end = tape.end
+        head = tape.head
+        hi = head  # rightmost position the head has been at
+        hi_step = -1  # index of the transition that first moved the head to hi
+        origin = 0  # buffer offset of the first cell of the initial buffer, which moves when the buffer grows left
+
+        s = self.state_ids[state]
+        steps = 0
+        # the budget is checked every few transitions; with a hook, this check comes after every transition, so run pays nothing for hooks
+        checkpoint = budget_at if hook is None else 0
+        while True:
+            if steps >= checkpoint:
+                if hook is not None and steps > 0 and hook(buf, i, s, steps, head, lo, hi, origin):
+                    break
+                if steps >= budget_at:
+                    budget_at = self.check_budget(steps, limit, deadline)
+                    if budget_at is None:
+                        break
+                checkpoint = budget_at if hook is None else steps + 1
+            i = s * n + buf[head]
+            nxt = ns[i]
+            if nxt < 0:
+                if nxt == -1:
+                    break
+                # the transition may start a sweep (crossing no more blocks than the budget allows before its next check)
+                k = 0
+                for p, by_block in state_sweeps[s]:
+                    sweep = by_block.get(bytes(buf[head:head + p]))
+                    if sweep is not None:
+                        k = min(sweep.count(buf, head, size), (checkpoint - steps) // sweep.cost)
+                        break
+                if k > 0:
+                    steps += k * sweep.cost
+                    p = sweep.width
+                    last = head + (k - 1) * p * sweep.direction  # start of the last block crossed
+                    if sweep.outcome is not None:
+                        fill_lo = min(head, last)
+                        buf[fill_lo:fill_lo + k * p] = sweep.outcome * k
+                    lo = min(lo, head + sweep.min_offset, last + sweep.min_offset)
+                    top = max(head + sweep.max_offset, last + sweep.max_offset)
+                    head = last + p * sweep.direction
+                    if top > hi:
+                        hi = top
+                        hi_step = steps - 1 if top == head else -1
+                    continue
+                nxt = next_state[i]
+            buf[head] = wr[i]
+            d = mv[i]
+            if d == 1:
+                head += 1
+                if head > hi:
+                    hi = head
+                    hi_step = steps
+                    if head == size:
+                        buf.extend(bytearray(size))
+                        size *= 2
+            elif d == -1:
+                head -= 1
+                if head < lo:
+                    lo = head
+                    if head < 0:
+                        buf[0:0] = bytearray(size)
+                        head += size
+                        lo += size
+                        end += size
+                        hi += size
+                        origin += size
+                        size *= 2
+            s = nxt
+            steps += 1
+
+        self.store_tape(tape, buf, to_codes, lo, end, hi, hi_step, steps, head)
+        return self.states[s], steps
+
+    def run_profiled(self, tape, state, max_steps=None, timeout=None):
+        """
+        Same as run (without sweeps), but counts the number of times each transition is taken (see TransitionCounter).
+        Returns (name of the final state, transitions taken, counts), where counts is indexed like the transition table
+        (state_id * num_symbols + symbol_id)
+        """
+        counter = TransitionCounter()
+        state, steps = self.run(tape, state, max_steps=max_steps, timeout=timeout, hook=counter)
+        return state, steps, counter.counts
+
+    def budget(self, max_steps, timeout):
+        # (step limit, deadline, step count to check the budget at) for a run, checking the clock every TIME_CHECK_INTERVAL steps
+        limit = sys.maxsize if max_steps is None else max_steps
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        return limit, deadline, limit if deadline is None else min(limit, TIME_CHECK_INTERVAL)
+
+    def check_budget(self, steps, limit, deadline):
+        # step count to check the budget at next, or None if it has run out
+        if steps >= limit or (deadline is not None and time.perf_counter() >= deadline):
+            return None
+        return min(limit, steps + TIME_CHECK_INTERVAL)
+
+    def stop_reason(self, tape, state):
+        # why a run that stopped in state on the tape stopped (HALTED, MISSING_TRANSITION, or BUDGET_EXHAUSTED if it could go on)
+        n = self.num_symbols
+        row = self.next_state[self.state_ids[state] * n:(self.state_ids[state] + 1) * n]
+        symbol_id = self.symbol_ids.get(tape.read())
+        if symbol_id is not None and row[symbol_id] >= 0:
+            return BUDGET_EXHAUSTED
+        return MISSING_TRANSITION if any(state_to >= 0 for state_to in row) else HALTED
+
+    def store_tape(self, tape, buf, to_codes, lo, end, hi, hi_step, steps, head):
+        # cells the head has moved off of are part of the tape; the rightmost cell it reached only if a transition was taken on it
+        tape.buffer = self.decode_buffer(buf, to_codes)
+        tape.start = lo
+        tape.end = max(end, hi + 1 if steps > hi_step + 1 else hi)
+        tape.head = head
+
+    def run_detecting_loops(self, tape, state, max_steps=None, timeout=None):
+        """
+        Same as run (without sweeps), but raises a NonHaltingException with a Loop if the run is proven to never halt (see LoopDetector).
+        Returns (name of the final state, transitions taken, why the run stopped (see stop_reason))
+        """
+        detector = LoopDetector(tape)
+        state, steps = self.run(tape, state, max_steps=max_steps, timeout=timeout, hook=detector)
+        if detector.loop is not None:
+            raise NonHaltingException(f"Machine never halts: {detector.loop}", detector.loop)
+        return state, steps, self.stop_reason(tape, state)
@@ -0,0 +1,194 @@
+import json
+import sys
+from collections.abc import Mapping
+from weakref import WeakValueDictionary
+
+from tm import TM
+
+
+class FrozenTransition:
+    # immutable Transition (so equal transitions can be shared, see freeze_transition)
+    __slots__ = ('state_to', 'symbol_to_write', 'direction', '__weakref__')
+
+    def __init__(self, state_to, symbol_to_write, direction):
+        object.__setattr__(self, 'state_to', state_to)
+        object.__setattr__(self, 'symbol_to_write', symbol_to_write)
+        object.__setattr__(self, 'direction', direction)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FrozenTransition is immutable (can't set {name})")
+
+    def fields(self):
+        return self.state_to, self.symbol_to_write, self.direction
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenTransition) and self.fields() == other.fields()
+
+    def __hash__(self):
+        return hash(self.fields())
+
+    def __reduce__(self):
+        # unpickled transitions are interned again
+        return frozen_transition, self.fields()
+
+    def __repr__(self):
+        return f"FrozenTransition{self.fields()!r}"
+
+    def __str__(self):
+        return json.dumps(self.to_dict())
+
+    def to_dict(self):
+        return {
+            "s": self.state_to,
+            "w": self.symbol_to_write,
+            "m": self.direction
+        }
+
+
+# the FrozenTransitions and FrozenRows that are alive, so that equal ones are the same object across all frozen machines
+# (weak references, so they are dropped with the last machine that uses them)
+interned_transitions = WeakValueDictionary()  # {(state_to, symbol_to_write, direction): FrozenTransition}
+interned_rows = WeakValueDictionary()  # {cells: FrozenRow}
+
+def clear_interned():
+    # forget the interned transitions and rows (machines that are still alive keep theirs)
+    interned_transitions.clear()
+    interned_rows.clear()
+
+
+class FrozenRow(Mapping):
+    """
+    Immutable {symbol: transition} row of a frozen transition function.
+    The row is a flat tuple (symbol, transition, symbol, transition, ...), which takes a fraction of the memory of a dict,
+    and rows only have a few entries, so lookups scan it.
+    """
+    __slots__ = ('cells', '__weakref__')
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    def __reduce__(self):
+        # unpickled rows are interned again
+        return freeze_row, (dict(self.items()),)
+
+    def __getitem__(self, symbol):
+        cells = self.cells
+        for i in range(0, len(cells), 2):
+            if cells[i] == symbol:
+                return cells[i + 1]
+        raise KeyError(symbol)
+
+    def get(self, symbol, default=None):
+        cells = self.cells
+        for i in range(0, len(cells), 2):
+            if cells[i] == symbol:
+                return cells[i + 1]
+        return default
+
+    def __iter__(self):
+        return iter(self.cells[::2])
+
+    def __len__(self):
+        return len(self.cells) // 2
+
+    def items(self):
+        cells = self.cells
+        return zip(cells[::2], cells[1::2])
+
+    def __repr__(self):
+        return f"FrozenRow({dict(self.items())!r})"
+
+
+def freeze_transition(transition):
+    # interned FrozenTransition with the same fields (SuperTransitions are kept as they are)
+    if not hasattr(transition, 'symbol_to_write'):
+        return transition
+    return frozen_transition(transition.state_to, transition.symbol_to_write, transition.direction)
+
+def frozen_transition(state_to, symbol_to_write, direction):
+    # interned FrozenTransition with the given fields
+    key = (sys.intern(state_to), symbol_to_write, direction)
+    frozen = interned_transitions.get(key)
+    if frozen is None:
+        frozen = interned_transitions[key] = FrozenTransition(*key)
+    return frozen
+
+def freeze_row(row):
+    # interned FrozenRow with the same transitions as a {symbol: transition} row
+    if isinstance(row, FrozenRow):
+        return row
+    cells = []
+    for symbol, transition in row.items():
+        cells.append(symbol)
+        cells.append(freeze_transition(transition))
+    cells = tuple(cells)
+    frozen = interned_rows.get(cells)
+    if frozen is None:
+        frozen = interned_rows[cells] = FrozenRow(cells)
+    return frozen
+
+def share_row(row, new_row):
+    """
+    Row for a compiler pass to put in its new transition function: row itself if it is frozen and new_row has the same transitions,
+    so passes over a FrozenTM share every row they do not change instead of copying it.
+    """
+    if isinstance(row, FrozenRow) and len(row) == len(new_row) and all(row.get(symbol) is transition for symbol, transition in new_row.items()):
+        return row
+    return new_row
+
+
+class FrozenTransitions(Mapping):
+    """
+    Immutable {state_name: FrozenRow} transition function of a FrozenTM.
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, transitions):
+        if isinstance(transitions, FrozenTransitions):
+            self.rows = transitions.rows
+        else:
+            self.rows = {sys.intern(state): freeze_row(row) for state, row in transitions.items()}
+
+    def __getitem__(self, state):
+        return self.rows[state]
+
+    def get(self, state, default=None):
+        return self.rows.get(state, default)
+
+    def __contains__(self, state):
+        return state in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def items(self):
+        return self.rows.items()
+
+    def values(self):
+        return self.rows.values()
+
+    def keys(self):
+        return self.rows.keys()
+
+
+class FrozenTM(TM):
+    """
+    TM with an immutable transition function, for keeping many (compiled) machines in memory at once.
+    Transitions are FrozenTransition tuples and rows are FrozenRows, both interned, so equal transitions and rows
+    (as generated for the same subroutine, or left unchanged by a compiler pass) are stored once across all frozen machines that are alive,
+    and state names are interned strings.
+    Compiler passes given a FrozenTM return a FrozenTM that shares every row the pass did not change with the original.
+    The tape and run state are not frozen, so a FrozenTM runs like any other TM.
+    """
+    def __init__(self, transitions=None, start_state='1', tape=None, head_idx=0, empty_symbol='0'):
+        super().__init__(FrozenTransitions(transitions or {'0': {}, '1': {}}), start_state, tape, head_idx, empty_symbol)
+
+
+def freeze(tm):
+    # FrozenTM with the transitions, state, tape, and origins of a TM
+    frozen = FrozenTM(tm.transitions, tm.state, tm.tape, tm.head_idx, tm.empty_symbol)
+    frozen.origins = tm.origins
+    return frozen
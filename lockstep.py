@@ -0,0 +1,112 @@
+import time
+
+import numpy as np
+
+from tm import RunResult, HALTED, MISSING_TRANSITION, BUDGET_EXHAUSTED, encode_symbols
+
+
+class LockstepTM:
+    """
+    Runs many instances of one machine at once with NumPy, advancing every instance that has not halted by one transition per step.
+    The tapes are the rows of a 2-D uint8 array of symbol ids (with blank margins that double when a head reaches them),
+    and the states and heads are vectors, so each step is a handful of gathers and scatters into the integer transition table
+    (see engine.CompiledTM), over only the instances that are still running.
+    Step counts and final tapes are exactly the same as running each instance with TM.run.
+
+    Example:
+        runner = LockstepTM(load_from_xml("examples/copy_tm.xml"))
+        results = runner.run(['1' * n for n in range(1, 21)])
+    """
+    def __init__(self, tm):
+        self.compiled = tm.compile()
+        self.start_state = tm.state
+
+    def tables(self):
+        # the transition table as arrays, and whether each state has any transitions
+        compiled = self.compiled
+        next_state = np.array(compiled.next_state, dtype=np.int32)
+        has_transitions = (next_state.reshape(len(compiled.states), compiled.num_symbols) >= 0).any(axis=1)
+        return next_state, np.array(compiled.write, dtype=np.uint8), np.array(compiled.move, dtype=np.int64), has_transitions
+
+    def run(self, tapes, head_idx=0, max_steps=None):
+        """
+        Run the machine (from the state the TM was in when this was created) on every tape.
+        tapes: list of initial tapes (strings or lists of symbols)
+        head_idx: index of the head in each initial tape
+        max_steps: maximum number of steps to take (instances still running afterwards stop with BUDGET_EXHAUSTED)
+        Returns a list of (RunResult, final tape contents as a string), in the order of tapes
+        (the elapsed time of each RunResult is the time the whole run took)
+        """
+        begin = time.perf_counter()
+        compiled = self.compiled
+        tapes = [encode_symbols(tape or compiled.empty_symbol) for tape in tapes]
+        unknown = b''.join(tapes).translate(None, encode_symbols(compiled.symbols))
+        if unknown:
+            compiled.add_symbols(sorted(set(unknown.decode('latin-1'))))
+        to_ids, to_codes = compiled.translation_tables()
+        next_state, write, move, has_transitions = self.tables()
+        n = compiled.num_symbols
+
+        count = len(tapes)
+        lengths = np.array([len(tape) for tape in tapes], dtype=np.int64)
+        longest = int(lengths.max(initial=1))
+        margin = max(longest, 16)
+        cells = np.zeros((count, margin + longest + margin), dtype=np.uint8)
+        for row, tape in enumerate(tapes):
+            cells[row, margin:margin + len(tape)] = np.frombuffer(tape.translate(to_ids), dtype=np.uint8)
+
+        origin = margin  # column of the first cell of the initial tapes
+        heads = origin + np.minimum(lengths, head_idx)
+        states = np.full(count, compiled.state_ids[self.start_state], dtype=np.int32)
+        steps = np.zeros(count, dtype=np.int64)
+        lo = np.full(count, origin, dtype=np.int64)  # leftmost column of each tape (the leftmost cell its head has been at)
+        hi = np.full(count, -1, dtype=np.int64)  # rightmost column a transition was taken at
+
+        running = np.arange(count)
+        step = 0
+        while len(running) and (max_steps is None or step < max_steps):
+            h = heads[running]
+            i = states[running] * n + cells[running, h]
+            nxt = next_state[i]
+            fired = nxt >= 0
+            if not fired.all():
+                running, h, i, nxt = running[fired], h[fired], i[fired], nxt[fired]
+                if not len(running):
+                    break
+            cells[running, h] = write[i]
+            hi[running] = np.maximum(hi[running], h)
+            h = h + move[i]
+            heads[running] = h
+            states[running] = nxt
+            steps[running] += 1
+            lo[running] = np.minimum(lo[running], h)
+            step += 1
+
+            # grow the margins once a head reaches the edge of the array
+            if h.min() == 0:
+                grow = cells.shape[1]
+                cells = np.concatenate([np.zeros_like(cells), cells], axis=1)
+                heads += grow
+                h += grow
+                lo += grow
+                hi += grow
+                origin += grow
+            if h.max() == cells.shape[1] - 1:
+                cells = np.concatenate([cells, np.zeros_like(cells)], axis=1)
+
+        elapsed = time.perf_counter() - begin
+        still_running = np.zeros(count, dtype=bool)
+        still_running[running] = True
+        results = []
+        for row in range(count):
+            # cells the head has moved off of are part of the tape, and so is the cell it stopped on
+            start = int(lo[row])
+            end = max(origin + int(lengths[row]), int(hi[row]) + 1, int(heads[row]))
+            tape = cells[row, start:end].tobytes().translate(to_codes).decode('latin-1')
+            state = int(states[row])
+            if still_running[row] and next_state[state * n + cells[row, heads[row]]] >= 0:
+                reason = BUDGET_EXHAUSTED
+            else:
+                reason = MISSING_TRANSITION if has_transitions[state] else HALTED
+            results.append((RunResult(reason, int(steps[row]), elapsed, compiled.states[state], int(heads[row]) - start), tape))
+        return results
@@ -0,0 +1,131 @@
+from functools import lru_cache
+
+from engine import CompiledTM
+
+
+class MacroMachine:
+    """
+    Block macro-machine simulator: the tape is grouped into blocks of block_size cells, and the machine runs block-to-block.
+    Each (state, block contents, entry offset) is simulated cell-by-cell once, and its result is memoized in a bounded LRU cache:
+    the state and offset the head leaves the block with (or halts at), the new block contents, and the number of transitions taken.
+    Step counts and the final tape are exactly the same as running the TM itself.
+
+    tm: the TM (or its CompiledTM) to simulate
+    block_size: number of cells per block
+    cache_size: maximum number of memoized block transitions (None for unbounded)
+
+    Example:
+        macro = MacroMachine(load_from_xml("utm.xml"), block_size=8)
+        state, transitions = macro.run(utm.byte_tape, utm.state)
+        print(macro.cache_info())
+    """
+    def __init__(self, tm, block_size=8, cache_size=2 ** 16):
+        if block_size < 1:
+            raise ValueError("block_size must be greater than 0")
+        self.compiled = tm if isinstance(tm, CompiledTM) else CompiledTM(tm)
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self.clear_cache()
+
+    def clear_cache(self):
+        self.simulate_block = lru_cache(maxsize=self.cache_size)(self._simulate_block)
+
+    def cache_info(self):
+        # hits, misses, maxsize and currsize of the block transition cache
+        return self.simulate_block.cache_info()
+
+    def _simulate_block(self, state_id, block, offset):
+        """
+        Run the machine inside one block, starting in state_id with the head at offset, until the head leaves the block or the machine halts.
+        Returns (state id, new block, head offset, transitions taken, leftmost head offset, rightmost offset a transition was taken at),
+        where the head offset is -1 or block_size if the head left the block.
+        Raises an Exception if the machine loops forever inside the block.
+        """
+        compiled = self.compiled
+        ns, wr, mv, n = compiled.next_state, compiled.write, compiled.move, compiled.num_symbols
+        k = self.block_size
+        # more transitions than there are configurations inside the block means that one of them repeated
+        limit = len(compiled.states) * k * n ** k
+
+        cells = bytearray(block)
+        s = state_id
+        pos = min_pos = offset
+        max_fired = -1
+        steps = 0
+        while 0 <= pos < k:
+            i = s * n + cells[pos]
+            nxt = ns[i]
+            if nxt < 0:
+                break
+            cells[pos] = wr[i]
+            if pos > max_fired:
+                max_fired = pos
+            pos += mv[i]
+            if pos < min_pos:
+                min_pos = pos
+            s = nxt
+            steps += 1
+            if steps > limit:
+                raise Exception(f"Machine loops forever inside a block from state {compiled.states[state_id]}")
+        return s, bytes(cells), pos, steps, min_pos, max_fired
+
+    def run(self, tape, state):
+        """
+        Run the machine on a ByteTape until it halts, updating the tape in place (same contract as CompiledTM.run).
+        state: name of the state to start in
+        Returns (name of the final state, transitions taken)
+        """
+        compiled = self.compiled
+        num_symbols = compiled.num_symbols
+        buf, to_codes = compiled.encode_tape(tape)
+        if compiled.num_symbols != num_symbols:
+            # the alphabet grew, so the memoized blocks were simulated with a narrower table
+            self.clear_cache()
+        k = self.block_size
+        simulate_block = self.simulate_block
+
+        # block 0 starts at the first cell of the tape; first is the index of blocks[0]
+        length = len(tape)
+        num_blocks = (max(length, tape.head_idx + 1) + k - 1) // k
+        contents = bytes(buf[tape.start:tape.start + num_blocks * k]).ljust(num_blocks * k, b'\x00')
+        blocks = [contents[j:j + k] for j in range(0, len(contents), k)]
+        blank = bytes(k)
+        first = 0
+
+        lo = 0  # leftmost cell the head has been at (relative to the start of the tape)
+        hi_fired = -1  # rightmost cell a transition was taken at
+        b, offset = divmod(tape.head_idx, k)
+        s = compiled.state_ids[state]
+        steps = 0
+        while True:
+            j = b - first
+            s, blocks[j], pos, block_steps, min_pos, max_fired = simulate_block(s, blocks[j], offset)
+            steps += block_steps
+            base = b * k
+            if base + min_pos < lo:
+                lo = base + min_pos
+            if base + max_fired > hi_fired:
+                hi_fired = base + max_fired
+            if pos == k:
+                b += 1
+                offset = 0
+                if b - first == len(blocks):
+                    blocks.extend([blank] * len(blocks))
+            elif pos == -1:
+                b -= 1
+                offset = k - 1
+                if b < first:
+                    blocks[0:0] = [blank] * len(blocks)
+                    first -= len(blocks) // 2
+            else:
+                offset = pos
+                break
+
+        # the blocks become the buffer of the tape
+        tape.buffer = compiled.decode_buffer(bytearray(b''.join(blocks)), to_codes)
+        origin = -first * k  # buffer offset of the first cell of the original tape
+        tape.start = origin + min(lo, 0)
+        # cells a transition was taken on are part of the tape, and so is the cell the head halted on
+        tape.end = origin + max(length, hi_fired + 1, b * k + offset)
+        tape.head = origin + b * k + offset
+        return compiled.states[s], steps
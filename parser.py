@@ -1,69 +1,104 @@
 # the parsers in this file were created with the help of Claude AI
-import xml.dom.minidom as minidom
 import xml.etree.ElementTree as ET
-import random
-
+import math
+import mmap
+import struct
+import sys
+from xml.sax.saxutils import escape
 
 from utils import get_state_id_map
-from tm import TM, Transition, LEFT, RIGHT
+from tm import TM, Transition, LEFT, RIGHT, encode_symbols
+
+
+# binary machine files (see save_to_binary)
+BINARY_MAGIC = b'TMB1'
+BINARY_HEADER = struct.Struct('<4sIII')  # magic, number of states, number of symbols, start state id
+BINARY_STATE = struct.Struct('<BH')  # 1 if the state has a row in TM.transitions, length of the name
+BINARY_RECORD = struct.Struct('<iBbBx')  # next state id (-1 for none), symbol id to write, move, 1 if the transition writes
+
+# distance between neighbouring states, and between groups of states, in the simulator's editor (see layout_states)
+STATE_SPACING = 80
+GROUP_SPACING = 160
+
+
+def iter_xml(filepath):
+    """
+    Stream the states and transitions of an XML file from Turing Machine Simulator Application with iterparse.
+    Each state and transition is cleared from its section as soon as it is read, so the whole element tree is never in memory.
+
+    Yields:
+        (section tag ('States' or 'Transitions'), tag of the element (State_X or Transition_X), {field tag: text}) in file order
+    """
+    depth = 0
+    section = None
+    for event, elem in ET.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                section = elem
+            continue
+        depth -= 1
+        if depth == 2:
+            yield section.tag, elem.tag, {child.tag: child.text for child in elem}
+            section.clear()
+
+
+def xml_transition(fields):
+    """
+    Fields of a transition element as (from state, symbol read, to state, symbol to write or None, direction)
+    """
+    new_char = fields["newchar"]
+    if new_char == 'null':
+        new_char = None
 
+    direction_code = fields["direction"]
+    if direction_code == '0':
+        direction = None
+    else:
+        # Direction in XML: 1 = LEFT, 2 = RIGHT
+        direction = LEFT if direction_code == "1" else RIGHT
+    return fields["fromstate"], fields["oldchar"], fields["tostate"], new_char, direction
 
-def load_from_xml(filepath):
+
+# files the machines loaded from XML depend on, hashed into the keys of cached machines (see load_from_xml)
+PARSER_SOURCES = ['parser.py', 'tm.py', 'engine.py', 'utils.py', 'cache.py']
+
+def load_from_xml(filepath, cache=True):
     """
     Load a Turing Machine from an XML file from Turing Machine Simulator Application.
+    The file is streamed (see iter_xml), and the transition table is built as it is read.
     
     Args:
         filepath (str): Path to the XML file
+        cache (bool): If True, the parsed machine is stored in the on-disk cache under a hash of the file contents
+            (and of PARSER_SOURCES), and later loads of the same contents skip parsing (see cache.cached)
         
     Returns:
         TM: A Turing Machine instance initialized with the transitions from the XML
     """
-    # Parse the XML file
-    tree = ET.parse(filepath)
-    root = tree.getroot()
-    
-    # Initialize transitions dictionary
+    if cache:
+        from cache import cached, content_hash, file_contents, sources_hash
+        return cached(content_hash("load_from_xml", sources_hash(*PARSER_SOURCES), *file_contents(filepath)), lambda: load_from_xml(filepath, cache=False))
+
     transitions = {}
-    
-    # Find the start state
     start_state = None
-    for state_elem in root.findall(".//States/*"):
-        tag = state_elem.tag
-        state_id = tag.split('_')[1]  # Get state ID from tag (State_X)
-        
-        # Check if this is the start state
-        start_state_elem = state_elem.find("startstate")
-        if start_state_elem is not None and start_state_elem.text.lower() == "true":
-            start_state = state_id
-            
-        # Initialize the state in the transitions dictionary
-        if state_id not in transitions:
-            transitions[state_id] = {}
-    
-    # Parse transitions
-    for trans_elem in root.findall(".//Transitions/*"):
-        from_state = trans_elem.find("fromstate").text
-        to_state = trans_elem.find("tostate").text
-        old_char = trans_elem.find("oldchar").text
-        new_char = trans_elem.find("newchar").text
-        direction_code = trans_elem.find("direction").text
-
-        if new_char == 'null':
-            new_char = None
-
-        if direction_code == '0':
-            direction = None
-        else:
-            # Direction in XML: 1 = LEFT, 2 = RIGHT
-            direction = LEFT if direction_code == "1" else RIGHT
-        
-        # Create a Transition object
-        transition = Transition(to_state, new_char, direction)
-        
-        # Add the transition to the dictionary
-        if from_state not in transitions:
-            transitions[from_state] = {}
-        transitions[from_state][old_char] = transition
+    for section, tag, fields in iter_xml(filepath):
+        if section == "States":
+            state_id = tag.split('_')[1]  # Get state ID from tag (State_X)
+
+            # Check if this is the start state
+            if fields.get("startstate", "").lower() == "true":
+                start_state = state_id
+
+            # Initialize the state in the transitions dictionary
+            if state_id not in transitions:
+                transitions[state_id] = {}
+
+        elif section == "Transitions":
+            from_state, old_char, to_state, new_char, direction = xml_transition(fields)
+            if from_state not in transitions:
+                transitions[from_state] = {}
+            transitions[from_state][old_char] = Transition(to_state, new_char, direction)
     
     # Create and return a TM instance
     if not start_state:
@@ -73,9 +108,61 @@ def load_from_xml(filepath):
     return TM(transitions=transitions, start_state=start_state, empty_symbol='0')
 
 
+def load_compiled_from_xml(filepath, cache=True):
+    """
+    Load an XML machine file directly into the fast engine, without creating a TM or any Transition objects.
+    The file is streamed (see iter_xml), and the transitions are interned into integer ids as they are read.
+    cache: if True, the result is cached on disk under a hash of the file contents (see load_from_xml)
+
+    Returns:
+        (CompiledTM, name of the start state)
+    """
+    if cache:
+        from cache import cached, content_hash, file_contents, sources_hash
+        return cached(content_hash("load_compiled_from_xml", sources_hash(*PARSER_SOURCES), *file_contents(filepath)), lambda: load_compiled_from_xml(filepath, cache=False))
+
+    from engine import CompiledTM
+    compiled = CompiledTM.from_tables([], ['0'], [], [], [])
+    moves = {LEFT: -1, None: 0, RIGHT: 1}
+    records = []  # (from state id, symbol id, to state id, symbol id to write, move) of each transition
+    start_state = None
+    for section, tag, fields in iter_xml(filepath):
+        if section == "States":
+            state_id = tag.split('_')[1]
+            if fields.get("startstate", "").lower() == "true":
+                start_state = state_id
+            compiled.intern_state(state_id)
+
+        elif section == "Transitions":
+            from_state, old_char, to_state, new_char, direction = xml_transition(fields)
+            symbol_id = compiled.intern_symbol(old_char)
+            records.append((
+                compiled.intern_state(from_state),
+                symbol_id,
+                compiled.intern_state(to_state),
+                symbol_id if new_char is None else compiled.intern_symbol(new_char),
+                moves[direction],
+            ))
+
+    n = compiled.num_symbols
+    size = len(compiled.states) * n
+    compiled.next_state, compiled.write, compiled.move = [-1] * size, [0] * size, [0] * size
+    for state_from, symbol_id, state_to, write, move in records:
+        i = state_from * n + symbol_id
+        compiled.next_state[i] = state_to
+        compiled.write[i] = write
+        compiled.move[i] = move
+
+    if not start_state:
+        start_state = compiled.states[0] if compiled.states else "1"
+    return compiled, start_state
+
+
 def save_to_xml(tm, filepath):
     """
     Save a Turing Machine to an XML file in the specified format.
+    The file is streamed out as it is generated, and the states are placed deterministically (see layout_states),
+    so saving the same machine always gives the same file.
     
     Args:
         tm (TM): The Turing Machine instance to save
@@ -102,77 +189,218 @@ def save_to_xml(tm, filepath):
         invalid_symbols = all_symbols - valid_symbols
         raise ValueError(f"TM uses invalid symbols: {invalid_symbols}. Only '0' and '1' are allowed.")
     
-    # Create XML structure
-    root = ET.Element("TuringMachine")
-    states = ET.SubElement(root, "States")
-    transitions = ET.SubElement(root, "Transitions")
-
     # rename all states to simple integers
     state_id_map = get_state_id_map(tm)
-    
-    # Add states
-    state_names = list(tm.transitions.keys())
-    for i, state_name in enumerate(state_names):
-        state_id = state_id_map[state_name]
-        state_elem = ET.SubElement(states, f"State_{state_id}")
-        
-        # Random coordinates
-        x = ET.SubElement(state_elem, "x")
-        x.text = str(random.uniform(0, 600))
-        
-        y = ET.SubElement(state_elem, "y")
-        y.text = str(random.uniform(0, 600))
-        
-        # Final state (default to false for now)
-        finalstate = ET.SubElement(state_elem, "finalstate")
-        finalstate.text = "false"
-        
-        # Start state
-        startstate = ET.SubElement(state_elem, "startstate")
-        startstate.text = "true" if state_name == tm.state else "false"
-    # Add transitions
-    trans_idx = 0
-    for from_state, state_transitions in tm.transitions.items():
-        for symbol, transition in state_transitions.items():
-            if transition.state_to not in state_id_map:
-                print(f"Warning: Transition to unknown state '{transition.state_to}' in state '{from_state}'. Skipping this transition.")
-                continue
-            trans_elem = ET.SubElement(transitions, f"Transition_{trans_idx}")
-            trans_idx += 1
-            
-            # From state
-            from_state_elem = ET.SubElement(trans_elem, "fromstate")
-            from_state_elem.text = state_id_map[from_state]
-            
-            # To state
-            to_state_elem = ET.SubElement(trans_elem, "tostate")
-            to_state_elem.text = state_id_map[transition.state_to]
-            
-            # Old character (read symbol)
-            old_char = ET.SubElement(trans_elem, "oldchar")
-            old_char.text = symbol
-            
-            # New character (write symbol)
-            new_char = ET.SubElement(trans_elem, "newchar")
-            # If transition doesn't specify a symbol to write, use the same symbol
-            new_char.text = transition.symbol_to_write if transition.symbol_to_write else symbol
-            
-            # Direction (1 = LEFT, 2 = RIGHT)
-            direction = ET.SubElement(trans_elem, "direction")
-            if transition.direction is None:
-                direction.text = "0"
-            elif transition.direction == LEFT:
-                direction.text = "1"
-            elif transition.direction == RIGHT:
-                direction.text = "2"
-    
-    # Create a pretty-formatted XML string
-    rough_string = ET.tostring(root, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="    ")
-    
-    # Write to file
-    with open(filepath, 'w') as f:
-        f.write(pretty_xml)
+    positions = layout_states(tm)
+    directions = {None: "0", LEFT: "1", RIGHT: "2"}
+
+    # the file is written element by element in the layout of minidom's toprettyxml (4 space indents, one element per line)
+    with open(filepath, 'w', newline='\n') as f:
+        f.write('<?xml version="1.0" ?>\n<TuringMachine>\n    <States>\n')
+        for state_name in tm.transitions:
+            state_id = state_id_map[state_name]
+            x, y = positions[state_name]
+            f.write(
+                f"        <State_{state_id}>\n"
+                f"            <x>{x}</x>\n"
+                f"            <y>{y}</y>\n"
+                f"            <finalstate>false</finalstate>\n"
+                f"            <startstate>{'true' if state_name == tm.state else 'false'}</startstate>\n"
+                f"        </State_{state_id}>\n"
+            )
+        f.write('    </States>\n    <Transitions>\n')
+
+        trans_idx = 0
+        for from_state, state_transitions in tm.transitions.items():
+            for symbol, transition in state_transitions.items():
+                if transition.state_to not in state_id_map:
+                    print(f"Warning: Transition to unknown state '{transition.state_to}' in state '{from_state}'. Skipping this transition.")
+                    continue
+                # If transition doesn't specify a symbol to write, use the same symbol
+                new_char = transition.symbol_to_write if transition.symbol_to_write else symbol
+                f.write(
+                    f"        <Transition_{trans_idx}>\n"
+                    f"            <fromstate>{escape(state_id_map[from_state])}</fromstate>\n"
+                    f"            <tostate>{escape(state_id_map[transition.state_to])}</tostate>\n"
+                    f"            <oldchar>{escape(symbol)}</oldchar>\n"
+                    f"            <newchar>{escape(new_char)}</newchar>\n"
+                    f"            <direction>{directions[transition.direction]}</direction>\n"  # 1 = LEFT, 2 = RIGHT
+                    f"        </Transition_{trans_idx}>\n"
+                )
+                trans_idx += 1
+        f.write('    </Transitions>\n</TuringMachine>\n')
         
-    return True
\ No newline at end of file
+    return True
+
+
+def layout_states(tm):
+    """
+    Deterministic positions of the states in the simulator's editor, with the states compiled from the same high-level state
+    or SuperTransition (see profiler.origin_names) grouped together.
+    Each group is a square grid of states, and the groups are placed left to right in rows, in the order they first appear.
+    Returns {state name: (x, y)}
+    """
+    from profiler import origin_of
+    groups = {}
+    for state_name in tm.transitions:
+        groups.setdefault(origin_of(state_name, tm.origins) if tm.origins else state_name, []).append(state_name)
+
+    # wrap the rows of groups so that the whole layout is about square
+    sizes = []
+    for group in groups.values():
+        columns = math.isqrt(len(group) - 1) + 1
+        sizes.append((columns, columns * STATE_SPACING, ((len(group) - 1) // columns + 1) * STATE_SPACING))
+    row_width = math.isqrt(sum((width + GROUP_SPACING) * (height + GROUP_SPACING) for columns, width, height in sizes))
+
+    positions = {}
+    left = top = row_height = 0
+    for group, (columns, width, height) in zip(groups.values(), sizes):
+        if left and left + width > row_width:
+            left = 0
+            top += row_height + GROUP_SPACING
+            row_height = 0
+        for i, state_name in enumerate(group):
+            positions[state_name] = (left + (i % columns) * STATE_SPACING, top + (i // columns) * STATE_SPACING)
+        left += width + GROUP_SPACING
+        row_height = max(row_height, height)
+    return positions
+
+
+def save_to_binary(tm, filepath):
+    """
+    Save a Turing Machine to a compact binary file, which load_compiled_from_binary can load straight into the fast engine.
+    The file has a header, the symbols (one byte each, the empty symbol first), the states (length-prefixed UTF-8 names),
+    then, aligned to 8 bytes, a fixed-width record for each (state, symbol) pair in the order of CompiledTM's flat tables.
+
+    Args:
+        tm (TM): The Turing Machine instance to save (without SuperTransitions)
+        filepath (str): Path to save the binary file
+
+    Returns: True if successful
+    """
+    from engine import CompiledTM
+    compiled = CompiledTM(tm)
+    n = compiled.num_symbols
+    num_records = len(compiled.states) * n
+
+    # the compiled tables do not distinguish a transition that does not write from one that writes the symbol it read
+    writes = bytearray(num_records)
+    for state, transitions in tm.transitions.items():
+        for symbol, transition in transitions.items():
+            if transition.symbol_to_write is not None:
+                writes[compiled.state_ids[state] * n + compiled.symbol_ids[symbol]] = 1
+
+    data = bytearray(BINARY_HEADER.pack(BINARY_MAGIC, len(compiled.states), n, compiled.state_ids[tm.state]))
+    data += encode_symbols(compiled.symbols)
+    for state in compiled.states:
+        name = state.encode('utf-8')
+        data += BINARY_STATE.pack(state in tm.transitions, len(name)) + name
+    data += bytes(-len(data) % 8)
+    for i in range(num_records):
+        next_state = compiled.next_state[i]
+        write = compiled.write[i] if next_state >= 0 else i % n
+        data += BINARY_RECORD.pack(next_state, write, compiled.move[i], writes[i])
+
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+    return True
+
+
+def read_binary(filepath):
+    """
+    Read the tables of a binary machine file (see save_to_binary) from a memory map of it.
+
+    Returns:
+        (start state, states, whether each state has a row in TM.transitions, symbols, next_state, write, move, writes)
+        with one entry per (state, symbol) pair in each of the last four lists
+    """
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, num_states, num_symbols, start_state = BINARY_HEADER.unpack_from(mm)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{filepath} is not a binary machine file")
+        offset = BINARY_HEADER.size
+        symbols = list(mm[offset:offset + num_symbols].decode('latin-1'))
+        offset += num_symbols
+
+        states = []
+        has_row = []
+        for _ in range(num_states):
+            row, length = BINARY_STATE.unpack_from(mm, offset)
+            offset += BINARY_STATE.size
+            states.append(mm[offset:offset + length].decode('utf-8'))
+            has_row.append(bool(row))
+            offset += length
+        offset += -offset % 8
+
+        size = num_states * num_symbols * BINARY_RECORD.size
+        if sys.byteorder == 'little':
+            # each column of the records is a strided view of the map
+            with memoryview(mm)[offset:offset + size] as records:
+                with records.cast('i') as ints, records.cast('b') as signed:
+                    next_state = ints[::2].tolist()
+                    move = signed[5::8].tolist()
+                write = records[4::8].tolist()
+                writes = records[6::8].tolist()
+        else:
+            columns = list(zip(*BINARY_RECORD.iter_unpack(mm[offset:offset + size]))) or [(), (), (), ()]
+            next_state, write, move, writes = (list(column) for column in columns)
+
+    return states[start_state], states, has_row, symbols, next_state, write, move, writes
+
+
+def load_compiled_from_binary(filepath):
+    """
+    Load a binary machine file (see save_to_binary) directly into the fast engine.
+
+    Returns:
+        (CompiledTM, name of the start state)
+    """
+    from engine import CompiledTM
+    start_state, states, has_row, symbols, next_state, write, move, writes = read_binary(filepath)
+    return CompiledTM.from_tables(states, symbols, next_state, write, move), start_state
+
+
+def load_from_binary(filepath):
+    """
+    Load a Turing Machine from a binary machine file (see save_to_binary).
+
+    Returns:
+        TM: A Turing Machine instance initialized with the transitions from the file
+    """
+    start_state, states, has_row, symbols, next_state, write, move, writes = read_binary(filepath)
+    n = len(symbols)
+    directions = {-1: LEFT, 0: None, 1: RIGHT}
+    transitions = {state: {} for state, row in zip(states, has_row) if row}
+    for i, state_to in enumerate(next_state):
+        if state_to >= 0:
+            symbol_to_write = symbols[write[i]] if writes[i] else None
+            transitions[states[i // n]][symbols[i % n]] = Transition(states[state_to], symbol_to_write, directions[move[i]])
+    return TM(transitions=transitions, start_state=start_state, empty_symbol=symbols[0])
+
+
+if __name__ == "__main__":
+    """
+    Convert a Turing Machine between the XML (.xml), JSON (.json) and binary (.tmb) formats
+    Usage: python parser.py <input filepath> <output filepath>
+    """
+    if len(sys.argv) != 3:
+        print("Usage: python parser.py <input filepath> <output filepath>")
+        sys.exit(1)
+
+    input_filepath, output_filepath = sys.argv[1], sys.argv[2]
+    if input_filepath.endswith('.xml'):
+        tm = load_from_xml(input_filepath)
+    elif input_filepath.endswith('.tmb'):
+        tm = load_from_binary(input_filepath)
+    else:
+        tm = TM()
+        tm.transitions = {}
+        tm.load(input_filepath)
+
+    if output_filepath.endswith('.xml'):
+        save_to_xml(tm, output_filepath)
+    elif output_filepath.endswith('.tmb'):
+        save_to_binary(tm, output_filepath)
+    else:
+        tm.save(output_filepath)
@@ -0,0 +1,145 @@
+import json
+import time
+
+from compiler import DERIVED_STATE_SUFFIX
+
+
+def origin_names(transitions):
+    """
+    Labels for the states of a high-level transition function, to attribute the compiled states generated from them.
+    Each state is labeled with its own name, and the states a SuperTransition assembles to are labeled with the SuperTransition,
+    so every compiled state is either one of these names or derived from one by the suffixes of other passes (see origin_of).
+    transitions: {state_name : {symbol: Transition or SuperTransition}}
+    Returns {state name: label}
+    """
+    from subroutine import SuperTransition
+    origins = {state_from: state_from for state_from in transitions}
+    for state_from, state_transitions in transitions.items():
+        for symbol, transition in state_transitions.items():
+            if isinstance(transition, SuperTransition):
+                label = f"{state_from}: {type(transition).__name__} {transition.prefix}"
+                sub_transitions, first_state = transition.assemble()
+                for state, row in sub_transitions.items():
+                    for name in (state, *(t.state_to for t in row.values())):
+                        if name != transition.state_to:
+                            origins.setdefault(name, label)
+    return origins
+
+
+def origin_of(state, origins):
+    # label of the state in origins that the state is, or is derived from by compiler passes (the state itself if there is none)
+    name = state
+    while name not in origins:
+        match = DERIVED_STATE_SUFFIX.search(name)
+        if match is None or match.start() == 0:
+            return state
+        name = name[:match.start()]
+    return origins[name]
+
+
+class Profile:
+    """
+    Number of times each transition was taken over one or more profiled runs.
+    counts: {(state, symbol): hits}
+    origins: {state name: label} to roll the counts up with (see origin_names), or None
+    """
+    def __init__(self, origins=None):
+        self.counts = {}
+        self.origins = origins
+        self.elapsed = 0
+
+    def add(self, compiled, counts, elapsed=0):
+        # add the counts of a CompiledTM.run_profiled run
+        n = compiled.num_symbols
+        for i, hits in enumerate(counts):
+            if hits:
+                key = (compiled.states[i // n], compiled.symbols[i % n])
+                self.counts[key] = self.counts.get(key, 0) + hits
+        self.elapsed += elapsed
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def by_transition(self):
+        # [((state, symbol), hits)] from most to least hits
+        return sorted(self.counts.items(), key=lambda item: -item[1])
+
+    def by_state(self):
+        # [(state, hits)] from most to least hits
+        hits_by_state = {}
+        for (state, symbol), hits in self.counts.items():
+            hits_by_state[state] = hits_by_state.get(state, 0) + hits
+        return sorted(hits_by_state.items(), key=lambda item: -item[1])
+
+    def by_origin(self):
+        # [(label of the high-level state or SuperTransition, hits)] from most to least hits
+        hits_by_origin = {}
+        for state, hits in self.by_state():
+            origin = origin_of(state, self.origins) if self.origins else state
+            hits_by_origin[origin] = hits_by_origin.get(origin, 0) + hits
+        return sorted(hits_by_origin.items(), key=lambda item: -item[1])
+
+    def report(self, top=20):
+        # text report of the hottest origins, states and transitions
+        total = self.total or 1
+        lines = [f"{self.total} transitions in {self.elapsed:.3f}s"]
+        for title, rows in (("origin", self.by_origin()), ("state", self.by_state()), ("transition", self.by_transition())):
+            lines.append("")
+            lines.append(f"{'hits':>12} {'%':>6}  {title}")
+            for name, hits in rows[:top]:
+                if isinstance(name, tuple):
+                    name = f"{name[0]} reading {name[1]}"
+                lines.append(f"{hits:>12} {100 * hits / total:>6.2f}  {name}")
+        return '\n'.join(lines)
+
+    def save(self, filepath):
+        # dump the counts (and their roll ups) as JSON
+        with open(filepath, 'w') as f:
+            json.dump({
+                "total": self.total,
+                "elapsed": self.elapsed,
+                "origins": dict(self.by_origin()),
+                "states": dict(self.by_state()),
+                "transitions": [{"state": state, "symbol": symbol, "hits": hits} for (state, symbol), hits in self.by_transition()],
+            }, f, indent=4)
+
+
+def profile_run(tm, max_steps=None, timeout=None, profile=None):
+    """
+    Run a TM on the compiled engine, counting the hits of each transition.
+    tm: the TM to run (its origins are used to roll up the counts)
+    max_steps, timeout: budget of the run (see TM.run)
+    profile: Profile to add the counts to (a new one if not given)
+    Returns (RunResult, Profile)
+    """
+    profile = profile or Profile(tm.origins)
+    compiled = tm.compile()
+    begin = time.perf_counter()
+    tm.state, transitions, counts = compiled.run_profiled(tm.byte_tape, tm.state, max_steps, timeout)
+    profile.add(compiled, counts, time.perf_counter() - begin)
+    return tm.finish_run(compiled.stop_reason(tm.byte_tape, tm.state), transitions, begin), profile
+
+
+if __name__ == "__main__":
+    """
+    Profile the UTM simulating a saved TM (from XML file) on a given input tape
+    Usage: python profiler.py <machine xml filepath> <initial tape> [json report filepath]
+    """
+    import sys
+    from parser import load_from_xml
+    from utm import get_utm, construct_utm_input
+
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python profiler.py <machine xml filepath> <initial tape> [json report filepath]")
+        sys.exit(1)
+
+    target = load_from_xml(sys.argv[1])
+    target.set_tape([c for c in sys.argv[2].strip()])
+    utm = get_utm()
+    utm.set_tape(construct_utm_input(target))
+    result, profile = profile_run(utm)
+    print(result)
+    print(profile.report())
+    if len(sys.argv) == 4:
+        profile.save(sys.argv[3])
@@ -3,18 +3,80 @@
 # but would support composing multiple TMs more naturally
 # I used super transitions as the fastest way to get a working UTM for my course project
 
-from tm import TM, Transition, RIGHT, LEFT
+from tm import TM, Transition, HaltException, NonHaltingException, RIGHT, LEFT, MISSING_TRANSITION
 from parser import load_from_xml
 import random
 
+# {(SuperTransition class, template parameters): (template transitions, first state)} of every template built so far (see SuperTransition.assemble)
+templates = {}
+
+def instantiate(template, prefix, state_to):
+    """
+    Transitions of a subroutine from its template, by prefixing its state names and sending it to the return state.
+    template: {state: {symbol: Transition}}, with state names relative to the prefix and None for the return state
+    """
+    transitions = {}
+    for state_from, row in template.items():
+        transitions[state_to if state_from is None else prefix + state_from] = {
+            symbol: Transition(state_to if transition.state_to is None else prefix + transition.state_to, transition.symbol_to_write, transition.direction)
+            for symbol, transition in row.items()
+        }
+    return transitions
+
+class SubroutineHalted(HaltException):
+    """
+    Raised by SuperTransition.execute when the subroutine halts before reaching its return state, as its compiled form would.
+    state: name of the state of the assembled subroutine it halts in
+    steps: transitions it took
+    reason: why it halted (see tm.RunResult)
+    """
+    def __init__(self, message, state, steps, reason):
+        super().__init__(message, steps, reason)
+        self.state = state
+
 class SuperTransition:
     def __init__(self, state_to, prefix=None):
         self.state_to = state_to
         self.prefix = prefix or str(random.randint(0, 1000000))
 
+    def template_parameters(self):
+        # parameters the template of the subroutine depends on (everything but the prefix and the return state)
+        raise NotImplementedError("This method should be implemented in subclasses")
+
+    def build_template(self):
+        """
+        Transitions of the subroutine without a prefix, with None as the return state.
+        Returns (template transitions, name of the first state)
+        """
+        raise NotImplementedError("This method should be implemented in subclasses")
+
     def assemble(self):
         # return a dictionary of transitons and the name of the first state
-        raise NotImplementedError("This method should be implemented in subclasses")
+        # the template is built once per parameters, and each assembly only relabels its states
+        key = (type(self), self.template_parameters())
+        if key not in templates:
+            templates[key] = self.build_template()
+        template, first_state = templates[key]
+        return instantiate(template, self.prefix, self.state_to), self.prefix + first_state
+
+    def execute(self, tape):
+        """
+        Perform the subroutine directly on a ByteTape (with the head where the super transition is taken), without compiling it into the TM.
+        Returns the number of transitions the assembled subroutine takes (not counting the transition into its first state).
+        Raises SubroutineHalted if the assembled subroutine would halt before it returns (e.g. on a symbol it has no transition for),
+        and NonHaltingException if it would never return.
+        By default this runs the assembled transitions with the compiled engine; subclasses override it with native implementations.
+        """
+        compiled = getattr(self, 'compiled', None)
+        if compiled is None:
+            from engine import CompiledTM
+            transitions, self.first_state = self.assemble()
+            compiled = self.compiled = CompiledTM(TM(transitions, self.first_state, empty_symbol=tape.empty_symbol))
+        state, transitions = compiled.run(tape, self.first_state)
+        if state != self.state_to:
+            raise SubroutineHalted(f"Subroutine halted in state {state} before reaching its return state {self.state_to}",
+                                   state, transitions, compiled.stop_reason(tape, state))
+        return transitions
     
 class TwoToFourSymbolExpansion(SuperTransition):
     """
@@ -30,22 +92,23 @@ class TwoToFourSymbolExpansion(SuperTransition):
         super().__init__(state_to, prefix)
         self.return_state = state_to  # alias for clarity
 
-    def assemble(self):
+    def template_parameters(self):
+        return ()
+
+    def build_template(self):
         # we already have this subroutine developed as an XML file
         # that considers '1' to be the start state and '0' to be the end state
         tm = load_from_xml("subroutines/two_to_four_symbol_expansion.xml")
 
-        # add prefix to all internal states and move transitions to the '0' (end) state to go to the return state
-        new_transitions = {}
+        # transitions to the '0' (end) state go to the return state
+        template = {}
         for state_from, transitions in tm.transitions.items():
-            new_transitions[self.prefix + state_from] = {}
+            template[state_from] = {}
             for symbol, transition in transitions.items():
-                if transition.state_to == '0':
-                    new_transitions[self.prefix + state_from][symbol] = Transition(self.return_state, transition.symbol_to_write, transition.direction)
-                else:
-                    new_transitions[self.prefix + state_from][symbol] = Transition(self.prefix + transition.state_to, transition.symbol_to_write, transition.direction)
+                state_to = None if transition.state_to == '0' else transition.state_to
+                template[state_from][symbol] = Transition(state_to, transition.symbol_to_write, transition.direction)
+        return template, '1'
 
-        return new_transitions, self.prefix + '1'
     
 class FourToTwoSymbolDecode(SuperTransition):
     """
@@ -63,21 +126,23 @@ class FourToTwoSymbolDecode(SuperTransition):
         super().__init__(state_to, prefix)
         self.return_state = state_to  # alias for clarity
 
-    def assemble(self):
+    def template_parameters(self):
+        return ()
+
+    def build_template(self):
         # we already have this subroutine developed as an XML file
         # that considers '1' to be the start state and '0' to be the end state
         tm = load_from_xml("subroutines/four_to_two_symbol_decode.xml")
 
-        # add prefix to all internal states and move transitions to the '0' (end) state to go to the return state
-        new_transitions = {}
+        # transitions to the '0' (end) state go to the return state
+        template = {}
         for state_from, transitions in tm.transitions.items():
-            new_transitions[self.prefix + state_from] = {}
+            template[state_from] = {}
             for symbol, transition in transitions.items():
-                if transition.state_to == '0':
-                    new_transitions[self.prefix + state_from][symbol] = Transition(self.return_state, transition.symbol_to_write, transition.direction)
-                else:
-                    new_transitions[self.prefix + state_from][symbol] = Transition(self.prefix + transition.state_to, transition.symbol_to_write, transition.direction)
-        return new_transitions, self.prefix + '1'
+                state_to = None if transition.state_to == '0' else transition.state_to
+                template[state_from][symbol] = Transition(state_to, transition.symbol_to_write, transition.direction)
+        return template, '1'
+
     
 
 class MoveUntil(SuperTransition):
@@ -97,28 +162,51 @@ class MoveUntil(SuperTransition):
         self.overshoot = overshoot
         self.all_symbols = all_symbols
 
-    def assemble(self):
+    def template_parameters(self):
+        return (self.target_symbol, self.direction, self.overshoot, tuple(self.all_symbols))
+
+    def build_template(self):
         transitions = {
-            self.state_to: {},
-            self.prefix + '1' : {},
+            None: {},
+            '1' : {},
         }
         for symbol in self.all_symbols:
             if symbol == self.target_symbol:
                 continue
-            transitions[self.prefix + '1'][symbol] = Transition(self.prefix + '1', symbol, self.direction)
+            transitions['1'][symbol] = Transition('1', symbol, self.direction)
 
         reverse_direction = LEFT if self.direction == RIGHT else RIGHT
 
         if self.overshoot == -1:
-            transitions[self.prefix + '1'][self.target_symbol] = Transition(self.state_to, self.target_symbol, reverse_direction)
+            transitions['1'][self.target_symbol] = Transition(None, self.target_symbol, reverse_direction)
         elif self.overshoot == 1:
-            transitions[self.prefix + '1'][self.target_symbol] = Transition(self.state_to, self.target_symbol, self.direction)
+            transitions['1'][self.target_symbol] = Transition(None, self.target_symbol, self.direction)
         elif self.overshoot == 0:
-            transitions[self.prefix + '1'][self.target_symbol] = Transition(self.state_to, None, None)
+            transitions['1'][self.target_symbol] = Transition(None, None, None)
         else:
             raise Exception("Invalid overshoot value")
         
-        return transitions, self.prefix + '1'
+        return transitions, '1'
+
+    def execute(self, tape):
+        # the assembled subroutine moves over the symbols of all_symbols until the target, and halts on any other symbol
+        others = set(self.all_symbols) - {self.target_symbol}
+        sign = 1 if self.direction == RIGHT else -1
+        distance = tape.find(self.target_symbol, self.direction)
+        unlisted = tape.find_unlisted(others, self.direction, distance)
+        if unlisted is not None:
+            distance = unlisted
+        elif distance is None:
+            # it moves over blank cells forever
+            from engine import Loop
+            loop = Loop('translated', self.prefix + '1', 0, 1, sign)
+            raise NonHaltingException(f"MoveUntil never finds '{self.target_symbol}' moving {self.direction}", loop)
+        tape.move(sign * distance)
+        if tape.read() != self.target_symbol:
+            raise SubroutineHalted(f"MoveUntil halted on '{tape.read()}', which is not one of its symbols", self.prefix + '1', distance, MISSING_TRANSITION)
+        tape.write(self.target_symbol)
+        tape.move(sign * self.overshoot)
+        return distance + 1
     
 class MoveUntilRepeat(SuperTransition):
     """
@@ -136,24 +224,42 @@ class MoveUntilRepeat(SuperTransition):
         self.n = n
         self.all_symbols = all_symbols
 
-    def assemble(self):
+    def template_parameters(self):
+        return (self.target_symbol, self.n, self.direction, tuple(self.all_symbols))
+
+    def build_template(self):
         transitions = {
-            self.state_to: {},
+            None: {},
         }
         for i in range(1, self.n+1):
-            transitions[self.prefix + str(i)] = {}
+            transitions[str(i)] = {}
             for symbol in self.all_symbols:
                 if i == self.n:
-                    transitions[self.prefix + str(i)][symbol] = MoveUntil(self.state_to, self.target_symbol, self.direction, overshoot=0, prefix=self.prefix + str(i) + '_', all_symbols=self.all_symbols)
+                    transitions[str(i)][symbol] = MoveUntil(None, self.target_symbol, self.direction, overshoot=0, prefix=str(i) + '_', all_symbols=self.all_symbols)
                 else:
-                    transitions[self.prefix + str(i)][symbol] = MoveUntil(self.prefix + str(i + 1), self.target_symbol, self.direction, overshoot=1, prefix=self.prefix + str(i) + '_', all_symbols=self.all_symbols)
+                    transitions[str(i)][symbol] = MoveUntil(str(i + 1), self.target_symbol, self.direction, overshoot=1, prefix=str(i) + '_', all_symbols=self.all_symbols)
         
         # assembler output cannot contain supertransitions
         from compiler import compile_super_transitions
-        tmp = TM(transitions, self.prefix + '1')
+        tmp = TM(transitions, '1')
         tmp = compile_super_transitions(tmp)
 
         return tmp.transitions, tmp.state
+
+    def execute(self, tape):
+        transitions = 0
+        for i in range(1, self.n + 1):
+            overshoot = 0 if i == self.n else 1
+            # each repetition is entered by a transition that does not write or move (only on the symbols of all_symbols)
+            if tape.read() not in self.all_symbols:
+                raise SubroutineHalted(f"MoveUntilRepeat halted on '{tape.read()}', which is not one of its symbols", self.prefix + str(i), transitions, MISSING_TRANSITION)
+            tape.write(tape.read())
+            try:
+                transitions += 1 + MoveUntil(self.state_to, self.target_symbol, self.direction, overshoot, prefix=self.prefix + str(i) + '_', all_symbols=self.all_symbols).execute(tape)
+            except SubroutineHalted as e:
+                e.steps += transitions + 1
+                raise
+        return transitions
             
 class MoveFixed(SuperTransition):
     """
@@ -169,16 +275,30 @@ class MoveFixed(SuperTransition):
         self.direction = direction
         self.all_symbols = all_symbols
 
-    def assemble(self):
+    def template_parameters(self):
+        return (self.distance, self.direction, tuple(self.all_symbols))
+
+    def build_template(self):
         transitions = {}
         
         for i in range(1, self.distance+1):
-            transitions[self.prefix + str(i)] = {}
+            transitions[str(i)] = {}
             for symbol in self.all_symbols:
                 if i == self.distance:
-                    transitions[self.prefix + str(i)][symbol] = Transition(self.state_to, symbol, self.direction)
+                    transitions[str(i)][symbol] = Transition(None, symbol, self.direction)
                 else:
-                    transitions[self.prefix + str(i)][symbol] = Transition(self.prefix + str(i + 1), symbol, self.direction)
+                    transitions[str(i)][symbol] = Transition(str(i + 1), symbol, self.direction)
         
-        return transitions, self.prefix + '1'
+        return transitions, '1'
+
+    def execute(self, tape):
+        # the assembled subroutine halts on the first symbol that is not in all_symbols
+        sign = 1 if self.direction == RIGHT else -1
+        unlisted = tape.find_unlisted(self.all_symbols, self.direction, self.distance)
+        if unlisted is not None:
+            tape.move(sign * unlisted)
+            raise SubroutineHalted(f"MoveFixed halted on '{tape.read()}', which is not one of its symbols", self.prefix + str(unlisted + 1), unlisted, MISSING_TRANSITION)
+        tape.move(sign * self.distance)
+        return self.distance
+
     
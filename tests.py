@@ -1,5 +1,5 @@
-from tm import TM, Transition, HaltException
-from parser import load_from_xml, save_to_xml
+from tm import TM, Transition, HaltException, HALTED, MISSING_TRANSITION, BUDGET_EXHAUSTED, NON_HALTING, ERROR
+from parser import load_from_xml, save_to_xml, save_to_binary, load_from_binary, load_compiled_from_binary, load_compiled_from_xml
 from subroutine import *
 from compiler import *
 from utm import *
@@ -47,6 +47,30 @@ def test_draw():
     TM(transitions=None, start_state='1', tape=tape, head_idx=7).draw(max_tape_length=5)
 
 
+def test_byte_tape():
+    tm = TM(transitions=None, start_state='1', tape=['1', '0', '1'], head_idx=1)
+
+    # moving past either end grows the tape with empty symbols
+    for _ in range(40):
+        tm.move_left()
+    tm.write('1')
+    for _ in range(80):
+        tm.move_right()
+    assert len(tm.tape) == 80
+    assert tm.tape[0] == '1' and tm.tape[39:42] == ['1', '0', '1']
+    assert tm.head_idx == 80
+
+    # the stack API still works on top of the byte tape
+    assert tm.r_tape.peek() == '0'
+    assert tm.l_tape.peek() == '0'
+    tm.l_tape.push('1')
+    assert tm.head_idx == 81 and tm.l_tape.peek() == '1'
+
+    with tm.byte_tape.window(39, 42) as window:
+        assert window.tobytes() == b'101'
+    assert tm.byte_tape.text(39, 42) == '101'
+
+
 def test_load_xml():
     filepath = "examples/shift_right_tm.xml"
     tm = load_from_xml(filepath)
@@ -59,6 +83,115 @@ def test_load_xml():
     assert tm.tape == ['0', '0', '1', '1', '0', '1']
     assert tm.head_idx == 2
 
+def test_load_compiled_from_xml():
+    # loading straight into the fast engine gives the same machine as compiling the loaded TM
+    from tm import ByteTape
+    for filepath, tape in (("examples/shift_right_tm.xml", "1101"), ("examples/add_tm.xml", "1110111"), ("utm.xml", "")):
+        tm = load_from_xml(filepath)
+        compiled, start_state = load_compiled_from_xml(filepath)
+        assert start_state == tm.state
+        assert compiled.states[:len(tm.transitions)] == list(tm.transitions)
+        for state, transitions in tm.transitions.items():
+            for symbol, transition in transitions.items():
+                i = compiled.state_ids[state] * compiled.num_symbols + compiled.symbol_ids[symbol]
+                assert compiled.states[compiled.next_state[i]] == transition.state_to
+                assert compiled.symbols[compiled.write[i]] == (transition.symbol_to_write or symbol)
+        if tape:
+            tm.set_tape(list(tape))
+            tm.run()
+            byte_tape = ByteTape(list(tape))
+            assert compiled.run(byte_tape, start_state)[0] == tm.state
+            assert byte_tape.symbols() == tm.tape
+
+def test_cache():
+    # machines are cached under a hash of what they are built from, each hit is a new copy, and old entries are evicted
+    import os
+    import tempfile
+    import cache
+    default_dir = cache.CACHE_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        cache.CACHE_DIR = directory
+        try:
+            tm = load_from_xml("examples/add_tm.xml")
+            assert len(os.listdir(directory)) == 1
+            cached_tm = load_from_xml("examples/add_tm.xml")
+            assert len(os.listdir(directory)) == 1
+            assert cached_tm is not tm and list(cached_tm.transitions) == list(tm.transitions)
+            for machine in (tm, cached_tm):
+                machine.set_tape(['1', '1', '0', '1'])
+                machine.run()
+            assert cached_tm.tape == tm.tape
+
+            utm = get_utm()
+            assert get_utm().transitions.keys() == utm.transitions.keys()
+            count = len(os.listdir(directory))
+            assert count >= 2
+
+            # changes to the code the machines are built by change their keys
+            import parser
+            parser_sources = parser.PARSER_SOURCES
+            source = os.path.join(directory, "source.py")
+            try:
+                for version in ("1", "2"):
+                    with open(source, 'w') as f:
+                        f.write(version)
+                    cache.sources_hash.cache_clear()
+                    parser.PARSER_SOURCES = parser_sources + [source]
+                    load_from_xml("examples/add_tm.xml")
+            finally:
+                parser.PARSER_SOURCES = parser_sources
+                cache.sources_hash.cache_clear()
+                os.remove(source)
+            assert sum(name.endswith(cache.CACHE_SUFFIX) for name in os.listdir(directory)) == count + 2
+
+            # a corrupted entry is rebuilt
+            for filename in os.listdir(directory):
+                with open(os.path.join(directory, filename), 'wb') as f:
+                    f.write(b'corrupted')
+            assert list(load_from_xml("examples/add_tm.xml").transitions) == list(tm.transitions)
+
+            cache.evict(0)
+            assert os.listdir(directory) == []
+        finally:
+            cache.CACHE_DIR = default_dir
+
+
+def test_iter_steps():
+    tm = load_from_xml("examples/shift_right_tm.xml")
+    tm.set_tape(['1', '1', '0', '1'])
+    records = list(tm.iter_steps())
+    assert tm.tape == ['0', '0', '1', '1', '0', '1'] and tm.head_idx == 2
+    assert [record.step for record in records] == list(range(len(records)))
+    assert records[0].state == '1' and records[0].read == '1' and records[0].head_idx == 0
+
+    # sampling and filtering by state
+    tm.set_tape(['1', '1', '0', '1'])
+    tm.state = '1'
+    assert list(tm.iter_steps(every=3)) == records[::3]
+    tm.set_tape(['1', '1', '0', '1'])
+    tm.state = '1'
+    assert list(tm.iter_steps(states=['1'])) == [record for record in records if record.state == '1']
+
+    # traces stream to compressed files and read back the same
+    import os
+    import tempfile
+    from tracefile import write_trace, read_trace
+    with tempfile.TemporaryDirectory() as directory:
+        for filename in ("trace.jsonl.gz", "trace.trace.gz", "trace.trace"):
+            filepath = os.path.join(directory, filename)
+            assert write_trace(iter(records), filepath) == len(records)
+            assert list(read_trace(filepath)) == records
+
+        # including symbols of several characters, or ones that don't fit in a byte
+        tm = TM({'1': {'10': Transition('1', '€', RIGHT), '€': Transition('2', '10', LEFT)}, '2': {}}, tape=['10', '€'])
+        wide_records = list(tm.iter_steps())
+        assert {record.write for record in wide_records} == {'10', '€'}
+        for filename in ("wide.trace", "wide.jsonl"):
+            filepath = os.path.join(directory, filename)
+            write_trace(iter(wide_records), filepath)
+            assert list(read_trace(filepath)) == wide_records
+
+
 def test_save_to_xml():
     tm = load_from_xml("examples/shift_right_tm.xml")
     assert save_to_xml(tm, "examples/shift_right_tm(1).xml")
@@ -71,6 +204,70 @@ def test_save_to_xml():
         assert "TM uses invalid symbols" in str(e)
 
 
+def test_save_to_xml_deterministic():
+    # saving gives the same file every time, loads back the same machine, and groups the states compiled from one high-level state
+    import os
+    import tempfile
+    from parser import layout_states
+    utm = get_utm()
+    with tempfile.TemporaryDirectory() as directory:
+        contents = []
+        for filename in ("utm1.xml", "utm2.xml"):
+            save_to_xml(utm, os.path.join(directory, filename))
+            with open(os.path.join(directory, filename), 'rb') as f:
+                contents.append(f.read())
+        assert contents[0] == contents[1]
+        loaded = load_from_xml(os.path.join(directory, "utm1.xml"), cache=False)
+        assert len(loaded.transitions) == len(utm.transitions)
+
+    positions = layout_states(utm)
+    assert len(set(positions.values())) == len(positions)
+    group = [state for state in utm.transitions if state.startswith('sim_loop_r')]
+    xs = [positions[state][0] for state in group]
+    ys = [positions[state][1] for state in group]
+    assert max(xs) - min(xs) <= 4 * 80 and max(ys) - min(ys) <= 4 * 80
+
+
+def test_binary_format():
+    # a machine saved in the binary format loads back with the same transitions, and runs the same in the fast engine
+    import os
+    import tempfile
+    tm = load_from_xml("utm.xml")
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "utm.tmb")
+        assert save_to_binary(tm, filepath)
+        loaded = load_from_binary(filepath)
+        compiled, start_state = load_compiled_from_binary(filepath)
+
+        # and through the JSON format
+        json_filepath = os.path.join(directory, "utm.json")
+        loaded.save(json_filepath)
+        from_json = TM(transitions={'1': {}})
+        from_json.load(json_filepath)
+
+        # the start state need not have a row
+        filepath = os.path.join(directory, "start.tmb")
+        assert save_to_binary(TM(transitions={'a': {'0': Transition('a', '1', RIGHT)}}, start_state='s'), filepath)
+        no_row = load_from_binary(filepath)
+        assert no_row.state == 's' and list(no_row.transitions) == ['a']
+        assert load_compiled_from_binary(filepath)[1] == 's'
+
+    transitions = {state: {symbol: str(t) for symbol, t in row.items()} for state, row in tm.transitions.items()}
+    assert {state: {symbol: str(t) for symbol, t in row.items()} for state, row in loaded.transitions.items()} == transitions
+    assert {state: {symbol: str(t) for symbol, t in row.items()} for state, row in from_json.transitions.items()} == transitions
+    assert loaded.state == start_state == tm.state
+
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1
+    utm_input = construct_utm_input(target)
+    tm.set_tape(list(utm_input))
+    expected = tm.run_compiled()
+    tm.set_tape(list(utm_input))
+    tm.state = start_state
+    assert compiled.run(tm.byte_tape, start_state)[1] == expected.steps
+    assert "1111" == ''.join(tm.tape).strip('0')
+
+
 def test_two_to_four_symbol_expansion():
     transitions, entry_state = TwoToFourSymbolExpansion('0', '2to4_').assemble()
     transitions['0'] = {}
@@ -102,6 +299,49 @@ def test_four_to_two_symbol_expansion():
     assert '101' in ''.join(tm.tape)
 
 
+def test_frozen_tm():
+    # a frozen machine runs the same, can't be changed, and shares its rows with other frozen machines and with compiler passes over it
+    from frozen import freeze, FrozenTM
+    tm = load_from_xml("examples/add_tm.xml")
+    frozen = freeze(tm)
+    other = freeze(load_from_xml("examples/add_tm.xml"))
+    assert all(frozen.transitions[state] is other.transitions[state] for state in frozen.transitions)
+
+    for machine in (tm, frozen):
+        machine.set_tape(['1', '1', '1', '0', '1', '1'])
+    tm.run()
+    frozen.run()
+    assert frozen.tape == tm.tape and frozen.state == tm.state
+
+    try:
+        frozen.transitions['1']['1'].state_to = '2'
+        assert False
+    except AttributeError:
+        pass
+    try:
+        frozen.transitions['1']['1'] = Transition('2', None, RIGHT)
+        assert False
+    except TypeError:
+        pass
+
+    compiled = quintuple_to_quadruple(other)
+    assert isinstance(compiled, FrozenTM)
+    assert any(compiled.transitions[state] is row for state, row in other.transitions.items())
+    compiled.set_tape(['1', '1', '1', '0', '1', '1'])
+    compiled.run()
+    assert compiled.tape == tm.tape
+
+    # the interned rows and transitions are only kept alive by the machines that use them
+    import gc
+    import pickle
+    import frozen as frozen_module
+    loaded = pickle.loads(pickle.dumps(compiled))
+    assert all(loaded.transitions[state] is row for state, row in compiled.transitions.items())
+    del frozen, other, compiled, loaded, machine
+    gc.collect()
+    assert len(frozen_module.interned_rows) == len(frozen_module.interned_transitions) == 0
+
+
 def test_quintuple_to_quadruple():
     transitions = {
         '1': {
@@ -140,6 +380,103 @@ def test_move_until():
     tm.run()
     tm.draw()
 
+def test_link_super_transitions():
+    # the same subroutine with the same return state is assembled once, and the machine still runs the same
+    transitions = {
+        '1': {symbol: MoveUntil('2', '#', RIGHT) for symbol in ('0', '1')},
+        '2': {'#': MoveFixed('3', 2, LEFT), '0': MoveFixed('3', 2, LEFT)},
+        '3': {},
+    }
+    linked = compile_super_transitions(TM(transitions), link=True)
+    copies = compile_super_transitions(TM(transitions), link=False)
+    assert len(copies.transitions) - len(linked.transitions) == 3
+    for tm in (linked, copies):
+        tm.set_tape(['0', '1', '1', '#', '0'])
+        tm.run()
+    assert linked.tape == copies.tape and linked.head_idx == copies.head_idx and linked.state == copies.state == '3'
+
+    # the linked copies are not assembled, but counted in what linking saved
+    import contextlib
+    import io
+    assembled = []
+    class CountedMoveUntil(MoveUntil):
+        def assemble(self):
+            assembled.append(self)
+            return super().assemble()
+    transitions['1'] = {symbol: CountedMoveUntil('2', '#', RIGHT) for symbol in ('0', '1')}
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        compile_super_transitions(TM(transitions), verbose=True)
+    assert len(assembled) == 1
+    saved_transitions = sum(map(len, copies.transitions.values())) - sum(map(len, linked.transitions.values()))
+    assert f"saved 3 states and {saved_transitions} transitions" in output.getvalue()
+
+def test_minimize_states():
+    # '2' and '3' behave the same (as do '4' and '5'), '6' can't be reached, and the halt states keep their names
+    transitions = {
+        '1': {'0': Transition('2', '1', RIGHT), '1': Transition('3', '0', RIGHT)},
+        '2': {'0': Transition('4', '1', RIGHT), '1': Transition('2', '1', RIGHT)},
+        '3': {'0': Transition('5', '1', RIGHT), '1': Transition('3', '1', RIGHT)},
+        '4': {'0': Transition('H', '1', LEFT), '1': Transition('4', '0', RIGHT)},
+        '5': {'0': Transition('H', '1', LEFT), '1': Transition('5', '0', RIGHT)},
+        '6': {'0': Transition('2', '0', RIGHT)},
+        'H': {},
+    }
+    reachable = remove_unreachable_states(TM(transitions))
+    assert '6' not in reachable.transitions and len(reachable.transitions) == 6
+    minimized = minimize_states(reachable)
+    assert sorted(minimized.transitions) == ['1', '2', '4', 'H']
+    for tape in (['0', '1', '1', '0'], ['1', '1', '0', '1', '1']):
+        original, tm = TM(transitions), TM(minimized.transitions, minimized.state)
+        original.set_tape(tape)
+        tm.set_tape(tape)
+        original.run()
+        tm.run()
+        assert tm.tape == original.tape and tm.head_idx == original.head_idx and tm.state == original.state == 'H'
+
+def test_fuse_transitions():
+    # fusing undoes quintuple_to_quadruple: each write-only transition and the move after it become one transition again
+    transitions = {
+        '1': {'0': Transition('2', '1', RIGHT), '1': Transition('1', '1', RIGHT)},
+        '2': {'0': Transition('3', '1', LEFT), '1': Transition('2', '0', None)},
+        '3': {},
+    }
+    tm = TM(transitions, tape=['1', '0', '1', '0'])
+    quadruple = quintuple_to_quadruple(TM(transitions))
+    fused = remove_unreachable_states(fuse_transitions(quadruple))
+    assert sorted(fused.transitions) == ['1', '2', '3']
+    assert fused.transitions['1']['0'].to_dict() == {'s': '2', 'w': '1', 'm': RIGHT}
+    # the write of the symbol that was read is dropped, and '2' on '1' is fused with '2' on '0'
+    assert fused.transitions['1']['1'].symbol_to_write is None
+    assert fused.transitions['2']['1'].to_dict() == {'s': '3', 'w': None, 'm': LEFT}
+
+    steps = [tm.run().steps]
+    for other in (quadruple, fused):
+        other.set_tape(['1', '0', '1', '0'])
+        steps.append(other.run().steps)
+        assert other.tape == tm.tape and other.head_idx == tm.head_idx and other.state == tm.state == '3'
+    assert steps == [4, 6, 3]
+
+    compiled = TM(transitions, tape=['1', '0', '1', '0'])
+    assert compiled.run_compiled(compiled.compile(fuse=True)).steps == 3
+    assert compiled.tape == tm.tape and compiled.state == '3'
+
+def test_subroutine_templates():
+    # each subroutine is built once per parameters, and assembled by relabeling the template's states
+    import subroutine
+    first, first_state = MoveUntilRepeat('a', '@', 2, RIGHT, prefix='x_').assemble()
+    second, second_state = MoveUntilRepeat('b', '@', 2, RIGHT, prefix='y_').assemble()
+    assert (first_state, second_state) == ('x_1', 'y_1')
+    assert list(second) == ['b' if state == 'a' else 'y_' + state[2:] for state in first]
+    assert first['x_2_1']['@'].state_to == 'a' and second['y_2_1']['@'].state_to == 'b'
+    assert first['x_1']['0'] is not second['y_1']['0']
+
+    TwoToFourSymbolExpansion('2', prefix='p_').assemble()
+    count = len(subroutine.templates)
+    transitions, first_state = TwoToFourSymbolExpansion('3', prefix='q_').assemble()
+    assert len(subroutine.templates) == count and first_state == 'q_1'
+    assert any(transition.state_to == '3' for row in transitions.values() for transition in row.values())
+
 def test_construct_utm_input():
     transitions = {
         '0': {},
@@ -173,6 +510,24 @@ def test_utm():
 
     assert "1111" == (''.join(utm.tape)).strip('0')
 
+def test_indexed_utm():
+    # the indexed UTM (binary state indices) leaves the same user tape as the UTM, and keeps the simulated head
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1
+    utm = get_utm(indexed=True)
+    utm.set_tape(construct_indexed_utm_input(target))
+    utm.run()
+    tape, head_idx = decode_indexed_utm_output(utm.tape, utm.head_idx)
+    assert "1111" == ''.join(tape).strip('0')
+
+    target = load_from_xml("examples/shift_copy_tm.xml")
+    target.set_tape(['1', '1', '1'])
+    utm = get_utm(four_symbol_mode=True, native=True, indexed=True)
+    utm.set_tape(construct_indexed_utm_input(target, encode=False))
+    utm.run()
+    target.run()
+    assert decode_indexed_utm_output(utm.tape, utm.head_idx, encoded=False) == (target.tape, target.head_idx)
+
 def test_utm_file():
     # verify that the saved UTM file produces a TM that works as a UTM
     target = load_from_xml("examples/shift_copy_tm.xml")
@@ -184,6 +539,399 @@ def test_utm_file():
     assert "1110111" == (''.join(utm.tape)).strip('0')
 
 
+def test_emulate_utm():
+    # the emulated UTM leaves the same tape, head and state as utm.xml (but without the blanks it visits right of the result)
+    from emulate import emulate_utm, run_utm, run_utm_jobs, decode_utm_input, trimmed
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1, which moves left of the user tape at the end
+    utm_input = construct_utm_input(target)
+    run = emulate_utm(utm_input)
+    assert run.emulated and run.steps is None and run.state == '0'
+    assert "1111" == ''.join(run.tape).strip('0') and run.tape[run.head_idx] == '1'
+
+    utm = load_from_xml("utm.xml")
+    utm.set_tape(utm_input)
+    result = utm.run_compiled()
+    assert (trimmed(utm.tape, utm.head_idx), utm.head_idx, utm.state) == (run.tape, run.head_idx, run.state)
+    checked = run_utm(utm_input, strict=True)
+    assert checked.checked and checked.steps == result.steps and checked.tape == run.tape
+
+    # the UTM can't decode a tape without a '1', so it is run for real
+    target.set_tape(['1'])
+    run = run_utm(construct_utm_input(target))
+    assert not run.emulated and run.steps > 0 and run.state != '0'
+
+    try:
+        decode_utm_input("110111101")  # missing the next state of the second transition
+        assert False
+    except ValueError:
+        pass
+
+    utm_inputs = []
+    results = []
+    for tape in (['1'], ['1', '1'], ['1', '0', '1']):
+        target = load_from_xml("examples/shift_copy_tm.xml")
+        target.set_tape(tape)
+        utm_inputs.append(construct_utm_input(target))
+        target.run()
+        results.append(''.join(target.tape).strip('0'))
+    runs = list(run_utm_jobs(utm_inputs, strict=True, sample=1))
+    assert all(run.checked and run.steps > 0 for run in runs)
+    assert [''.join(run.tape).strip('0') for run in runs] == results
+
+
+def test_stream_utm_input():
+    import io
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])
+    utm_input = ''.join(construct_utm_input(target))
+    buffer = bytearray()
+    assert write_utm_input(target, buffer) == len(utm_input)
+    text, binary = io.StringIO(), io.BytesIO()
+    write_utm_input(target, text)
+    write_utm_input(target, binary)
+    assert buffer.decode() == text.getvalue() == binary.getvalue().decode() == utm_input
+
+    utm = load_from_xml("utm.xml")
+    utm.set_tape(list(utm_input))
+    utm.run_compiled()
+    assert decode_utm_output(utm.tape, utm.head_idx) == (['1', '1', '1', '1'], 0)
+    with utm.byte_tape.window() as window:
+        tape, head_idx = decode_utm_output(window, utm.head_idx)
+        assert (bytes(tape), head_idx) == (b'1111', 0)
+    assert decode_utm_output("0001001000", 6) == ("1001", 3)
+
+
+def test_run_compiled():
+    # the compiled engine should leave the TM in the same configuration as the simple interpreter
+    for filepath, tape in (("examples/shift_right_tm.xml", "1101"), ("examples/add_tm.xml", "1110111"), ("examples/copy_tm.xml", "111")):
+        tm = load_from_xml(filepath)
+        tm.set_tape([c for c in tape])
+        tm.run()
+
+        fast_tm = load_from_xml(filepath)
+        fast_tm.set_tape([c for c in tape])
+        fast_tm.run_compiled()
+
+        assert fast_tm.tape == tm.tape
+        assert fast_tm.head_idx == tm.head_idx
+        assert fast_tm.state == tm.state
+
+
+def test_compile_to_python():
+    # the generated code runs the same as the compiled engine, and is only generated once per machine
+    import os
+    import tempfile
+    from codegen import compile_to_python
+    with tempfile.TemporaryDirectory() as directory:
+        for filepath, tape in (("examples/shift_right_tm.xml", "1101"), ("examples/add_tm.xml", "1110111"), ("examples/copy_tm.xml", "111")):
+            tm = load_from_xml(filepath)
+            tm.set_tape([c for c in tape])
+            expected = tm.run_compiled()
+
+            generated = compile_to_python(tm, cache_dir=directory)
+            fast_tm = load_from_xml(filepath)
+            fast_tm.set_tape([c for c in tape])
+            result = fast_tm.run_compiled(generated)
+            assert (fast_tm.tape, fast_tm.head_idx, fast_tm.state, result.steps) == (tm.tape, tm.head_idx, tm.state, expected.steps)
+
+            # a step budget stops after exactly that many steps
+            fast_tm.set_tape([c for c in tape])
+            fast_tm.state = load_from_xml(filepath).state
+            result = fast_tm.run_compiled(generated, max_steps=5)
+            assert result.reason == BUDGET_EXHAUSTED and result.steps == 5
+        assert len(os.listdir(directory)) == 3
+
+        # a hit reuses the module (a new one would be a new file) and marks it as used for cache.evict
+        module_path = os.path.join(directory, os.listdir(directory)[0])
+        os.utime(module_path, (0, 0))
+        inode = os.stat(module_path).st_ino
+        for filepath in ("examples/shift_right_tm.xml", "examples/add_tm.xml", "examples/copy_tm.xml"):
+            compile_to_python(load_from_xml(filepath), cache_dir=directory)
+        assert len(os.listdir(directory)) == 3
+        assert os.stat(module_path).st_ino == inode and os.path.getmtime(module_path) > 0
+
+        # the modules go to cache.CACHE_DIR by default, which TM_CACHE_DIR can move out of the sources
+        import cache
+        import subprocess
+        import sys
+        default_dir, dont_write_bytecode = cache.CACHE_DIR, sys.dont_write_bytecode
+        cache.CACHE_DIR = os.path.join(directory, "default")
+        sys.dont_write_bytecode = False
+        try:
+            compile_to_python(load_from_xml("examples/add_tm.xml"))
+            assert sum(name.endswith('.py') for name in os.listdir(cache.CACHE_DIR)) == 1
+
+            # the modules and their bytecode are entries of the cache, which evict and clear delete
+            assert os.listdir(os.path.join(cache.CACHE_DIR, "__pycache__"))
+            cache.clear()
+            assert os.listdir(cache.CACHE_DIR) == []
+        finally:
+            cache.CACHE_DIR, sys.dont_write_bytecode = default_dir, dont_write_bytecode
+        for value, expected in ((directory, repr(directory)), ("", "None")):
+            output = subprocess.run([sys.executable, "-c", "import cache; print(repr(cache.CACHE_DIR))"],
+                                    env=dict(os.environ, TM_CACHE_DIR=value), capture_output=True, text=True, check=True)
+            assert output.stdout.strip() == expected
+
+        # a directory that can't be written to only skips caching
+        not_a_directory = os.path.join(directory, "file")
+        open(not_a_directory, 'w').close()
+        tm, fast_tm = load_from_xml("examples/add_tm.xml"), load_from_xml("examples/add_tm.xml")
+        for machine in (tm, fast_tm):
+            machine.set_tape(['1', '1', '0', '1'])
+        tm.run_compiled()
+        fast_tm.run_compiled(compile_to_python(fast_tm, cache_dir=os.path.join(not_a_directory, "cache")))
+        assert fast_tm.tape == tm.tape
+
+
+def test_sweeps():
+    # scanning with a binary-compiled MoveUntil crosses 2-cell blocks, which sweeps should skip without changing the step count
+    from engine import CompiledTM
+    transitions = {
+        '1': {symbol: MoveUntil('2', '@', LEFT, prefix='scan_') for symbol in ('0', '1', '#', '@')},
+        '2': {},
+    }
+    tm = four_to_two_symbols(compile_super_transitions(TM(transitions)))
+    tape = [c for c in '10' + '01' * 100 + '11' * 100]
+    compiled = CompiledTM(tm)
+
+    results = []
+    for sweeps in (False, True):
+        tm.set_tape(tape, head_idx=len(tape) - 2)
+        state, steps = compiled.run(tm.byte_tape, '1', sweeps=sweeps)
+        results.append((tm.tape, tm.head_idx, state, steps))
+    assert results[0] == results[1]
+    assert results[1][1] == 0
+    assert any(entries for entries in compiled.sweeps)
+
+
+def test_native_super_transitions():
+    # running the 4-symbol UTM with natively executed SuperTransitions should match running its compiled form
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1
+    utm_input = construct_utm_input(target)
+
+    results = []
+    for native in (False, True):
+        utm = get_utm(four_symbol_mode=True, native=native)
+        utm.set_tape(list(utm_input))
+        transitions = 0
+        while True:
+            try:
+                transitions += utm.step()
+            except HaltException:
+                break
+        results.append((utm.tape, utm.head_idx, utm.state, transitions))
+    assert results[0] == results[1]
+    assert "1111" == ''.join(results[1][0]).strip('#0')
+
+    # subroutines without a native implementation run their assembled transitions
+    tm = TM({'1': {'1': FourToTwoSymbolDecode('0')}, '0': {}}, tape=['1', '1', '0', '1', '1', '1'])
+    assert tm.step() > 1
+    assert tm.state == '0'
+    assert '101' in ''.join(tm.tape)
+
+    # native subroutines stop where their compiled form does, including on symbols that are not in all_symbols
+    symbols = ('0', '1', '#')
+    for super_transition, tape, head_idx in [
+        (MoveUntil('2', '#', RIGHT, all_symbols=symbols), '110x1#', 0),
+        (MoveUntil('2', '#', LEFT, overshoot=-1, all_symbols=symbols), '#x011', 4),
+        (MoveUntilRepeat('2', '#', 2, RIGHT, all_symbols=symbols), '11#1x1#', 0),
+        (MoveUntilRepeat('2', '#', 2, RIGHT, all_symbols=symbols), '11#x#', 0),
+        (MoveFixed('2', 4, RIGHT, all_symbols=symbols), '11x1#', 0),
+        (MoveFixed('2', 6, RIGHT, all_symbols=('1', '#')), '11', 0),
+        (MoveUntil('2', '#', RIGHT, all_symbols=symbols), '1101#', 0),
+    ]:
+        results = []
+        for compile in (False, True):
+            tm = TM({'1': {'1': super_transition}, '2': {}}, tape=list(tape), head_idx=head_idx)
+            if compile:
+                tm = compile_super_transitions(tm)
+            result = tm.run()
+            results.append((result.reason, result.steps, tm.state, tm.tape, tm.head_idx))
+        assert results[0] == results[1]
+    assert results[0][0] == HALTED
+
+    # a MoveUntil that never finds its target over blank cells never halts
+    result = TM({'1': {'1': MoveUntil('2', '#', RIGHT, all_symbols=symbols)}, '2': {}}, tape=['1', '1']).run()
+    assert result.reason == NON_HALTING and result.loop.shift == 1
+
+    try:
+        get_utm(native=True)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_macro_machine():
+    # running block-to-block should match the compiled engine, including the number of transitions
+    from macro import MacroMachine
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1
+    utm_input = construct_utm_input(target)
+
+    utm = load_from_xml("utm.xml")
+    utm.set_tape(list(utm_input))
+    expected = utm.compile().run(utm.byte_tape, utm.state)
+    expected = (utm.tape, utm.head_idx) + expected
+
+    for block_size in (1, 3, 8):
+        macro = MacroMachine(utm, block_size=block_size)
+        utm.set_tape(list(utm_input))
+        state, steps = macro.run(utm.byte_tape, utm.state)
+        assert (utm.tape, utm.head_idx, state, steps) == expected
+        assert macro.cache_info().hits > macro.cache_info().misses
+
+
+def test_detect_loops():
+    # a machine that bounces between two cells repeats its configuration
+    transitions = {
+        '1': {'0': Transition('2', '1', RIGHT), '1': Transition('2', None, RIGHT)},
+        '2': {'0': Transition('1', None, LEFT)},
+    }
+    loop = TM(transitions, tape=['0']).run(detect_loops=True).loop
+    assert loop.kind == 'cycle' and loop.period == 2 and loop.shift == 0
+
+    # a machine that writes 10 forever drifts right over blank tape
+    transitions = {
+        '1': {'0': Transition('2', '1', RIGHT), '1': Transition('1', None, RIGHT)},
+        '2': {'0': Transition('1', None, RIGHT)},
+    }
+    tm = TM(transitions, tape=['1', '1', '0'])
+    loop = tm.run(detect_loops=True).loop
+    assert loop.kind == 'translated' and loop.shift == 2
+    assert ''.join(tm.tape).startswith('1110')
+
+    # machines that halt are not reported, and leave the same tape as run
+    tm = load_from_xml("examples/add_tm.xml")
+    tm.set_tape(['1', '1', '1', '0', '1', '1'])
+    assert tm.run(detect_loops=True).loop is None
+    assert "1111" == ''.join(tm.tape).strip('0')
+
+
+def test_run_result():
+    transitions = {
+        '1': {'0': Transition('2', '1', RIGHT), '1': Transition('1', None, RIGHT)},
+        '2': {'0': Transition('1', None, RIGHT)},
+    }
+    # runs that never halt stop when their budget runs out, on either engine
+    for run in (TM.run, TM.run_compiled):
+        tm = TM(transitions, tape=['1'])
+        result = run(tm, max_steps=100)
+        assert result.reason == BUDGET_EXHAUSTED and result.steps == 100 and not result.halted
+        assert result.state == tm.state and result.head_idx == tm.head_idx
+
+        tm = TM(transitions, tape=['1'])
+        result = run(tm, timeout=0.05)
+        assert result.reason == BUDGET_EXHAUSTED and result.steps > 0 and result.elapsed >= 0.05
+
+    tm = TM(transitions, tape=['1'])
+    result = tm.run(detect_loops=True)
+    assert result.reason == NON_HALTING and result.loop.shift == 2
+
+    # a budget that runs out before a loop is proven is reported as such
+    tm = load_from_xml("examples/copy_tm.xml")
+    tm.set_tape(['1'] * 30)
+    result = tm.run(max_steps=5, detect_loops=True)
+    assert result.reason == BUDGET_EXHAUSTED and result.steps == 5 and not result.halted
+
+    # a state with no transitions halts the machine, while a state missing a transition for the symbol read is reported
+    for run in (TM.run, TM.run_compiled, lambda tm: tm.run(detect_loops=True)):
+        tm = load_from_xml("examples/add_tm.xml")
+        tm.set_tape(['1', '1', '1', '0', '1', '1'])
+        result = run(tm)
+        assert result.reason == HALTED and result.halted and result.steps > 0
+    assert TM({'1': {'1': Transition('H', None, RIGHT)}}, tape=['1']).run().reason == HALTED
+    assert TM({'1': {'1': Transition('1', None, RIGHT)}}, tape=['1', '#']).run_compiled().reason == MISSING_TRANSITION
+
+    # errors raised while taking a transition end the run
+    result = TM({'1': {'1': SuperTransition('1')}}, tape=['1']).run()
+    assert result.reason == ERROR and result.error
+
+
+def test_arbitrary_symbols():
+    # symbols that don't fit in a byte (longer strings or non-latin-1 characters) are still supported
+    for run in (TM.run, TM.run_compiled, lambda tm: tm.run(detect_loops=True)):
+        tm = TM({'s': {'ab': Transition('s', 'cd', RIGHT), '0': Transition('h', '€', None)}}, 's')
+        tm.set_tape(['ab', 'ab'])
+        result = run(tm)
+        assert result.reason == HALTED and result.steps == 3 and tm.tape == ['cd', 'cd', '€']
+
+    # writing such a symbol onto a tape of single byte symbols keeps the rest of the tape
+    tm = TM({'s': {'0': Transition('s', 'xy', RIGHT), '1': Transition('h', None, LEFT)}}, 's', tape=['0', '0', '1'])
+    tm.run()
+    assert tm.tape == ['xy', 'xy', '1'] and tm.state == 'h' and tm.head_idx == 1
+    assert tm.l_tape.stack == ['xy'] and tm.r_tape.stack == ['1', 'xy']
+
+
+def test_run_batch():
+    # the batch runner should give the same results as running each tape, in either order
+    from batch import run_batch
+    tapes = ['1' * a + '0' + '1' * b for a in range(1, 4) for b in range(1, 4)]
+    tm = load_from_xml("examples/add_tm.xml")
+    expected = []
+    for tape in tapes:
+        tm.set_tape(list(tape))
+        tm.state = '1'
+        result = tm.run()
+        expected.append((result.reason, result.steps, result.head_idx, ''.join(tm.tape)))
+
+    tm.state = '1'
+    results = list(run_batch(tm, tapes, processes=2))
+    assert [index for index, result, tape in results] == list(range(len(tapes)))
+    assert [(result.reason, result.steps, result.head_idx, tape) for index, result, tape in results] == expected
+
+    results = sorted(run_batch(tm, tapes, processes=2, ordered=False, max_steps=3), key=lambda result: result[0])
+    assert all(result.reason == BUDGET_EXHAUSTED and result.steps == 3 for index, result, tape in results)
+
+
+def test_lockstep():
+    # running every input in lockstep should match running each one (numpy is optional, so skip without it)
+    try:
+        from lockstep import LockstepTM
+    except ImportError:
+        return
+    from itertools import product
+    tapes = [''.join(symbols) for length in range(1, 7) for symbols in product('01', repeat=length)]
+    tm = load_from_xml("examples/copy_tm.xml")
+    results = LockstepTM(tm).run(tapes, max_steps=1000)
+    for tape, (result, final_tape) in zip(tapes, results):
+        tm.state = '1'
+        tm.set_tape(list(tape))
+        expected = tm.run(max_steps=1000)
+        assert (result.reason, result.steps, result.state, result.head_idx) == (expected.reason, expected.steps, expected.state, expected.head_idx)
+        assert final_tape == ''.join(tm.tape)
+
+
+def test_profile_run():
+    # profiling counts every transition, and rolls the counts up to the high-level states the UTM was compiled from
+    from profiler import profile_run
+    target = load_from_xml("examples/add_tm.xml")
+    target.set_tape(['1', '1', '1', '0', '1', '1'])  # 2 + 1
+    utm = get_utm()
+    utm.set_tape(construct_utm_input(target))
+    result, profile = profile_run(utm)
+    assert result.halted and profile.total == result.steps
+    assert "1111" == ''.join(utm.tape).strip('0')
+
+    origins = dict(profile.by_origin())
+    assert sum(origins.values()) == result.steps
+    assert any(origin.startswith('advance_state_desc_ptr') for origin in origins)
+    assert any('TwoToFourSymbolExpansion' in origin for origin in origins)
+    # (subroutines shared by several SuperTransitions are counted for the first of them, see compile_super_transitions)
+    assert profile.by_origin()[0][0] in profile.report()
+    assert 'advance_state_desc_ptr' in profile.report(top=len(origins))
+
+    # states are attributed by name, not by the prefix they start with, even if a prefix is also the name of a state
+    from profiler import origin_names, origin_of
+    transitions = {'1': {'1': MoveFixed('2', 2, RIGHT, prefix='2')}, '2': {'0': Transition('3', None, LEFT)}, '3': {}}
+    origins = origin_names(transitions)
+    tm = n_to_2_symbols(compile_super_transitions(TM(transitions=transitions, tape=['1', '1', '0'])), FOUR_SYMBOL_CODE)
+    labels = {origin_of(state, origins) for state in tm.transitions}
+    assert {'1', '2', '3', '1: MoveFixed 2'} == labels
+    assert all(origin_of(state, origins) == '2' for state in tm.transitions if state.startswith('2_'))
+
+
 def test_compile_four_to_two_symbols():
     transitions = {
         '0': {},
@@ -204,6 +952,47 @@ def test_compile_four_to_two_symbols():
     assert '11011101110111001101' == ''.join(tm.tape)
     assert tm.head_idx == 16
 
+def test_n_to_2_symbols():
+    # a 3-symbol machine that replaces 'a's with 'b's until the first blank, then goes back to the start
+    transitions = {
+        '1': {'a': Transition('1', 'b', RIGHT), 'b': Transition('1', None, RIGHT), '_': Transition('2', None, LEFT)},
+        '2': {'a': Transition('2', None, LEFT), 'b': Transition('2', None, LEFT), '_': Transition('3', None, RIGHT)},
+        '3': {},
+    }
+    tape = ['_', 'a', 'b', 'a', 'a']
+    tm = TM(transitions, tape=tape, head_idx=1, empty_symbol='_')
+    symbol_map = choose_symbol_code(tm)
+    # '2' moves left over 'a' and 'b' alike, so their codes share the first bit and '2' only reads that bit
+    assert symbol_map['_'] == '00' and symbol_map['a'][0] == symbol_map['b'][0] == '1'
+    assert decode_tape(*encode_tape(tape, 1, symbol_map), symbol_map) == (tape, 1)
+
+    binary = n_to_2_symbols(tm, symbol_map)
+    assert binary.empty_symbol == '0' and set(binary.tape) <= {'0', '1'}
+    binary.run()
+    tm.run()
+    assert binary.state == tm.state == '3'
+    assert decode_tape(binary.tape, binary.head_idx, symbol_map) == (tm.tape, tm.head_idx)
+
+    # weighting the transitions by a profile can only lower the cost of the profiled run
+    from profiler import profile_run
+    profiled = TM(transitions, tape=tape, head_idx=1, empty_symbol='_')
+    result, profile = profile_run(profiled)
+    steps = []
+    for code in (symbol_map, choose_symbol_code(TM(transitions, tape=tape, empty_symbol='_'), profile.counts)):
+        binary = n_to_2_symbols(TM(transitions, tape=tape, head_idx=1, empty_symbol='_'), code)
+        steps.append(binary.run().steps)
+    assert steps[1] <= steps[0]
+
+    # a partially defined row halts with the head back on the first bit of the symbol it has no transition for
+    symbol_map = {'0': '00', 'a': '10', 'b': '11'}
+    for tape in (['0', 'a', 'b', '0'], ['a', '0', 'b']):
+        tm = TM({'s': {'0': Transition('s', None, RIGHT), 'a': Transition('s', '0', RIGHT)}}, 's', tape=tape)
+        binary = n_to_2_symbols(tm, symbol_map)
+        binary.run()
+        tm.run()
+        assert binary.state == 's_halt'
+        assert decode_tape(binary.tape, binary.head_idx, symbol_map) == (tm.tape, tm.head_idx)
+
 def test_remove_null_transitions():
     transitions = {
         '1': {
@@ -223,16 +1012,42 @@ def test_remove_null_transitions():
 if __name__ == "__main__":
     test_tm_methods()
     test_draw()
+    test_byte_tape()
     test_load_xml()
+    test_load_compiled_from_xml()
+    test_cache()
+    test_iter_steps()
     test_save_to_xml()
+    test_save_to_xml_deterministic()
+    test_binary_format()
     test_two_to_four_symbol_expansion2()
     test_four_to_two_symbol_expansion()
+    test_frozen_tm()
     test_quintuple_to_quadruple()
     test_move_until()
+    test_subroutine_templates()
+    test_link_super_transitions()
+    test_minimize_states()
+    test_fuse_transitions()
     test_construct_utm_input()
     test_utm()
     test_utm_file()
+    test_emulate_utm()
+    test_stream_utm_input()
+    test_indexed_utm()
+    test_run_compiled()
+    test_compile_to_python()
+    test_sweeps()
+    test_native_super_transitions()
+    test_macro_machine()
+    test_detect_loops()
+    test_run_result()
+    test_arbitrary_symbols()
+    test_run_batch()
+    test_lockstep()
+    test_profile_run()
     test_compile_four_to_two_symbols()
+    test_n_to_2_symbols()
     test_remove_null_transitions()
     test_simple_utm_input()
     print("All tests passed!")
\ No newline at end of file
@@ -1,13 +1,35 @@
+import ast
 import json
+import time
+from collections import namedtuple
 import xml.etree.ElementTree as ET
 
 
 RIGHT = 'R'
 LEFT = 'L'
 
+# reasons a run stops (see RunResult)
+HALTED = 'halted'
+MISSING_TRANSITION = 'missing_transition'
+BUDGET_EXHAUSTED = 'budget_exhausted'
+NON_HALTING = 'non_halting'
+ERROR = 'error'
+
+# number of steps between checks of the clock when a run has a timeout
+TIME_CHECK_INTERVAL = 1024
+
 class HaltException(Exception):
-    def __init__(self, message):
+    # steps and reason are set when a SuperTransition halts partway (see subroutine.SubroutineHalted)
+    def __init__(self, message, steps=0, reason=None):
+        super().__init__(message)
+        self.steps = steps
+        self.reason = reason
+
+class NonHaltingException(Exception):
+    # raised when a run is proven to never halt; loop describes the repeating part of the run (see engine.Loop)
+    def __init__(self, message, loop):
         super().__init__(message)
+        self.loop = loop
 
 class TapeStack:
     def __init__(self, initial_contents=None, empty_symbol='0'):
@@ -36,24 +58,348 @@ class TapeStack:
     def __str__(self):
         return str(self.stack)
 
+def encode_symbols(symbols):
+    # cells of a ByteTape hold single-character symbols by their latin-1 code
+    data = ''.join(symbols).encode('latin-1')
+    if len(data) != len(symbols):
+        raise ValueError(f"Tape symbols must be single characters: {symbols}")
+    return data
+
+class ByteTape:
+    """
+    Two-way infinite tape stored in a contiguous bytearray.
+    buffer: the cells, with blank margins on both sides that grow geometrically as the head reaches them
+    start, end: offsets of the tape contents in the buffer (cells outside of [start, end) are blank)
+    head: offset of the head in the buffer (start <= head <= end; head == end means the head is on the blank just past the end)
+
+    The tape contents match the TapeStack representation of the TM class: cells that were in the initial tape,
+    were written to, or that the head has moved off of or moved left onto.
+
+    Cells hold single-character latin-1 symbols by their code. A symbol that doesn't fit in a byte (longer or non-latin-1 symbols)
+    turns the buffer into a list of symbols in place, which supports any symbols, but not the byte views the compiled engine runs on.
+    """
+    def __init__(self, contents=None, head_idx=0, empty_symbol='0'):
+        contents = contents or [empty_symbol,]
+        self.empty_symbol = empty_symbol
+        try:
+            self.blank = encode_symbols([empty_symbol])[0]
+            cells = encode_symbols(contents)
+        except (ValueError, UnicodeEncodeError):
+            self.blank = empty_symbol
+            cells = list(contents)
+
+        margin = max(len(contents), 16)
+        self.buffer = self.blanks(margin) + cells + self.blanks(margin)
+        self.start = margin
+        self.end = margin + len(contents)
+        self.head = margin + min(head_idx, len(contents))
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def head_idx(self):
+        # index of the head in the tape contents
+        return self.head - self.start
+
+    @property
+    def is_bytes(self):
+        # whether the cells are still bytes (see code)
+        return isinstance(self.buffer, bytearray)
+
+    def blanks(self, n):
+        return bytearray([self.blank]) * n if isinstance(self.blank, int) else [self.blank] * n
+
+    def code(self, symbol):
+        # value of a cell holding symbol, switching the buffer to a list of symbols if the symbol doesn't fit in a byte
+        if self.is_bytes:
+            try:
+                return encode_symbols([symbol])[0]
+            except (ValueError, UnicodeEncodeError):
+                self.to_symbols()
+        return symbol
+
+    def to_symbols(self):
+        # store the cells as a list of symbols instead of bytes
+        if self.is_bytes:
+            self.buffer = [chr(code) for code in self.buffer]
+            self.blank = self.empty_symbol
+
+    def symbol_at(self, offset):
+        return chr(self.buffer[offset]) if self.is_bytes else self.buffer[offset]
+
+    def grow_left(self):
+        # double the buffer by adding blanks on the left
+        n = len(self.buffer)
+        self.buffer[0:0] = self.blanks(n)
+        self.start += n
+        self.end += n
+        self.head += n
+
+    def grow_right(self):
+        # double the buffer by adding blanks on the right
+        self.buffer.extend(self.blanks(len(self.buffer)))
+
+    def read(self):
+        return self.symbol_at(self.head)
+
+    def write(self, symbol):
+        self.buffer[self.head] = self.code(symbol)
+        if self.head == self.end:
+            self.end += 1
+
+    def move_right(self):
+        if self.head == self.end:
+            self.end += 1
+        self.head += 1
+        if self.head == len(self.buffer):
+            self.grow_right()
+
+    def move_left(self):
+        if self.head == 0:
+            self.grow_left()
+        self.head -= 1
+        if self.head < self.start:
+            self.start = self.head
+
+    def move(self, distance):
+        # move the head by distance cells (negative is left), with the same effect on the tape as moving one cell at a time
+        if distance > 0:
+            self.end = max(self.end, self.head + distance)
+            self.head += distance
+            while self.head >= len(self.buffer):
+                self.grow_right()
+        elif distance < 0:
+            self.head += distance
+            while self.head < 0:
+                self.grow_left()
+            self.start = min(self.start, self.head)
+
+    def find(self, symbol, direction=RIGHT):
+        """
+        Number of cells from the head to the nearest cell holding symbol in the given direction (0 if the head is on it).
+        Returns None if there is no such cell (which can only happen if symbol is not the empty symbol).
+        """
+        code = self.code(symbol)
+        if direction == RIGHT:
+            idx = self.find_offset(code, self.head, self.end)
+            if idx < 0:
+                if code != self.blank:
+                    return None
+                idx = max(self.head, self.end)
+            return idx - self.head
+        idx = self.rfind_offset(code, self.start, self.head + 1)
+        if idx < 0:
+            if code != self.blank:
+                return None
+            idx = self.start - 1
+        return self.head - idx
+
+    def find_unlisted(self, symbols, direction=RIGHT, limit=None):
+        """
+        Number of cells from the head to the nearest cell holding a symbol that is not in symbols, in the given direction (0 if the head is on it).
+        Returns None if there is no such cell within limit cells of the head (or at all, which can only happen if the empty symbol is in symbols).
+        """
+        if direction == RIGHT:
+            lo = self.head
+            hi = max(self.head, self.end) if limit is None else min(max(self.head, self.end), self.head + limit)
+        else:
+            lo = self.start if limit is None else max(self.start, self.head + 1 - limit)
+            hi = self.head + 1
+        cells = hi - lo
+        if self.is_bytes:
+            listed = bytes(ord(symbol) for symbol in symbols if len(symbol) == 1 and ord(symbol) < 256)
+            segment = self.buffer[lo:hi]
+            distance = cells - len(segment.lstrip(listed) if direction == RIGHT else segment.rstrip(listed))
+        else:
+            listed = set(symbols)
+            offsets = range(lo, hi) if direction == RIGHT else range(hi - 1, lo - 1, -1)
+            distance = next((k for k, offset in enumerate(offsets) if self.buffer[offset] not in listed), cells)
+        if distance < cells:
+            return distance
+        # the cells past the contents are blank
+        if cells == limit or self.empty_symbol in symbols:
+            return None
+        return cells
+
+    def find_offset(self, code, lo, hi):
+        # offset of the first cell in [lo, hi) holding code (-1 if there is none)
+        if self.is_bytes:
+            return self.buffer.find(code, lo, hi)
+        try:
+            return self.buffer.index(code, lo, hi)
+        except ValueError:
+            return -1
+
+    def rfind_offset(self, code, lo, hi):
+        # offset of the last cell in [lo, hi) holding code (-1 if there is none)
+        if self.is_bytes:
+            return self.buffer.rfind(code, lo, hi)
+        for offset in range(hi - 1, lo - 1, -1):
+            if self.buffer[offset] == code:
+                return offset
+        return -1
+
+    def insert(self, offset, symbol):
+        # insert a cell at the given buffer offset, shifting the cells right of it
+        code = self.code(symbol)
+        if self.end == len(self.buffer):
+            self.grow_right()
+        self.buffer[offset + 1:self.end + 1] = self.buffer[offset:self.end]
+        self.buffer[offset] = code
+        self.end += 1
+
+    def delete(self, offset):
+        # remove the cell at the given buffer offset, shifting the cells right of it
+        symbol = self.symbol_at(offset)
+        self.buffer[offset:self.end - 1] = self.buffer[offset + 1:self.end]
+        self.buffer[self.end - 1] = self.blank
+        self.end -= 1
+        return symbol
+
+    def window(self, lo=0, hi=None):
+        """
+        Zero-copy memoryview of the tape contents from index lo to hi (clamped to the contents).
+        Release the view (or use it in a with block) before the tape is modified, since a bytearray cannot be resized while it is exported.
+        Raises ValueError if the tape holds symbols that don't fit in a byte.
+        """
+        if not self.is_bytes:
+            raise ValueError("Tape holds symbols that are not single latin-1 characters, so it has no byte view")
+        hi = len(self) if hi is None else min(hi, len(self))
+        lo = min(max(lo, 0), hi)
+        return memoryview(self.buffer)[self.start + lo:self.start + hi]
+
+    def text(self, lo=0, hi=None):
+        # tape contents from index lo to hi as a string
+        if not self.is_bytes:
+            return ''.join(self.symbols(lo, hi))
+        with self.window(lo, hi) as view:
+            return view.tobytes().decode('latin-1')
+
+    def symbols(self, lo=0, hi=None):
+        # tape contents from index lo to hi as a list of symbols
+        if self.is_bytes:
+            return list(self.text(lo, hi))
+        hi = len(self) if hi is None else min(hi, len(self))
+        lo = min(max(lo, 0), hi)
+        return self.buffer[self.start + lo:self.start + hi]
+
+class TapeSide:
+    """
+    TapeStack-compatible view of one side of a ByteTape.
+    The left side holds the cells left of the head (top of the stack is the cell just left of the head).
+    The right side holds the head cell and the cells right of it (top of the stack is the head cell).
+    """
+    def __init__(self, tape, left):
+        self.tape = tape
+        self.left = left
+        self.empty_symbol = tape.empty_symbol
+
+    @property
+    def stack(self):
+        tape = self.tape
+        if self.left:
+            return tape.symbols(0, tape.head_idx)
+        return tape.symbols(tape.head_idx)[::-1]
+
+    def push(self, symbol):
+        self.tape.insert(self.tape.head, symbol)
+        if self.left:
+            self.tape.head += 1
+
+    def pop(self):
+        tape = self.tape
+        if self.left:
+            if tape.head == tape.start:
+                return self.empty_symbol
+            tape.head -= 1
+            return tape.delete(tape.head)
+        if tape.head == tape.end:
+            return self.empty_symbol
+        return tape.delete(tape.head)
+
+    def peek(self):
+        tape = self.tape
+        if self.left:
+            return tape.symbol_at(tape.head - 1) if tape.head > tape.start else self.empty_symbol
+        return tape.read()
+
+    def write(self, symbol):
+        tape = self.tape
+        if self.left and tape.head > tape.start:
+            tape.buffer[tape.head - 1] = tape.code(symbol)
+        elif self.left:
+            self.push(symbol)
+        else:
+            tape.write(symbol)
+
+    def __str__(self):
+        return str(self.stack)
+
 class Transition:
+    # slots instead of a __dict__, since compiled machines have many transitions (see frozen.FrozenTransition for an immutable one)
+    __slots__ = ('state_to', 'symbol_to_write', 'direction')
+
     def __init__(self, state_to, symbol_to_write, direction):
         self.state_to = state_to
         self.symbol_to_write = symbol_to_write
         self.direction = direction
 
     def __str__(self):
-        return json.dumps({
+        return json.dumps(self.to_dict())
+
+    def to_dict(self):
+        return {
             "s": self.state_to,
             "w": self.symbol_to_write,
             "m": self.direction
-        })
+        }
     
     def load(self, data):
         self.state_to = data["s"]
         self.symbol_to_write = data["w"]
         self.direction = data["m"]
 
+# one transition of a run (see TM.iter_steps)
+StepRecord = namedtuple('StepRecord', ['step', 'state', 'read', 'write', 'move', 'head_idx'])
+
+class RunResult:
+    """
+    Outcome of running a TM.
+    reason: why the run stopped:
+        HALTED: the machine reached a state with no transitions
+        MISSING_TRANSITION: the state has transitions, but not for the symbol under the head
+        BUDGET_EXHAUSTED: max_steps or timeout ran out first
+        NON_HALTING: the run was proven to never halt (see loop)
+        ERROR: an exception was raised while taking a transition (see error)
+    steps: transitions taken
+    elapsed: seconds the run took
+    state: state the machine stopped in
+    head_idx: index of the head in the tape when the machine stopped
+    error: message of the error (or of the proof that the machine never halts)
+    loop: engine.Loop proving the machine never halts (None otherwise)
+    """
+    def __init__(self, reason, steps, elapsed, state, head_idx, error=None, loop=None):
+        self.reason = reason
+        self.steps = steps
+        self.elapsed = elapsed
+        self.state = state
+        self.head_idx = head_idx
+        self.error = error
+        self.loop = loop
+
+    @property
+    def halted(self):
+        return self.reason in (HALTED, MISSING_TRANSITION)
+
+    @property
+    def steps_per_second(self):
+        return self.steps / self.elapsed if self.elapsed > 0 else float('inf')
+
+    def __str__(self):
+        return f"{self.reason} in state {self.state} after {self.steps} transitions ({self.elapsed:.3f}s, {self.steps_per_second:.0f} transitions/s)"
+
+
 class TM:
     def __init__(self, transitions=None, start_state='1', tape=None, head_idx=0, empty_symbol='0'):
         """
@@ -66,57 +412,74 @@ class TM:
         self.transitions = transitions or {'0':{}, '1':{}}
         self.state = start_state
         self.empty_symbol = empty_symbol
+        # {state name prefix: label} of the high-level states and SuperTransitions this TM was compiled from (see profiler.origin_names)
+        self.origins = None
 
         self.set_tape(tape=tape, head_idx=head_idx)
 
     @property
     def tape(self):
         # return the tape as a list
-        return self.l_tape.stack + self.r_tape.stack[::-1]
+        return self.byte_tape.symbols()
     
     @property
     def head_idx(self):
         # return the index of the head in the tape
-        return len(self.l_tape.stack)
+        return self.byte_tape.head_idx
+
+    @property
+    def l_tape(self):
+        # stack of the cells left of the head (top of the stack is the cell just left of the head)
+        return TapeSide(self.byte_tape, left=True)
+
+    @property
+    def r_tape(self):
+        # stack of the head cell and the cells right of it, in reverse order (top of the stack is the head cell)
+        return TapeSide(self.byte_tape, left=False)
     
     def set_tape(self, tape=None, head_idx=0):
-        # convention: head is at last item in r_tape
-        # and r_tape is in reverse order (moving right means popping from the back)
-        # both tapes are treated as stacks with the head at the top
-        tape = tape or [self.empty_symbol,]
-        r_stop = head_idx - 1 if head_idx > 0 else None
-
-        self.l_tape = TapeStack(tape[:head_idx], self.empty_symbol)
-        self.r_tape = TapeStack(tape[-1:r_stop:-1], self.empty_symbol)
+        # the tape is stored in a bytearray (or a list, for symbols that don't fit in a byte) that grows in both directions, with the head kept as an offset
+        self.byte_tape = ByteTape(tape, head_idx, self.empty_symbol)
 
     def move_right(self):
-        # pop from the right tape
-        symbol = self.r_tape.pop()
-        # push to the left tape
-        self.l_tape.push(symbol)
+        self.byte_tape.move_right()
 
     def move_left(self):
-        # pop from the left tape
-        symbol = self.l_tape.pop()
-        # push to the right tape
-        self.r_tape.push(symbol)
+        self.byte_tape.move_left()
 
     def write(self, symbol):
-        # write to the right tape
-        self.r_tape.write(symbol)
+        self.byte_tape.write(symbol)
 
     def read(self):
-        # read from the right tape
-        return self.r_tape.peek()
+        return self.byte_tape.read()
     
     def step(self):
+        """
+        Take one transition. SuperTransitions are executed natively on the tape (see SuperTransition.execute).
+        Returns the number of transitions taken (more than 1 for a SuperTransition, counting the transitions its compiled form would take)
+        Raises HaltException if the machine halts, and NonHaltingException if a SuperTransition never returns
+        (both with the state its compiled form would be in, and the transitions it took)
+        """
         symbol = self.read()
-        transition = self.transitions[self.state].get(symbol)
+        transition = self.transitions.get(self.state, {}).get(symbol)
 
-        # TODO: could implement a "simulation" method on super transitions to support pre-compile
-        from subroutine import SuperTransition
+        from subroutine import SuperTransition, SubroutineHalted
         if isinstance(transition, SuperTransition):
-            raise Exception("Compile the TM to transform SuperTransitions before running")
+            # compiled, this is a transition into the first state of the subroutine that does not write or move
+            self.write(symbol)
+            try:
+                transitions = 1 + transition.execute(self.byte_tape)
+            except SubroutineHalted as e:
+                # the machine stops in the state of the subroutine its compiled form would stop in
+                self.state = e.state
+                e.steps += 1
+                raise
+            except NonHaltingException as e:
+                self.state = e.loop.state
+                e.loop.steps += 1
+                raise
+            self.state = transition.state_to
+            return transitions
         
         if transition:
             self.write(transition.symbol_to_write or symbol)  # write the same symbol if None write value specified in the transition
@@ -125,23 +488,143 @@ class TM:
             elif transition.direction == LEFT:
                 self.move_left()
             self.state = transition.state_to
+            return 1
         else:
             raise HaltException(f"Transition not found for state {self.state} and symbol {symbol}")
         
-    def run(self):
+    def iter_steps(self, every=1, states=None, max_steps=None):
+        """
+        Run the machine lazily, yielding a StepRecord for each step before it is taken:
+            step: number of transitions taken before this step
+            state, read: the state and the symbol under the head
+            write, move: the symbol written and the direction moved (the read symbol and None for a SuperTransition,
+                which is executed as one step; see step)
+            head_idx: index of the head in the tape
+        The run stops when the machine halts (or max_steps transitions have been taken), like run.
+        every: only yield every k-th step
+        states: only yield steps taken from these states
+        """
+        from subroutine import SuperTransition
+        states = None if states is None else set(states)
         transitions = 0
-        while True:
+        taken = 0
+        while max_steps is None or transitions < max_steps:
+            state = self.state
+            symbol = self.read()
+            transition = self.transitions.get(state, {}).get(symbol)
+            if transition is None:
+                return
+            if taken % every == 0 and (states is None or state in states):
+                if isinstance(transition, SuperTransition):
+                    record = StepRecord(transitions, state, symbol, symbol, None, self.head_idx)
+                else:
+                    record = StepRecord(transitions, state, symbol, transition.symbol_to_write or symbol, transition.direction, self.head_idx)
+                yield record
             try:
-                self.step()
-                transitions += 1
+                transitions += self.step()
             except HaltException:
+                return
+            taken += 1
+
+    def run(self, max_steps=None, timeout=None, detect_loops=False, verbose=False):
+        """
+        Run until the machine halts or a budget runs out.
+        max_steps: maximum number of transitions to take (a SuperTransition is taken whole, so it can take the run past max_steps)
+        timeout: maximum number of seconds to run for
+        detect_loops: if True, the run executes on the compiled engine and stops as soon as it is proven to never halt
+            (see engine.CompiledTM.run_detecting_loops)
+        verbose: if True, print any error, draw the tape, and print the number of transitions taken
+        Returns a RunResult
+        """
+        if detect_loops:
+            return self.run_detecting_loops(max_steps, timeout, verbose)
+
+        begin = time.perf_counter()
+        deadline = None if timeout is None else begin + timeout
+        transitions = 0
+        iterations = 0
+        reason = None
+        error = None
+        while True:
+            if max_steps is not None and transitions >= max_steps:
+                reason = BUDGET_EXHAUSTED
+                break
+            iterations += 1
+            if deadline is not None and iterations % TIME_CHECK_INTERVAL == 0 and time.perf_counter() >= deadline:
+                reason = BUDGET_EXHAUSTED
+                break
+            try:
+                transitions += self.step()
+            except HaltException as e:
+                transitions += e.steps
+                reason = e.reason
                 break
+            except NonHaltingException as e:
+                transitions += e.loop.steps
+                e.loop.steps = transitions
+                return self.finish_run(NON_HALTING, transitions, begin, str(e), e.loop, verbose=verbose)
             except Exception as e:
-                print(f"Error: {e}")
+                reason = ERROR
+                error = str(e)
                 break
-        self.draw(max_tape_length=50)
-        print(f"Total transitions taken: {transitions}")
-        
+        if reason in (None, BUDGET_EXHAUSTED):
+            reason = self.stop_reason()
+        return self.finish_run(reason, transitions, begin, error, verbose=verbose)
+
+    def run_detecting_loops(self, max_steps=None, timeout=None, verbose=False):
+        begin = time.perf_counter()
+        try:
+            self.state, transitions, reason = self.compile().run_detecting_loops(self.byte_tape, self.state, max_steps, timeout)
+        except NonHaltingException as e:
+            self.state = e.loop.state
+            return self.finish_run(NON_HALTING, e.loop.steps, begin, str(e), e.loop, verbose=verbose)
+        return self.finish_run(reason, transitions, begin, verbose=verbose)
+
+    def stop_reason(self):
+        # why a run of step stopped in the current state (HALTED, MISSING_TRANSITION, or BUDGET_EXHAUSTED if it could go on)
+        # runs on the compiled engine use CompiledTM.stop_reason instead, since they can stop in states of SuperTransitions
+        transitions = self.transitions.get(self.state)
+        if transitions and transitions.get(self.read()) is not None:
+            return BUDGET_EXHAUSTED
+        return MISSING_TRANSITION if transitions else HALTED
+
+    def finish_run(self, reason, transitions, begin, error=None, loop=None, verbose=False):
+        result = RunResult(reason, transitions, time.perf_counter() - begin, self.state, self.head_idx, error, loop)
+        if verbose:
+            if error is not None:
+                print(f"Error: {error}" if reason == ERROR else error)
+            self.draw(max_tape_length=50)
+            print(f"Total transitions taken: {transitions}")
+        return result
+
+    def compile(self, fuse=False):
+        """
+        Return the integer-indexed form of this TM's transition table used by the fast engine (with SuperTransitions expanded)
+        fuse: if True, transitions that do not move are fused with the ones forced after them (see compiler.fuse_transitions),
+            so runs end in the same state with the same tape but take (and count) fewer steps
+        """
+        from compiler import compile_super_transitions, fuse_transitions, remove_unreachable_states
+        from engine import CompiledTM
+        from subroutine import SuperTransition
+
+        tm = self
+        if any(isinstance(transition, SuperTransition) for transitions in self.transitions.values() for transition in transitions.values()):
+            tm = compile_super_transitions(tm)
+        if fuse:
+            tm = remove_unreachable_states(fuse_transitions(tm))
+        return CompiledTM(tm)
+
+    def run_compiled(self, compiled=None, max_steps=None, timeout=None, verbose=False):
+        """
+        Same as run, but executes on the integer-indexed transition table (see engine.CompiledTM).
+        compiled: a CompiledTM (or codegen.GeneratedTM) of this TM to reuse (compiled from this TM if not given)
+        Returns a RunResult
+        """
+        compiled = compiled or self.compile()
+        begin = time.perf_counter()
+        self.state, transitions = compiled.run(self.byte_tape, self.state, max_steps=max_steps, timeout=timeout)
+        return self.finish_run(compiled.stop_reason(self.byte_tape, self.state), transitions, begin, verbose=verbose)
+
     def __str__(self):
         return json.dumps({
             "state": self.state,
@@ -156,33 +639,37 @@ class TM:
                 "state": self.state,
                 "l_tape": str(self.l_tape),
                 "r_tape": str(self.r_tape),
-                "transitions": {state: {symbol: str(transition) for symbol, transition in transitions.items()} for state, transitions in self.transitions.items()}
+                "transitions": {state: {symbol: transition.to_dict() for symbol, transition in transitions.items()} for state, transitions in self.transitions.items()}
             }, f, indent=4)
     
     def load(self, filepath):
         with open(filepath, 'r') as f:
             data = json.load(f)
             self.state = data["state"]
-            self.l_tape = TapeStack(data["l_tape"])
-            self.r_tape = TapeStack(data["r_tape"])
+            l_tape = ast.literal_eval(data["l_tape"])
+            r_tape = ast.literal_eval(data["r_tape"])
+            self.set_tape(l_tape + r_tape[::-1], len(l_tape))
             for state, transitions in data["transitions"].items():
+                self.transitions.setdefault(state, {})
                 for symbol, transition in transitions.items():
                     t = Transition('', '', '')
-                    t.load(json.loads(transition))
+                    # older files store each transition as a JSON string
+                    t.load(json.loads(transition) if isinstance(transition, str) else transition)
                     self.transitions[state][symbol] = t
 
     def draw(self, max_tape_length=20):
         # Draw the tape with the head position
-        tape_contents = self.tape
+        tape_length = len(self.byte_tape)
         head_pos = self.head_idx
+        lo, hi = 0, tape_length
         if head_pos < max_tape_length // 2:
-            tape_contents = tape_contents[:max_tape_length]
-        elif len(self.tape) > max_tape_length:
-            tape_contents = tape_contents[:head_pos + (max_tape_length // 2)]
-            head_pos = max_tape_length - (len(tape_contents) - head_pos)
-            tape_contents = tape_contents[-max_tape_length:]
-        
-        tape_str = '|'.join(tape_contents)
+            hi = max_tape_length
+        elif tape_length > max_tape_length:
+            hi = min(head_pos + (max_tape_length // 2), tape_length)
+            head_pos = max_tape_length - (hi - head_pos)
+            lo = max(hi - max_tape_length, 0)
+
+        tape_str = '|'.join(self.byte_tape.symbols(lo, hi))
         head_str = ' ' * (head_pos * 2) + '^'
         border = '-' * (len(tape_str) + 1)
         print(f"State: {self.state}")
@@ -207,5 +694,5 @@ if __name__ == "__main__":
     tm = load_from_xml(tm_filepath)
     tm.set_tape(initial_tape)
     tm.draw(max_tape_length=50)
-    tm.run()
-    print(''.join(tm.tape[tm.head_idx:]))
\ No newline at end of file
+    tm.run(verbose=True)
+    print(tm.byte_tape.text(tm.head_idx))
\ No newline at end of file
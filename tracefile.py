@@ -0,0 +1,98 @@
+import gzip
+import json
+import struct
+
+from tm import StepRecord, LEFT, RIGHT
+
+
+# binary trace files: the magic, then a tag byte before each entry
+TRACE_MAGIC = b'TMT2'
+TRACE_STATE = struct.Struct('<IH')  # tag 0: id given to a state the first time it appears, length of its name (followed by the name)
+TRACE_STEP = struct.Struct('<QIIIbq')  # tag 1: step, state id, read symbol id, written symbol id, move, head_idx
+TRACE_SYMBOL = struct.Struct('<IH')  # tag 2: id given to a symbol the first time it appears, length of the symbol (followed by the symbol)
+TRACE_FLUSH_SIZE = 1 << 16
+# fast compression, since traces are long and written while the machine runs
+TRACE_COMPRESS_LEVEL = 1
+
+MOVES = {LEFT: -1, None: 0, RIGHT: 1}
+DIRECTIONS = {-1: LEFT, 0: None, 1: RIGHT}
+
+
+def open_trace(filepath, mode):
+    # trace files ending in .gz are compressed
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, mode, compresslevel=TRACE_COMPRESS_LEVEL)
+    return open(filepath, mode)
+
+
+def is_jsonl(filepath):
+    return filepath.endswith('.jsonl') or filepath.endswith('.jsonl.gz')
+
+
+def write_trace(records, filepath):
+    """
+    Stream step records (see TM.iter_steps) to a file, without holding them in memory.
+    The format depends on the extension: JSON lines for .jsonl, binary otherwise (e.g. .trace),
+    either of them compressed with gzip if the extension ends in .gz (e.g. .jsonl.gz or .trace.gz).
+    Returns the number of records written
+    """
+    count = 0
+    with open_trace(filepath, 'wb') as f:
+        if is_jsonl(filepath):
+            for record in records:
+                f.write(json.dumps(record._asdict()).encode('utf-8') + b'\n')
+                count += 1
+            return count
+
+        state_ids = {}
+        symbol_ids = {}
+        chunk = bytearray(TRACE_MAGIC)
+        for record in records:
+            state_id = state_ids.get(record.state)
+            if state_id is None:
+                state_id = state_ids[record.state] = len(state_ids)
+                name = record.state.encode('utf-8')
+                chunk += b'\x00' + TRACE_STATE.pack(state_id, len(name)) + name
+            # symbols may have several characters, or ones that don't fit in a byte (see tm.ByteTape)
+            for symbol in (record.read, record.write):
+                if symbol not in symbol_ids:
+                    symbol_ids[symbol] = len(symbol_ids)
+                    encoded = symbol.encode('utf-8')
+                    chunk += b'\x02' + TRACE_SYMBOL.pack(symbol_ids[symbol], len(encoded)) + encoded
+            chunk += b'\x01' + TRACE_STEP.pack(record.step, state_id, symbol_ids[record.read], symbol_ids[record.write],
+                                                MOVES[record.move], record.head_idx)
+            count += 1
+            if len(chunk) >= TRACE_FLUSH_SIZE:
+                f.write(chunk)
+                chunk.clear()
+        f.write(chunk)
+    return count
+
+
+def read_trace(filepath):
+    """
+    Lazily read the step records of a trace file written by write_trace.
+    """
+    with open_trace(filepath, 'rb') as f:
+        if is_jsonl(filepath):
+            for line in f:
+                yield StepRecord(**json.loads(line))
+            return
+
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{filepath} is not a trace file")
+        states = []
+        symbols = []
+        while True:
+            tag = f.read(1)
+            if not tag:
+                return
+            if tag == b'\x00':
+                state_id, length = TRACE_STATE.unpack(f.read(TRACE_STATE.size))
+                states.append(f.read(length).decode('utf-8'))
+            elif tag == b'\x02':
+                symbol_id, length = TRACE_SYMBOL.unpack(f.read(TRACE_SYMBOL.size))
+                symbols.append(f.read(length).decode('utf-8'))
+            else:
+                step, state_id, read, write, move, head_idx = TRACE_STEP.unpack(f.read(TRACE_STEP.size))
+                yield StepRecord(step, states[state_id], symbols[read], symbols[write], DIRECTIONS[move], head_idx)
@@ -1,7 +1,12 @@
+import io
+
 from tm import TM, Transition, LEFT, RIGHT
 from subroutine import *
 from compiler import *
 
+# cells of the tape of a target that iter_utm_input yields at a time
+TAPE_CHUNK_SIZE = 2 ** 16
+
 def action_of_transition(transition : Transition):
     if transition.direction is not None and transition.symbol_to_write is not None:
         raise ValueError("Action must be quadruple formulation for simulation target")
@@ -29,25 +34,188 @@ def construct_utm_input(tm):
     - '11': write '1'
     - '111': move left
     - '1111': move right
+
+    For large TMs or tapes, iter_utm_input and write_utm_input produce the input without building it as a list.
     """
-    tm = standardize_simulation_target(tm)
-    num_states = len(tm.transitions)
+    return list(''.join(iter_utm_input(tm)))
+
+def iter_utm_input(tm):
+    """
+    The input of construct_utm_input for a TM and its tape, yielded in chunks (strings): the number of states,
+    each transition, and then the tape, TAPE_CHUNK_SIZE cells at a time.
+    The tape is read from the TM's ByteTape as it is yielded, and is not copied by standardize_simulation_target.
+    """
+    target = standardize_simulation_target(TM(transitions=tm.transitions, start_state=tm.state, empty_symbol=tm.empty_symbol))
+    num_states = len(target.transitions)
 
-    utm_input = ['1' for i in range(num_states)] + ['0']
+    yield '1' * num_states + '0'
     for i in range(1, num_states):
-        state_transitions = tm.transitions[str(i)]
+        state_transitions = target.transitions[str(i)]
         for symbol in ('0', '1'):
-            utm_input += action_of_transition(state_transitions[symbol]) + ['0']
-            utm_input += ['1'] * (int(state_transitions[symbol].state_to) + 1) + ['0']
+            transition = state_transitions[symbol]
+            yield ''.join(action_of_transition(transition)) + '0' + '1' * (int(transition.state_to) + 1) + '0'
+
+    tape = tm.byte_tape
+    for lo in range(0, len(tape), TAPE_CHUNK_SIZE):
+        yield tape.text(lo, lo + TAPE_CHUNK_SIZE)
+
+def write_utm_input(tm, out):
+    """
+    Write the input of construct_utm_input for a TM and its tape to out, a chunk at a time (see iter_utm_input).
+    out: a bytearray (extended in place), or a file opened in text or binary mode
+    Returns the number of symbols written
+    """
+    count = 0
+    for chunk in iter_utm_input(tm):
+        if isinstance(out, bytearray):
+            out.extend(chunk.encode('ascii'))
+        elif isinstance(out, io.TextIOBase):
+            out.write(chunk)
+        else:
+            out.write(chunk.encode('ascii'))
+        count += len(chunk)
+    return count
+
+def decode_utm_output(tape, head_idx):
+    """
+    Tape of the simulated TM from the tape of the UTM after it halts (once clean_tape and decode_tape are done), and the index of the UTM's head in it.
+    The UTM decodes the simulated tape from its first '1' on (any '0's left of that are blanked), and it does not keep the simulated head,
+    so the result is the simulated tape from its first to its last '1', and the head is where the UTM stopped
+    (just past the last '00' of the result, or on its first '1' if there is none).
+    tape: the UTM's tape as a string, a list of symbols, or a bytes-like object (e.g. ByteTape.window()); it is only sliced, not copied
+    Returns (tape, head_idx), where tape is a slice of the given tape (empty if it has no '1')
+    """
+    if isinstance(tape, (str, bytes, bytearray)):
+        one = '1' if isinstance(tape, str) else b'1'
+        start = tape.find(one)
+        if start < 0:
+            return tape[:0], head_idx
+        end = tape.rfind(one) + 1
+    else:
+        # lists of symbols, or memoryviews (of byte codes)
+        one = '1' if isinstance(tape, list) else ord('1')
+        start = 0
+        while start < len(tape) and tape[start] != one:
+            start += 1
+        end = len(tape)
+        while end > start and tape[end - 1] != one:
+            end -= 1
+    return tape[start:end], head_idx - start
+
+# symbols of the indexed UTM (see get_utm): '#' is blank and separates the regions, '0' and '1' are bits,
+# 'a' and 'b' are marked '0' and '1' (the user tape head, copied or compared bits), '+' and '-' start a state description
+# ('+' for the current state, or one that is still a candidate in a lookup), and '@' is the action of the halt state
+INDEXED_SYMBOLS = ('#', '0', '1', 'a', 'b', '+', '-', '@')
+# code of each symbol in the two-symbol indexed UTM (see compiler.n_to_2_symbols), chosen by compiler.choose_symbol_code
+# with the transition counts of the UTM simulating machines of 20 and 40 states (marking a bit only flips the middle bit of its code)
+INDEXED_SYMBOL_CODE = {
+    '#': '000',
+    '@': '001',
+    '+': '010',
+    '-': '011',
+    '0': '100',
+    '1': '101',
+    'a': '110',
+    'b': '111',
+}
+MARKED = {'0': 'a', '1': 'b'}
+UNMARKED = {'a': '0', 'b': '1'}
+
+def indexed_action(symbol, transition):
+    # 2-bit action of a quadruple transition in the indexed format: write '0', write '1', move left, move right
+    if transition.direction == LEFT:
+        return '10'
+    elif transition.direction == RIGHT:
+        return '11'
+    elif (transition.symbol_to_write or symbol) == '0':
+        return '00'
+    return '01'
+
+def construct_indexed_utm_input(tm, encode=True):
+    """
+    Input of the indexed UTM (see get_utm) for a TM and its tape, which uses fixed-width binary state indices:
+        #<register>#<state description 0><state description 1>...<state description n-1>#<user tape>
+    <register>: width marked bits ('a'), where the UTM keeps the index of the next state to look up
+    <state description i>: '+' for the start state ('1') and '-' for the others, then the actions on '0' and '1' (2 bits each, see indexed_action;
+        '@@@@' for the halt state '0'), then the bits of i, of the next state on '0', and of the next state on '1', interleaved:
+        i[0] q0[0] q1[0] i[1] q0[1] q1[1] ...
+    <user tape>: the TM's tape, with the symbol under the head marked
+    where width is the number of bits of n - 1, for the n states of the TM (after standardize_simulation_target).
+    encode: if True, the input is encoded with INDEXED_SYMBOL_CODE for the two-symbol indexed UTM,
+        otherwise it uses INDEXED_SYMBOLS (for the indexed UTM in four_symbol_mode)
+    """
+    tm = standardize_simulation_target(tm)
+    num_states = len(tm.transitions)
+    width = max(1, (num_states - 1).bit_length())
 
-    utm_input += tm.tape
+    utm_input = ['#'] + ['a'] * width + ['#']
+    for i in range(num_states):
+        label = format(i, f"0{width}b")
+        if i == 0:
+            utm_input += ['-', '@', '@', '@', '@']
+            next_states = ['0' * width, '0' * width]
+        else:
+            state_transitions = tm.transitions[str(i)]
+            utm_input.append('+' if i == 1 else '-')
+            for symbol in ('0', '1'):
+                utm_input += indexed_action(symbol, state_transitions[symbol])
+            next_states = [format(int(state_transitions[symbol].state_to), f"0{width}b") for symbol in ('0', '1')]
+        for j in range(width):
+            utm_input += [label[j], next_states[0][j], next_states[1][j]]
+    utm_input.append('#')
+
+    user_tape = list(tm.tape) or ['0']
+    head_idx = tm.head_idx
+    user_tape += ['0'] * (head_idx + 1 - len(user_tape))
+    user_tape[head_idx] = MARKED[user_tape[head_idx]]
+    utm_input += user_tape
+    if encode:
+        utm_input, _ = encode_tape(utm_input, 0, INDEXED_SYMBOL_CODE)
     return utm_input
 
-def get_utm(four_symbol_mode=False):
+def decode_indexed_utm_output(tape, head_idx, encoded=True):
+    """
+    Tape and head index of the simulated TM from the tape of the indexed UTM after it halts (the UTM's head is on the simulated head).
+    encoded: if True, the tape is of the two-symbol indexed UTM (see INDEXED_SYMBOL_CODE)
+    Returns (tape, head_idx)
+    """
+    if encoded:
+        tape, head_idx = decode_tape(tape, head_idx, INDEXED_SYMBOL_CODE)
+    start = 0
+    while start < len(tape) and tape[start] == '#':
+        start += 1
+    end = len(tape)
+    while end > start and tape[end - 1] == '#':
+        end -= 1
+    return list(tape[start:end]), head_idx - start
+
+# files the construction of the UTM depends on, hashed into the key of the cached UTM (see get_utm)
+UTM_SOURCES = ['utm.py', 'compiler.py', 'subroutine.py', 'tm.py', 'parser.py', 'profiler.py', 'frozen.py', 'engine.py', 'utils.py', 'cache.py',
+               'subroutines/two_to_four_symbol_expansion.xml', 'subroutines/four_to_two_symbol_decode.xml']
+
+def get_utm(four_symbol_mode=False, native=False, cache=True, minimize=True, indexed=False):
     """
     Returns a TM instance that acts as a Universal Turing Machine.
     four_symbol_mode: if True, this uses '0', '1', '@', and '#' as the symbols on the tape; if false, this uses only '0' and '1' (after compiling)
+    native: if True (only in four_symbol_mode), SuperTransitions are not compiled into states, so TM.run executes them natively
+    cache: if True, the compiled UTM is stored in the on-disk cache under a hash of the sources it is built from and the options,
+        so later calls skip the compilation passes (see cache.cached)
+    minimize: if True (not in four_symbol_mode), unreachable states are removed and equivalent states are merged (see compiler.minimize_states)
+    indexed: if True, the UTM takes the input of construct_indexed_utm_input, which has fixed-width binary state indices, instead of construct_utm_input.
+        Looking up the next state filters the state descriptions by one bit of its index at a time, so a simulated step takes
+        a number of passes over the descriptions logarithmic in the number of states (instead of linear, counting in unary).
+        It uses INDEXED_SYMBOLS in four_symbol_mode, and is compiled to two symbols with INDEXED_SYMBOL_CODE otherwise.
+    Raises ValueError if native is given without four_symbol_mode (compiling to two symbols needs the SuperTransitions compiled)
     """
+    if native and not four_symbol_mode:
+        raise ValueError("native=True is only supported in four_symbol_mode")
+    if cache:
+        from cache import cached, content_hash, sources_hash
+        return cached(content_hash("get_utm", four_symbol_mode, native, minimize, indexed, sources_hash(*UTM_SOURCES)),
+                      lambda: get_utm(four_symbol_mode, native, cache=False, minimize=minimize, indexed=indexed))
+    if indexed:
+        return get_indexed_utm(four_symbol_mode, native, minimize)
+
     preprocess = {
         # encode the tape to 4-symbol
         '1': {
@@ -363,22 +531,260 @@ def get_utm(four_symbol_mode=False):
         '0': {}
     }
 
+    # which high-level state or SuperTransition each compiled state comes from, for profiling
+    from profiler import origin_names
+    origins = origin_names(core)
+
     if four_symbol_mode:
-        core = compile_super_transitions(TM(transitions=core))
-        transitions = core.transitions
+        if not native:
+            core = compile_super_transitions(TM(transitions=core)).transitions
+        transitions = core
         utm = TM(transitions=transitions, start_state='2', empty_symbol='#')  # use '#' as the empty symbol to better simulate the behavior of two_symbol_mode that uses '0' as empty symbol
+        utm.origins = origins
         return utm
 
+    origins.update(origin_names(preprocess))
+    origins.update(origin_names(postprocess))
+
     # compile
     preprocess = compile_super_transitions(TM(transitions=preprocess))
     core = compile_super_transitions(TM(transitions=core))
-    core = four_to_two_symbols(core)
+    core = n_to_2_symbols(core, FOUR_SYMBOL_CODE)
     postprocess = compile_super_transitions(TM(transitions=postprocess))
     transitions = compose_transitions(compose_transitions(preprocess.transitions, core.transitions), postprocess.transitions)
     utm = TM(transitions=transitions, start_state='1')
     utm = remove_null_transitions(utm)
+    if minimize:
+        utm = minimize_states(remove_unreachable_states(utm))
+    utm.origins = origins
     return utm
     
+def indexed_utm_transitions():
+    """
+    High-level transitions of the indexed UTM (see get_utm), on the input of construct_indexed_utm_input.
+    Each simulated step:
+        1. reads the marked symbol s under the user tape head, and goes to the current state description (the one starting with '+')
+        2. copies the index of the next state on s into the register, marking the copied bits
+        3. takes the action on s on the user tape (or halts on '@')
+        4. restores the marked bits of the state descriptions and makes every description a candidate ('+')
+        5. for each bit of the register, from the first: marks it, and passes over the candidates,
+           marking the first unmarked bit of each index and removing ('-') those where it differs from the register bit
+    so that only the description of the next state is left with a '+'.
+    """
+    def until(state_to, target_symbol, direction, overshoot=0):
+        return MoveUntil(state_to, target_symbol, direction, overshoot=overshoot, all_symbols=INDEXED_SYMBOLS)
+
+    def fixed(state_to, distance, direction):
+        return MoveFixed(state_to, distance, direction, all_symbols=INDEXED_SYMBOLS)
+
+    description_symbols = ('0', '1', 'a', 'b', '+', '-', '@')
+    transitions = {
+    # go from the left end of the tape to the user tape
+        'start': {
+            '#': Transition('start_2', None, RIGHT),
+        },
+        'start_2': {symbol: until('find_user_tape', '#', RIGHT, overshoot=1) for symbol in ('0', '1', 'a', 'b')},
+        'find_user_tape': {symbol: until('sim_loop', '#', RIGHT) for symbol in ('+', '-')},
+    # main simulation loop
+        'sim_loop': {
+            # enter this state at the '#' just left of the user tape
+            '#': Transition('read_tape_head', None, RIGHT),
+        },
+        'read_tape_head': {
+            '0': Transition('read_tape_head', None, RIGHT),
+            '1': Transition('read_tape_head', None, RIGHT),
+            'a': until('copy_next_state_0', '+', LEFT),
+            'b': until('copy_next_state_1', '+', LEFT),
+        },
+    # take the action (the halt state has '@' actions)
+        'take_action_bit_1': {
+            '0': Transition('take_action_bit_2_0', None, RIGHT),
+            '1': Transition('take_action_bit_2_1', None, RIGHT),
+            '@': Transition('program_halt', None, None),
+        },
+        'take_action_bit_2_0': {
+            '0': until('write_0_action', '#', RIGHT, overshoot=1),
+            '1': until('write_1_action', '#', RIGHT, overshoot=1),
+        },
+        'take_action_bit_2_1': {
+            '0': until('move_left_action', '#', RIGHT, overshoot=1),
+            '1': until('move_right_action', '#', RIGHT, overshoot=1),
+        },
+        'move_left_action_2': {
+            '0': Transition('restore_descriptions', 'a', None),
+            '1': Transition('restore_descriptions', 'b', None),
+            # cannot move left past the user tape boundary (treat this as a program crash / termination, with the head on the first cell)
+            '#': Transition('move_out_of_bounds', None, RIGHT),
+        },
+        'move_out_of_bounds': {
+            '0': Transition('program_halt', 'a', LEFT),
+            '1': Transition('program_halt', 'b', LEFT),
+        },
+        'move_right_action_2': {
+            '0': Transition('restore_descriptions', 'a', None),
+            '1': Transition('restore_descriptions', 'b', None),
+            '#': Transition('restore_descriptions', 'a', None),  # past the known user tape, which is '0'
+        },
+    # look up the next state, whose index is in the register
+        'restore_descriptions': {
+            'a': until('restore_descriptions_2', '#', LEFT, overshoot=1),
+            'b': until('restore_descriptions_2', '#', LEFT, overshoot=1),
+        },
+        'restore_descriptions_2': {
+            # unmark every bit and make every state description a candidate, moving left to the register
+            'a': Transition('restore_descriptions_2', '0', LEFT),
+            'b': Transition('restore_descriptions_2', '1', LEFT),
+            '-': Transition('restore_descriptions_2', '+', LEFT),
+            '0': Transition('restore_descriptions_2', None, LEFT),
+            '1': Transition('restore_descriptions_2', None, LEFT),
+            '+': Transition('restore_descriptions_2', None, LEFT),
+            '@': Transition('restore_descriptions_2', None, LEFT),
+            '#': Transition('find_register_bit', None, LEFT),
+        },
+        'find_register_bit': {
+            # move left over the bits of the register that are not marked yet
+            '0': Transition('find_register_bit', None, LEFT),
+            '1': Transition('find_register_bit', None, LEFT),
+            'a': Transition('mark_register_bit', None, RIGHT),
+            'b': Transition('mark_register_bit', None, RIGHT),
+            '#': Transition('mark_register_bit', None, RIGHT),
+        },
+        'mark_register_bit': {
+            '0': Transition('mark_register_bit_0', 'a', RIGHT),
+            '1': Transition('mark_register_bit_1', 'b', RIGHT),
+            '#': Transition('find_user_tape', None, RIGHT),  # every bit is marked, so the next state is the only candidate left
+        },
+        'filter_done': {symbol: until('find_register_bit', '#', LEFT, overshoot=1) for symbol in description_symbols},
+    # when the simulated program halts, clean up everything left of the user tape
+        'program_halt': {
+            # enter this state at the '@' of the halt state, or at the '#' just left of the user tape
+            '@': until('program_halt', '#', RIGHT),
+            '#': Transition('clean_state_descriptions', None, LEFT),
+        },
+        'clean_state_descriptions': dict({symbol: Transition('clean_state_descriptions', '#', LEFT) for symbol in description_symbols},
+                                         **{'#': Transition('clean_register', None, LEFT)}),
+        'clean_register': dict({symbol: Transition('clean_register', '#', LEFT) for symbol in ('0', '1', 'a', 'b')},
+                               **{'#': Transition('find_tape_head', None, RIGHT)}),
+        'find_tape_head': {
+            '#': Transition('find_tape_head', None, RIGHT),
+            '0': Transition('find_tape_head', None, RIGHT),
+            '1': Transition('find_tape_head', None, RIGHT),
+            'a': Transition('0', '0', None),
+            'b': Transition('0', '1', None),
+        },
+        '0': {},
+    }
+
+    for s in ('0', '1'):
+        # copy the next state on s into the register, one bit at a time: find the first bit that is not copied yet
+        transitions[f'copy_next_state_{s}'] = {
+            '+': fixed(f'copy_next_state_bit_{s}', 5, RIGHT),
+        }
+        transitions[f'copy_next_state_bit_{s}'] = {
+            # at the first bit of the index of a triple, or past the state description
+            '0': Transition(f'copy_next_state_bit_{s}_2', None, RIGHT),
+            '1': Transition(f'copy_next_state_bit_{s}_2', None, RIGHT),
+            'a': Transition(f'copy_next_state_bit_{s}_2', None, RIGHT),
+            'b': Transition(f'copy_next_state_bit_{s}_2', None, RIGHT),
+            '-': until(f'take_action_{s}', '+', LEFT),
+            '#': until(f'take_action_{s}', '+', LEFT),
+        }
+        if s == '1':
+            transitions['copy_next_state_bit_1_2'] = {symbol: Transition('copy_next_state_bit_1_3', None, RIGHT) for symbol in ('0', '1', 'a', 'b')}
+        at_bit = f'copy_next_state_bit_{s}_2' if s == '0' else 'copy_next_state_bit_1_3'
+        transitions[at_bit] = {
+            'a': fixed(f'copy_next_state_bit_{s}', 2 if s == '0' else 1, RIGHT),
+            'b': fixed(f'copy_next_state_bit_{s}', 2 if s == '0' else 1, RIGHT),
+            '0': Transition(f'copy_to_register_{s}_0', 'a', None),
+            '1': Transition(f'copy_to_register_{s}_1', 'b', None),
+        }
+        for bit in ('0', '1'):
+            transitions[f'copy_to_register_{s}_{bit}'] = {
+                MARKED[bit]: until(f'copy_to_register_{s}_{bit}_2', '#', LEFT, overshoot=1),
+            }
+            transitions[f'copy_to_register_{s}_{bit}_2'] = {
+                # find the first marked bit of the register, moving left from its end
+                'a': Transition(f'copy_to_register_{s}_{bit}_2', None, LEFT),
+                'b': Transition(f'copy_to_register_{s}_{bit}_2', None, LEFT),
+                '0': Transition(f'copy_to_register_{s}_{bit}_3', None, RIGHT),
+                '1': Transition(f'copy_to_register_{s}_{bit}_3', None, RIGHT),
+                '#': Transition(f'copy_to_register_{s}_{bit}_3', None, RIGHT),
+            }
+            transitions[f'copy_to_register_{s}_{bit}_3'] = {
+                'a': Transition(f'copy_next_state_{s}_return', bit, RIGHT),
+                'b': Transition(f'copy_next_state_{s}_return', bit, RIGHT),
+            }
+        transitions[f'copy_next_state_{s}_return'] = {symbol: until(f'copy_next_state_{s}', '+', RIGHT) for symbol in ('0', '1', 'a', 'b', '#')}
+        # the action on s is the first 2 bits after the '+' for s = '0', and the next 2 for s = '1'
+        transitions[f'take_action_{s}'] = {
+            '+': Transition('take_action_bit_1', None, RIGHT) if s == '0' else fixed('take_action_bit_1', 3, RIGHT),
+        }
+
+    for action, mark in (('write_0', 'a'), ('write_1', 'b'), ('move_left', None), ('move_right', None)):
+        # enter this state on the first cell of the user tape, and find the head
+        transitions[f'{action}_action'] = {
+            '0': Transition(f'{action}_action', None, RIGHT),
+            '1': Transition(f'{action}_action', None, RIGHT),
+        }
+        for symbol in ('a', 'b'):
+            if mark is not None:
+                transition = Transition('restore_descriptions', mark, None)
+            else:
+                transition = Transition(f'{action}_action_2', UNMARKED[symbol], LEFT if action == 'move_left' else RIGHT)
+            transitions[f'{action}_action'][symbol] = transition
+
+    for v in ('0', '1'):
+        # filter the candidates by the register bit v
+        transitions[f'mark_register_bit_{v}'] = {symbol: until(f'filter_{v}', '#', RIGHT, overshoot=1) for symbol in ('0', '1', 'a', 'b', '#')}
+        transitions[f'filter_{v}'] = {
+            # at the start of a state description, or inside one that is not a candidate
+            '+': fixed(f'filter_{v}_bit', 5, RIGHT),
+            '-': Transition(f'filter_{v}', None, RIGHT),
+            '0': Transition(f'filter_{v}', None, RIGHT),
+            '1': Transition(f'filter_{v}', None, RIGHT),
+            'a': Transition(f'filter_{v}', None, RIGHT),
+            'b': Transition(f'filter_{v}', None, RIGHT),
+            '@': Transition(f'filter_{v}', None, RIGHT),
+            # past the last state description: look for the next bit of the register
+            '#': Transition('filter_done', None, LEFT),
+        }
+        other = '1' if v == '0' else '0'
+        transitions[f'filter_{v}_bit'] = {
+            # at the first bit of the index of a triple
+            'a': fixed(f'filter_{v}_bit', 3, RIGHT),
+            'b': fixed(f'filter_{v}_bit', 3, RIGHT),
+            v: Transition(f'filter_{v}', MARKED[v], RIGHT),
+            other: Transition(f'filter_{v}_remove', MARKED[other], LEFT),
+        }
+        transitions[f'filter_{v}_remove'] = {
+            '0': Transition(f'filter_{v}_remove', None, LEFT),
+            '1': Transition(f'filter_{v}_remove', None, LEFT),
+            'a': Transition(f'filter_{v}_remove', None, LEFT),
+            'b': Transition(f'filter_{v}_remove', None, LEFT),
+            '@': Transition(f'filter_{v}_remove', None, LEFT),
+            '+': Transition(f'filter_{v}', '-', RIGHT),
+        }
+    return transitions
+
+def get_indexed_utm(four_symbol_mode=False, native=False, minimize=True):
+    # the indexed UTM (see get_utm)
+    transitions = indexed_utm_transitions()
+    from profiler import origin_names
+    origins = origin_names(transitions)
+    if four_symbol_mode:
+        if not native:
+            transitions = compile_super_transitions(TM(transitions=transitions, start_state='start', empty_symbol='#')).transitions
+        utm = TM(transitions=transitions, start_state='start', empty_symbol='#')
+        utm.origins = origins
+        return utm
+
+    utm = compile_super_transitions(TM(transitions=transitions, start_state='start', empty_symbol='#'))
+    utm = n_to_2_symbols(remove_null_transitions(utm), INDEXED_SYMBOL_CODE)
+    if minimize:
+        utm = minimize_states(remove_unreachable_states(utm))
+    utm.origins = origins
+    return utm
+
 
 if __name__ == "__main__":
     """
@@ -393,6 +799,6 @@ if __name__ == "__main__":
     tm = get_utm(debug=False)
     tm.set_tape(initial_tape)
     tm.draw(max_tape_length=50)
-    tm.run()
+    tm.run(verbose=True)
     tm.draw(max_tape_length=50)
     print(''.join(tm.tape[tm.head_idx:]))
\ No newline at end of file
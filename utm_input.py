@@ -21,4 +21,5 @@ if __name__ == "__main__":
 
     tm = load_from_xml(machine_file)
     tm.set_tape(initial_tape)
-    print(''.join(construct_utm_input(tm)))
\ No newline at end of file
+    write_utm_input(tm, sys.stdout)
+    print()
\ No newline at end of file